@@ -0,0 +1,109 @@
+"""
+inference_pool.py
+-----------------
+Shared executor for CPU-bound recognition work (detection, anti-spoofing,
+embedding) called from async HTTP and WebSocket handlers.
+
+Every route hands its engine call to ``InferencePool.run()`` instead of
+calling the engine inside ``async def``.  The event loop therefore stays free
+for other sockets and health checks while MTCNN / DeepFace run.
+
+The number of calls admitted at once (running + queued) is bounded.  When the
+pool is saturated, ``run()`` raises :class:`InferenceBusy` immediately and
+the route answers 503 instead of letting requests pile up behind a slow
+model.
+
+Environment variables:
+    INFERENCE_WORKERS     Worker threads                       (default: 2)
+    INFERENCE_MAX_QUEUE   Max calls waiting for a free worker  (default: 4 × workers)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures as _cf
+import os
+from typing import Any, Callable, TypeVar
+
+from loguru import logger
+
+T = TypeVar("T")
+
+
+class InferenceBusy(RuntimeError):
+    """Raised when the inference pool is saturated (caller should return 503)."""
+
+
+class InferencePool:
+    """
+    Bounded thread pool for engine calls.
+
+    A thread pool (not a process pool) is used on purpose: the FAISS index,
+    session galleries and loaded models all live in this process, and
+    TensorFlow / OpenCV / NumPy release the GIL inside their kernels, so
+    threads do run in parallel.
+
+    Args:
+        workers:    Number of worker threads.
+        max_queue:  Calls allowed to wait for a worker before shedding load.
+    """
+
+    def __init__(self, workers: int = 2, max_queue: int = 8):
+        self.workers = max(1, workers)
+        self.max_queue = max(0, max_queue)
+        self._executor = _cf.ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="inference",
+        )
+        self._in_flight = 0
+        self.rejected = 0
+
+    @classmethod
+    def from_env(cls) -> "InferencePool":
+        workers = int(os.getenv("INFERENCE_WORKERS", "2"))
+        max_queue = int(os.getenv("INFERENCE_MAX_QUEUE", str(4 * max(1, workers))))
+        pool = cls(workers=workers, max_queue=max_queue)
+        logger.info(f"InferencePool: workers={pool.workers}, max_queue={pool.max_queue}")
+        return pool
+
+    @property
+    def capacity(self) -> int:
+        """Maximum calls admitted at once (running + queued)."""
+        return self.workers + self.max_queue
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def executor(self) -> _cf.ThreadPoolExecutor:
+        return self._executor
+
+    async def run(self, fn: Callable[..., T], *args: Any) -> T:
+        """
+        Run ``fn(*args)`` on a worker thread.
+
+        Raises:
+            InferenceBusy: if ``capacity`` calls are already admitted.
+        """
+        if self._in_flight >= self.capacity:
+            self.rejected += 1
+            raise InferenceBusy(
+                f"Inference pool saturated ({self._in_flight}/{self.capacity} in flight)"
+            )
+        self._in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, fn, *args)
+        finally:
+            self._in_flight -= 1
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "in_flight": self._in_flight,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False)
@@ -6,28 +6,49 @@ FastAPI route definitions for the Face Recognition Attendance API.
 Endpoints
 ---------
   POST /register          — Upload images, generate embedding, store user
+  POST /enroll/bulk       — Enroll a folder tree / archive of students (NDJSON progress)
   POST /recognize         — Upload a camera frame, run full pipeline
   POST /attendance        — Manually record attendance (internal use)
+  POST /attendance/batch  — Bulk attendance ingest (offline sync)
   GET  /users             — List all registered users
   GET  /users/{user_id}   — Single user detail
   DELETE /users/{user_id} — Remove a user
-  GET  /attendance        — Query attendance records (with optional filters)
+  GET  /attendance        — Query attendance records (filters, keyset cursor)
+  GET  /attendance/export — Stream every matching record as CSV or NDJSON
+  GET  /attendance/summary — Per-day / per-student rollups (pre-aggregated)
   GET  /health            — Liveness probe
 """
 
 from __future__ import annotations
 
+import asyncio
+import base64
+import csv
 import io
+import json
+import os
+import re
+import shutil
+import tempfile
 import uuid
+from dataclasses import asdict
+from pathlib import Path
 from typing import List, Optional
 
 import cv2
 import numpy as np
-from fastapi import APIRouter, Depends, File, Form, HTTPException, Query, Request, UploadFile
-from fastapi.responses import JSONResponse
+from fastapi import (
+    APIRouter, Depends, File, Form, HTTPException, Query, Request, Response, UploadFile,
+)
+from fastapi.responses import JSONResponse, StreamingResponse
 from loguru import logger
 from pydantic import BaseModel, Field
 
+from api.inference_pool import InferenceBusy, InferencePool
+from database.db_manager import UnknownUserError
+from recognition import bulk_enrollment
+from utils.similarity import SessionGallery, SessionStore
+
 # ---------------------------------------------------------------------------
 # Pydantic schemas
 # ---------------------------------------------------------------------------
@@ -74,11 +95,43 @@ class LogAttendanceRequest(BaseModel):
     timestamp: Optional[str] = None
 
 
+class LogAttendanceBatchRequest(BaseModel):
+    records: List[LogAttendanceRequest] = Field(min_length=1, max_length=5000)
+
+
+# Attendance export: column order, and CSV rows buffered per yielded chunk
+_EXPORT_COLUMNS = ("id", "user_id", "name", "timestamp", "status", "confidence")
+_EXPORT_CHUNK_ROWS = 500
+
+
+def _encode_cursor(timestamp: str, record_id: int) -> str:
+    """Opaque keyset cursor for ``GET /attendance`` pagination."""
+    raw = json.dumps([timestamp, record_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def _decode_cursor(cursor: str) -> tuple:
+    try:
+        timestamp, record_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return str(timestamp), int(record_id)
+    except (ValueError, TypeError, UnicodeError):
+        raise HTTPException(status_code=422, detail="Invalid cursor.")
+
+
+# Most registration images in flight on the inference pool at once (one
+# progress event per chunk); capped by the pool's worker count.
+_REGISTER_DETECT_CHUNK = 8
+
+
 # ---------------------------------------------------------------------------
 # Router factory
 # ---------------------------------------------------------------------------
 
-def create_router(engine_ref: dict, db_ref: dict) -> APIRouter:
+def create_router(
+    engine_ref: dict,
+    db_ref: dict,
+    pool: Optional[InferencePool] = None,
+) -> APIRouter:
     """
     Create the APIRouter with injected references to the shared
     recognition engine and DB manager.
@@ -86,8 +139,10 @@ def create_router(engine_ref: dict, db_ref: dict) -> APIRouter:
     Args:
         engine_ref: {"engine": RecognitionEngine instance}
         db_ref:     {"db": DBManager instance}
+        pool:       Shared InferencePool for engine calls (created from env if omitted)
     """
     router = APIRouter()
+    pool = pool or InferencePool.from_env()
 
     def get_engine():
         return engine_ref["engine"]
@@ -99,10 +154,83 @@ def create_router(engine_ref: dict, db_ref: dict) -> APIRouter:
 
     @router.get("/health", tags=["System"])
     async def health():
-        return {"status": "ok", "service": "face-recognition-api"}
+        engine = engine_ref.get("engine")
+        return {
+            "status": "ok",
+            "service": "face-recognition-api",
+            "inference": pool.stats(),
+            "index": engine.index_stats() if engine is not None else None,
+            "detection": engine.detection_stats() if engine is not None else None,
+        }
 
     # ── Registration ──────────────────────────────────────────────────────
 
+    async def _registration_events(engine, db, name, resolved_id, bgr_frames, total):
+        """
+        Registration pipeline as a stream of progress events.
+
+        Takes the already-decoded frames (the uploads may be closed once the
+        endpoint returns a StreamingResponse).  Detection runs one image per
+        inference-pool call, a chunk at a time, so it counts against the
+        pool's cap like any other request → one batched embedding pass → DB
+        → live index.  Every event is a dict with a ``stage`` key; failures
+        are raised as HTTPException.
+        """
+        yield {"stage": "decoded", "images": len(bgr_frames), "total": total}
+        if not bgr_frames:
+            raise HTTPException(
+                status_code=422, detail="Could not decode any uploaded images."
+            )
+
+        chunk_size = max(1, min(_REGISTER_DETECT_CHUNK, pool.workers))
+        crops: List[Optional[np.ndarray]] = []
+        for start in range(0, len(bgr_frames), chunk_size):
+            chunk = bgr_frames[start:start + chunk_size]
+            crops.extend(await asyncio.gather(
+                *(_run_inference(pool, engine.registration_crop, img) for img in chunk)
+            ))
+            yield {
+                "stage": "detected",
+                "processed": len(crops),
+                "total": len(bgr_frames),
+                "faces": sum(c is not None for c in crops),
+            }
+
+        # Averaged embedding plus diverse per-user templates, one forward pass
+        embedding, templates, num_valid = await _run_inference(
+            pool, engine.registration_templates_from_crops, crops, 5,
+        )
+        yield {"stage": "embedded", "faces": num_valid}
+        if embedding is None:
+            raise HTTPException(
+                status_code=422,
+                detail=(
+                    f"Only {num_valid} valid face(s) detected from {len(bgr_frames)} images. "
+                    "Upload at least 10 clear face images (minimum 5 valid faces required)."
+                ),
+            )
+
+        # Persist to DB
+        try:
+            await db.upsert_user(resolved_id, name, embedding, templates)
+        except Exception as exc:
+            logger.exception("DB write failed during registration")
+            raise HTTPException(status_code=500, detail=f"Database error: {exc}")
+
+        # Update live FAISS index
+        engine.add_to_index(resolved_id, name, embedding, templates)
+
+        yield {
+            "stage": "done",
+            **RegisterResponse(
+                success=True,
+                user_id=resolved_id,
+                name=name,
+                message="User registered successfully.",
+                num_images_used=num_valid,
+            ).model_dump(),
+        }
+
     @router.post("/register", response_model=RegisterResponse, tags=["Registration"])
     async def register_user(
         name: str = Form(..., description="Full name of the person to register"),
@@ -113,6 +241,10 @@ def create_router(engine_ref: dict, db_ref: dict) -> APIRouter:
         images: List[UploadFile] = File(
             ..., description="10–20 face images (JPEG / PNG)"
         ),
+        stream: bool = Form(
+            default=False,
+            description="Stream NDJSON progress events instead of a single response.",
+        ),
         engine=Depends(get_engine),
         db=Depends(get_db),
     ):
@@ -123,6 +255,12 @@ def create_router(engine_ref: dict, db_ref: dict) -> APIRouter:
           - name (string)
           - user_id (optional string)
           - images[] (list of image files)
+          - stream (optional bool)
+
+        With ``stream=true`` the response is ``application/x-ndjson``: one
+        line per stage (decoded, detected per chunk, embedded) and a final
+        ``{"stage": "done", ...RegisterResponse}`` or
+        ``{"stage": "error", "status_code", "detail"}`` line.
         """
         if not images:
             raise HTTPException(status_code=422, detail="No images provided.")
@@ -130,43 +268,94 @@ def create_router(engine_ref: dict, db_ref: dict) -> APIRouter:
             raise HTTPException(status_code=422, detail="Too many images. Maximum 40.")
 
         resolved_id = user_id or str(uuid.uuid4())
-
-        # Decode all uploaded images to BGR numpy arrays
+        # Read every upload before a StreamingResponse outlives the request
         bgr_frames = await _decode_uploads(images)
-        if not bgr_frames:
-            raise HTTPException(
-                status_code=422, detail="Could not decode any uploaded images."
-            )
-
-        # Compute averaged embedding
-        embedding, num_valid = engine.get_registration_embedding(bgr_frames, min_images=5)
-
-        if embedding is None:
-            raise HTTPException(
-                status_code=422,
-                detail=(
-                    f"Only {num_valid} valid face(s) detected from {len(bgr_frames)} images. "
-                    "Upload at least 10 clear face images (minimum 5 valid faces required)."
-                ),
-            )
+        events = _registration_events(engine, db, name, resolved_id, bgr_frames, len(images))
+
+        if not stream:
+            async for event in events:
+                if event["stage"] == "done":
+                    event.pop("stage")
+                    return RegisterResponse(**event)
+
+        async def ndjson():
+            try:
+                async for event in events:
+                    yield json.dumps(event) + "\n"
+            except HTTPException as exc:
+                yield json.dumps({
+                    "stage": "error", "status_code": exc.status_code, "detail": exc.detail,
+                }) + "\n"
+
+        return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+    @router.post("/enroll/bulk", tags=["Registration"])
+    async def bulk_enroll(
+        archive: Optional[UploadFile] = File(
+            default=None, description=".zip / .tar[.gz] of student_id/*.jpg folders",
+        ),
+        path: Optional[str] = Form(
+            default=None, description="Server-side folder, relative to BULK_ENROLL_ROOT",
+        ),
+        checkpoint: Optional[str] = Form(
+            default=None, description="Checkpoint name; re-use it to resume a job",
+        ),
+        workers: int = Form(default=2, ge=1, le=16),
+        batch_size: int = Form(default=64, ge=1, le=1000),
+        min_images: int = Form(default=1, ge=1),
+        engine=Depends(get_engine),
+        db=Depends(get_db),
+    ):
+        """
+        Enroll many students at once.  Streams NDJSON progress events
+        (one per committed DB batch) and a final ``"done"`` report with
+        identities/sec and per-id failures.
+        """
+        if (archive is None) == (path is None):
+            raise HTTPException(status_code=422, detail="Provide exactly one of 'archive' or 'path'.")
+
+        if path is not None:
+            root = os.getenv("BULK_ENROLL_ROOT")
+            if not root:
+                raise HTTPException(
+                    status_code=403, detail="Server-side paths are disabled (BULK_ENROLL_ROOT unset).",
+                )
+            source_dir = (Path(root) / path).resolve()
+            if not source_dir.is_relative_to(Path(root).resolve()) or not source_dir.is_dir():
+                raise HTTPException(status_code=422, detail=f"Not a folder under BULK_ENROLL_ROOT: {path}")
+            source_name = source_dir.name
+            items = bulk_enrollment.iter_directory(source_dir)
+            spool = None
+        else:
+            # Copy the upload: the request's file is closed before streaming ends
+            spool = tempfile.TemporaryFile()
+            await asyncio.to_thread(shutil.copyfileobj, archive.file, spool)
+            source_name = Path(archive.filename or "upload").name
+            items = bulk_enrollment.iter_archive(spool, source_name)
+
+        ckpt_name = re.sub(r"[^A-Za-z0-9_.-]", "_", checkpoint or source_name)
+        ckpt_dir = Path(os.getenv("BULK_ENROLL_CHECKPOINT_DIR", "database/enroll_checkpoints"))
+        job = bulk_enrollment.BulkEnrollment(
+            engine, db,
+            pool=pool,
+            workers=workers,
+            batch_size=batch_size,
+            min_images=min_images,
+            checkpoint=ckpt_dir / f"{ckpt_name}.json",
+        )
 
-        # Persist to DB
-        try:
-            await db.upsert_user(resolved_id, name, embedding)
-        except Exception as exc:
-            logger.exception("DB write failed during registration")
-            raise HTTPException(status_code=500, detail=f"Database error: {exc}")
+        async def ndjson():
+            try:
+                async for event in job.run(items):
+                    yield json.dumps(event) + "\n"
+            except Exception as exc:
+                logger.exception("Bulk enrollment failed")
+                yield json.dumps({"stage": "error", "detail": str(exc)}) + "\n"
+            finally:
+                if spool is not None:
+                    spool.close()
 
-        # Update live FAISS index
-        engine.add_to_index(resolved_id, name, embedding)
-
-        return RegisterResponse(
-            success=True,
-            user_id=resolved_id,
-            name=name,
-            message="User registered successfully.",
-            num_images_used=num_valid,
-        )
+        return StreamingResponse(ndjson(), media_type="application/x-ndjson")
 
     # ── Recognition ───────────────────────────────────────────────────────
 
@@ -184,7 +373,7 @@ def create_router(engine_ref: dict, db_ref: dict) -> APIRouter:
         if frame is None:
             raise HTTPException(status_code=422, detail="Could not decode image.")
 
-        result = engine.recognize_single(frame)
+        result = await _run_inference(pool, engine.recognize_single, frame)
 
         if result is None:
             return RecognizeResponse(
@@ -222,35 +411,134 @@ def create_router(engine_ref: dict, db_ref: dict) -> APIRouter:
         Manually log an attendance record (called by the frontend after
         a successful /recognize response).
         """
-        user = await db.get_user(body.user_id)
-        if user is None:
+        try:
+            record = await db.log_attendance(
+                user_id=body.user_id,
+                confidence=body.confidence,
+                status=body.status,
+                timestamp=body.timestamp,
+            )
+        except UnknownUserError:
             raise HTTPException(status_code=404, detail="User not found.")
-
-        record = await db.log_attendance(
-            user_id=body.user_id,
-            confidence=body.confidence,
-            status=body.status,
-            timestamp=body.timestamp,
-        )
         return {"success": True, "record": record}
 
+    @router.post("/attendance/batch", tags=["Attendance"])
+    async def log_attendance_batch(
+        body: LogAttendanceBatchRequest,
+        db=Depends(get_db),
+    ):
+        """
+        Ingest many attendance records at once (the frontend's offline sync
+        uploads its queued records here).  Records are committed together;
+        records for unknown users are reported in ``rejected`` and skipped.
+        """
+        stored = await db.log_attendance_many([r.model_dump() for r in body.records])
+        records = [rec for rec in stored if rec is not None]
+        rejected = [
+            {"index": i, "user_id": body.records[i].user_id, "detail": "User not found."}
+            for i, rec in enumerate(stored) if rec is None
+        ]
+        return {
+            "success": not rejected,
+            "inserted": len(records),
+            "records": records,
+            "rejected": rejected,
+        }
+
     @router.get("/attendance", response_model=List[AttendanceRecord], tags=["Attendance"])
     async def get_attendance(
+        response: Response,
         user_id: Optional[str] = Query(default=None),
         date_from: Optional[str] = Query(default=None, description="YYYY-MM-DD"),
         date_to:   Optional[str] = Query(default=None, description="YYYY-MM-DD"),
         limit:     int           = Query(default=200, ge=1, le=1000),
+        cursor:    Optional[str] = Query(default=None, description="X-Next-Cursor of the previous page"),
         db=Depends(get_db),
     ):
-        """Query attendance records. All filters are optional."""
+        """
+        Query attendance records, newest first. All filters are optional.
+
+        When more rows may follow, the ``X-Next-Cursor`` response header
+        holds the cursor for the next page.  Records still in the write
+        buffer (up to ``ATTENDANCE_FLUSH_MS`` old) are not listed yet.
+        """
         records = await db.get_attendance(
             user_id=user_id,
             date_from=date_from,
             date_to=date_to,
             limit=limit,
+            cursor=_decode_cursor(cursor) if cursor else None,
         )
+        if len(records) == limit:
+            last = records[-1]
+            response.headers["X-Next-Cursor"] = _encode_cursor(last["timestamp"], last["id"])
         return records
 
+    @router.get("/attendance/summary", tags=["Attendance"])
+    async def attendance_summary(
+        by:        str           = Query(default="day", pattern="^(day|user)$"),
+        user_id:   Optional[str] = Query(default=None),
+        date_from: Optional[str] = Query(default=None, description="YYYY-MM-DD"),
+        date_to:   Optional[str] = Query(default=None, description="YYYY-MM-DD"),
+        db=Depends(get_db),
+    ):
+        """
+        Attendance rollups for dashboards, read from the summary tables.
+
+        ``by=day`` returns one row per day (all students, or *user_id* only);
+        ``by=user`` returns one row per student over the date range.  Each
+        row carries record / status counts, first and last seen times and
+        the average recognition confidence.
+        """
+        rows = await db.get_attendance_summary(
+            date_from=date_from, date_to=date_to, user_id=user_id, by=by,
+        )
+        return {"by": by, "rows": rows}
+
+    @router.get("/attendance/export", tags=["Attendance"])
+    async def export_attendance(
+        format:    str           = Query(default="csv", pattern="^(csv|ndjson)$"),
+        user_id:   Optional[str] = Query(default=None),
+        date_from: Optional[str] = Query(default=None, description="YYYY-MM-DD"),
+        date_to:   Optional[str] = Query(default=None, description="YYYY-MM-DD"),
+        db=Depends(get_db),
+    ):
+        """
+        Stream every matching attendance record, oldest first, as CSV or
+        NDJSON.  Rows come from a server-side cursor, so a semester export
+        uses constant memory.
+        """
+        rows = db.iter_attendance(user_id=user_id, date_from=date_from, date_to=date_to)
+
+        async def csv_lines():
+            buf = io.StringIO()
+            writer = csv.writer(buf)
+            writer.writerow(_EXPORT_COLUMNS)
+            n = 0
+            async for rec in rows:
+                writer.writerow([rec[c] for c in _EXPORT_COLUMNS])
+                n += 1
+                if n % _EXPORT_CHUNK_ROWS == 0:
+                    yield buf.getvalue()
+                    buf.seek(0)
+                    buf.truncate()
+            yield buf.getvalue()
+
+        async def ndjson_lines():
+            async for rec in rows:
+                yield json.dumps(rec) + "\n"
+
+        filename = f"attendance.{format}"
+        if format == "csv":
+            body, media_type = csv_lines(), "text/csv"
+        else:
+            body, media_type = ndjson_lines(), "application/x-ndjson"
+        return StreamingResponse(
+            body,
+            media_type=media_type,
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+        )
+
     # ── Users ─────────────────────────────────────────────────────────────
 
     @router.get("/users", response_model=List[UserSummary], tags=["Users"])
@@ -279,6 +567,23 @@ def create_router(engine_ref: dict, db_ref: dict) -> APIRouter:
     return router
 
 
+# ---------------------------------------------------------------------------
+# Inference helper
+# ---------------------------------------------------------------------------
+
+async def _run_inference(pool: InferencePool, fn, *args):
+    """Run an engine call on the inference pool; 503 when it is saturated."""
+    try:
+        return await pool.run(fn, *args)
+    except InferenceBusy as exc:
+        logger.warning(str(exc))
+        raise HTTPException(
+            status_code=503,
+            detail="Recognition server busy, retry shortly",
+            headers={"Retry-After": "1"},
+        )
+
+
 # ---------------------------------------------------------------------------
 # Upload decoding helpers
 # ---------------------------------------------------------------------------
@@ -295,13 +600,35 @@ async def _decode_single_upload(upload: UploadFile) -> Optional[np.ndarray]:
         return None
 
 
+def _imdecode(content: bytes) -> Optional[np.ndarray]:
+    return cv2.imdecode(np.frombuffer(content, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
 async def _decode_uploads(uploads: List[UploadFile]) -> List[np.ndarray]:
-    """Decode a list of uploaded files; silently skip invalid ones."""
-    results = []
+    """
+    Decode a list of uploaded files; silently skip invalid ones.
+
+    JPEG decoding runs on worker threads (cv2 releases the GIL), all images
+    at once, so a 40-image registration does not decode serially on the
+    event loop.
+    """
+    contents = []
     for upload in uploads:
-        img = await _decode_single_upload(upload)
-        if img is not None:
-            results.append(img)
+        try:
+            contents.append((upload.filename, await upload.read()))
+        except Exception as exc:
+            logger.warning(f"Failed to read upload '{upload.filename}': {exc}")
+
+    decoded = await asyncio.gather(
+        *(asyncio.to_thread(_imdecode, content) for _, content in contents),
+        return_exceptions=True,
+    )
+    results = []
+    for (filename, _), img in zip(contents, decoded):
+        if isinstance(img, Exception) or img is None:
+            logger.warning(f"Failed to decode upload '{filename}'")
+            continue
+        results.append(img)
     return results
 
 
@@ -309,7 +636,11 @@ async def _decode_uploads(uploads: List[UploadFile]) -> List[np.ndarray]:
 # Legacy-Compatible Router
 # ---------------------------------------------------------------------------
 
-def create_legacy_router(engine_ref: dict, session_store: dict) -> APIRouter:
+def create_legacy_router(
+    engine_ref: dict,
+    session_store: SessionStore,
+    pool: Optional[InferencePool] = None,
+) -> APIRouter:
     """
     Drop-in endpoint set matching the original facenet-server.py API surface.
     Mounted at root level (no /api/v1 prefix) so existing frontend code works
@@ -321,6 +652,7 @@ def create_legacy_router(engine_ref: dict, session_store: dict) -> APIRouter:
     import base64
 
     router = APIRouter(tags=["Legacy"])
+    pool = pool or InferencePool.from_env()
 
     def get_engine():
         return engine_ref["engine"]
@@ -371,7 +703,7 @@ def create_legacy_router(engine_ref: dict, session_store: dict) -> APIRouter:
         if img is None:
             raise HTTPException(status_code=422, detail="Could not decode image")
 
-        return engine.extract_single(img)
+        return await _run_inference(pool, engine.extract_single, img)
 
     # ── Extract Multiple Face Embeddings ─────────────────────────────────
 
@@ -390,7 +722,7 @@ def create_legacy_router(engine_ref: dict, session_store: dict) -> APIRouter:
         if img is None:
             raise HTTPException(status_code=422, detail="Could not decode image")
 
-        return engine.extract_multiple(img)
+        return await _run_inference(pool, engine.extract_multiple, img)
 
     # ── Verify Face vs Stored Embedding ──────────────────────────────────
 
@@ -412,7 +744,7 @@ def create_legacy_router(engine_ref: dict, session_store: dict) -> APIRouter:
             raise HTTPException(status_code=422, detail="image and stored_embedding required")
 
         stored_emb = np.array(stored, dtype=np.float32)
-        return engine.verify_face(img, stored_emb)
+        return await _run_inference(pool, engine.verify_face, img, stored_emb)
 
     # ── Compare Two Embeddings ────────────────────────────────────────────
 
@@ -437,35 +769,64 @@ def create_legacy_router(engine_ref: dict, session_store: dict) -> APIRouter:
     async def load_session(request: Request):
         """
         Input:  {"sectionId": str,
-                 "students": [{"id", "name", "student_number", "embedding": []}]}
-        Output: {success, students_loaded}
+                 "students": [{"id", "name", "student_number", "embedding": [],
+                               "templates": [[]] (optional)}],
+                 "detection": {"scale": 0.5, "roi": [x1, y1, x2, y2]} (optional,
+                              ROI as frame fractions, e.g. [0.33, 0, 0.67, 1])}
+        Output: {success, students_loaded, detection}
         """
         body = await request.json()
         section_id = body.get("sectionId", "default")
         students = body.get("students", [])
 
+        engine = get_engine()
+        detection = None
+        if engine is not None:
+            try:
+                detection = engine.set_session_detection(body.get("detection"))
+            except (AttributeError, TypeError, ValueError) as exc:
+                raise HTTPException(status_code=422, detail=f"Invalid detection settings: {exc}")
+
         # Kiosk runs one active class session at a time.
         # If we keep multiple sections loaded, recognition can match against
         # students from other sections and incorrectly mark attendance.
-        session_store.clear()
-        session_store[section_id] = {}
+        section: dict = {}
         for s in students:
             sid = s.get("id") or s.get("studentId")
             emb = s.get("embedding")
-            if sid and emb:
-                session_store[section_id][sid] = {
+            templates = s.get("templates")
+            if sid and (emb or templates):
+                section[sid] = {
                     "name": s.get("name", ""),
                     "student_number": s.get("student_number"),
-                    "embedding": np.array(emb, dtype=np.float32),
+                    "embedding": np.array(emb or templates[0], dtype=np.float32),
+                    "templates": (
+                        np.array(templates, dtype=np.float32) if templates else None
+                    ),
                 }
 
-        loaded = len(session_store[section_id])
+        # Compile once into a normalised matrix so per-frame matching is a
+        # single matrix product.
+        gallery = SessionGallery.from_students(section)
+        session_store.clear()
+        session_store[section_id] = gallery
+        session_store.version += 1
+
+        loaded = len(gallery)
         logger.info(f"Session loaded: sectionId={section_id!r}, students={loaded}")
-        return {"success": True, "students_loaded": loaded}
+        return {
+            "success": True,
+            "students_loaded": loaded,
+            "detection": asdict(detection) if detection is not None else None,
+        }
 
     @router.post("/clear-session")
     async def clear_session():
         session_store.clear()
+        session_store.version += 1
+        engine = get_engine()
+        if engine is not None:
+            engine.set_session_detection(None)
         logger.info("Session store cleared.")
         return {"success": True}
 
@@ -486,6 +847,8 @@ def create_legacy_router(engine_ref: dict, session_store: dict) -> APIRouter:
         if img is None:
             raise HTTPException(status_code=422, detail="Could not decode image")
 
-        return engine.recognize_frame_with_session(img, session_store)
+        return await _run_inference(
+            pool, engine.recognize_frame_with_session, img, session_store,
+        )
 
     return router
@@ -11,6 +11,15 @@ Or with uvicorn directly:
 
 Environment variables (set in .env or shell):
     DB_PATH             Path to SQLite database  (default: database/embeddings.db)
+    DB_READERS          Read-only SQLite connections (default: 4; writes use one connection)
+    DB_MMAP_MB          PRAGMA mmap_size per connection, MiB (default: 256)
+    DB_CACHE_MB         PRAGMA cache_size per connection, MiB (default: 32)
+    INDEX_SNAPSHOT_DIR  On-disk index snapshot dir, "" to disable (default: <DB_PATH stem>_index)
+    INDEX_TYPE          "auto", "flat", "ivf", "hnsw" or "ivfpq"  (default: auto)
+    INDEX_ANN_MIN_SIZE  Gallery size at which "auto" switches to IVF (default: 5000)
+    INDEX_NPROBE        IVF lists probed per query (default: 16)
+    MAX_TEMPLATES       Diverse templates stored per registered user (default: 5)
+    TEMPLATE_AGG        Per-identity template score: "max" or "soft" (default: max)
     ARCFACE_MODE        "facenet", "insightface" or "pytorch"  (default: facenet)
     ARCFACE_MODEL_PATH  Path to custom .pth weights (pytorch mode only)
     ARCFACE_BACKBONE    "r50" or "r100"             (pytorch mode only, default: r100)
@@ -20,6 +29,23 @@ Environment variables (set in .env or shell):
     SIM_THRESHOLD       Cosine similarity threshold (default: 0.6)
     REAL_THRESHOLD      Anti-spoof real confidence  (default: 0.82)
     ALLOWED_ORIGINS     Comma-separated CORS origins (default: *)
+    BATCH_EMBEDDING     Embed all faces of a frame in one forward pass (default: true)
+    BATCH_WINDOW_MS     Cross-client embedding batch window, ms (default: 15)
+    BATCH_MAX_CROPS     Flush a cross-client batch at this many crops (default: 32)
+    INFERENCE_WORKERS   Threads for detection / recognition calls (default: 2)
+    INFERENCE_MAX_QUEUE Calls allowed to wait before answering 503 (default: 4 × workers)
+    BULK_ENROLL_ROOT    Folder that /api/v1/enroll/bulk "path" jobs may read (unset: uploads only)
+    BULK_ENROLL_CHECKPOINT_DIR  Bulk enrollment checkpoints (default: database/enroll_checkpoints)
+    ATTENDANCE_FLUSH_MS Longest an attendance write stays buffered, ms (default: 200)
+    ATTENDANCE_FLUSH_MAX  Commit buffered attendance at this many records (default: 256)
+    ATTENDANCE_TIMEZONE IANA zone whose midnight starts an attendance day (default: UTC)
+    DETECT_CASCADE      Haar pre-detector before DeepFace: "off", "gate" or "roi" (default: gate)
+    DETECT_SCALE        Detector input scale for session frames, 0.25–1 (default: 1.0)
+    DETECT_ROI          Kiosk region "x1,y1,x2,y2" as frame fractions (default: whole frame)
+    SCENE_GATE          Skip camera-stream recognition while the scene is static (default: true)
+    SCENE_CHANGE_AREA   Fraction of the frame that must change to re-run recognition (default: 0.002)
+    TRACK_REEMBED_EVERY Re-verify a tracked face's identity every N frames (default: 10)
+    TRACK_LIVENESS_EVERY  Re-run anti-spoofing on a tracked face every N frames (default: 5)
 
 The server:
   1. Initialises DB (creates tables if needed)
@@ -49,7 +75,13 @@ if str(_ROOT) not in sys.path:
 from database.db_manager import DBManager
 from recognition.recognition_engine import RecognitionEngine
 from recognition.camera_manager import CameraManager
+from recognition.face_tracker import FaceTracker
+from recognition.inference_scheduler import InferenceScheduler
+from recognition.scene_gate import SceneGate, scene_signature
+from api.inference_pool import InferenceBusy, InferencePool
 from api.routes import create_router, create_legacy_router
+from api import ws_protocol
+from utils.similarity import SessionStore
 
 # ---------------------------------------------------------------------------
 # Load .env (if present)
@@ -64,7 +96,9 @@ load_dotenv(dotenv_path=_ROOT / ".env")
 
 _engine_ref:    dict = {"engine": None}
 _db_ref:        dict = {"db":     None}
-_session_store: dict = {}          # sectionId → {studentId → {name, student_number, embedding}}
+_scheduler_ref: dict = {"scheduler": None}   # cross-client embedding batcher
+_inference_pool: InferencePool = InferencePool.from_env()
+_session_store = SessionStore()    # sectionId → SessionGallery (compiled by /load-session)
 _camera:        CameraManager = CameraManager()
 
 
@@ -94,7 +128,15 @@ async def lifespan(app: FastAPI):
     logger.info(f"  ANTI_SPOOFING:       {anti_spoof}")
 
     # Initialise DB
-    db = await DBManager.create(db_path)
+    db = await DBManager.create(
+        db_path,
+        attendance_flush_ms=float(os.getenv("ATTENDANCE_FLUSH_MS", "200")),
+        attendance_flush_max=int(os.getenv("ATTENDANCE_FLUSH_MAX", "256")),
+        attendance_timezone=os.getenv("ATTENDANCE_TIMEZONE", "UTC"),
+        readers=int(os.getenv("DB_READERS", "4")),
+        mmap_mb=int(os.getenv("DB_MMAP_MB", "256")),
+        cache_mb=int(os.getenv("DB_CACHE_MB", "32")),
+    )
     _db_ref["db"] = db
 
     # Initialise recognition engine (DeepFace)
@@ -107,15 +149,29 @@ async def lifespan(app: FastAPI):
     )
     _engine_ref["engine"] = engine
 
-    # Load all embeddings from DB into the in-memory FAISS index
-    n = await engine.load_embeddings_from_db()
+    # Load the index snapshot and replay DB changes since it was written
+    snapshot_dir = os.getenv(
+        "INDEX_SNAPSHOT_DIR", str(Path(db_path).with_name(Path(db_path).stem + "_index"))
+    )
+    n = await engine.load_embeddings_from_db(snapshot_dir or None)
     logger.info(f"FAISS index populated with {n} user(s).")
+
+    # Micro-batch embedding calls across concurrent WebSocket clients
+    scheduler = InferenceScheduler(
+        engine.get_embeddings_batch,
+        window_ms=float(os.getenv("BATCH_WINDOW_MS", "15")),
+        max_crops=int(os.getenv("BATCH_MAX_CROPS", "32")),
+    )
+    scheduler.start()
+    _scheduler_ref["scheduler"] = scheduler
     logger.info("=== API ready ===")
 
     yield  # ← server is running here
 
     # ── Shutdown ──────────────────────────────────────────────────────────
     logger.info("Shutting down...")
+    await scheduler.stop()
+    _inference_pool.shutdown()
     await db.close()
     logger.info("Database closed. Goodbye.")
 
@@ -175,14 +231,15 @@ def create_app() -> FastAPI:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=["X-Next-Cursor"],
     )
 
     # Mount /api/v1 routes (new structured API)
-    router = create_router(_engine_ref, _db_ref)
+    router = create_router(_engine_ref, _db_ref, _inference_pool)
     app.include_router(router, prefix="/api/v1")
 
     # Mount legacy routes at root level (drop-in replacement for facenet-server.py)
-    legacy_router = create_legacy_router(_engine_ref, _session_store)
+    legacy_router = create_legacy_router(_engine_ref, _session_store, _inference_pool)
     app.include_router(legacy_router)
 
     # Root redirect to docs
@@ -198,9 +255,59 @@ app = create_app()
 
 
 # ---------------------------------------------------------------------------
-# Helper used by /ws/recognize
+# Helpers used by the WebSocket handlers
 # ---------------------------------------------------------------------------
 
+_BUSY_RESULT = {
+    "detected": False, "faces": [], "num_faces": 0,
+    "error": "Recognition server busy, retry shortly",
+}
+
+
+async def _recognize_session_frame(engine, img, tracker: FaceTracker = None) -> dict:
+    """
+    Session recognition for one streamed frame.
+
+    Detection runs on the shared inference pool; the embedding stage goes
+    through the InferenceScheduler so crops from every connected client are
+    embedded together.  Matching is a small matrix product and runs inline.
+    The stream's *tracker* lets stable, already-identified faces skip
+    embedding entirely and re-runs anti-spoofing only when a track's cached
+    liveness is due.
+
+    Raises InferenceBusy when the pool is saturated.
+    """
+    t0 = _time.perf_counter()
+    faces = await _inference_pool.run(engine.detect_session_faces, img, tracker is None)
+    plans = None
+    if tracker is not None:
+        tracker.sync_session(_session_store)
+        plans = tracker.plan(faces)
+        due = tracker.liveness_due(plans)
+        if due:
+            await _inference_pool.run(engine.check_liveness, img, faces, due)
+        tracker.apply_liveness(plans, faces)
+    crops = engine.live_face_crops(faces)
+    if tracker is not None:
+        crops = tracker.filter_crops(crops, plans)
+
+    scheduler = _scheduler_ref["scheduler"]
+    if scheduler is not None:
+        embs, rows = await scheduler.embed(crops)
+    else:
+        embs, rows = await _inference_pool.run(engine.get_embeddings_batch, crops)
+
+    result_faces = engine.match_session_faces(faces, embs, rows, _session_store)
+    if tracker is not None:
+        result_faces = tracker.merge(plans, result_faces)
+    return {
+        "detected": len(result_faces) > 0,
+        "faces": result_faces,
+        "num_faces": len(result_faces),
+        "processing_time_ms": (_time.perf_counter() - t0) * 1000.0,
+    }
+
+
 def _decode_b64_ws(b64: str):
     """Decode base64 image string to BGR numpy array (WebSocket path)."""
     try:
@@ -222,43 +329,68 @@ async def ws_recognize(websocket: WebSocket):
     """
     Real-time face recognition stream.
 
-    Client sends JSON frames:
-      {"image": "<base64 JPEG>"}
+    Client sends either
+      - JSON text frames:  {"image": "<base64 JPEG>"}, or
+      - binary frames:     8-byte header + raw JPEG bytes (see api/ws_protocol.py)
 
-    Server replies with a RecognitionResult JSON object per frame.
+    Server replies with a RecognitionResult per frame, in the same mode the
+    frame arrived in (JSON text, or header + JSON/msgpack bytes echoing the
+    frame_id).
     """
     await websocket.accept()
     logger.info("WebSocket /ws/recognize: client connected")
+    tracker = FaceTracker.from_env()
+    scheduler = _scheduler_ref["scheduler"]
+    if scheduler is not None:
+        scheduler.stream_opened()
     try:
         while True:
-            data = await websocket.receive_text()
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+
+            raw = message.get("bytes")
+            binary = raw is not None
+            frame_id, flags, img = 0, 0, None
+            if binary:
+                try:
+                    frame_id, flags, img = ws_protocol.decode_frame(raw)
+                except ws_protocol.ProtocolError as exc:
+                    await websocket.send_text(_json.dumps(
+                        {"detected": False, "faces": [], "num_faces": 0, "error": str(exc)}
+                    ))
+                    continue
+
             engine = _engine_ref["engine"]
             if engine is None:
-                await websocket.send_text(
-                    _json.dumps({"detected": False, "faces": [], "num_faces": 0})
-                )
-                continue
-
-            body = _json.loads(data)
-            img = _decode_b64_ws(body.get("image", ""))
-            result = engine.recognize_frame_with_session(img, _session_store)
-            await websocket.send_text(_json.dumps(result))
+                result = {"detected": False, "faces": [], "num_faces": 0}
+            else:
+                if not binary:
+                    body = _json.loads(message.get("text") or "{}")
+                    img = _decode_b64_ws(body.get("image", ""))
+                try:
+                    result = await _recognize_session_frame(engine, img, tracker)
+                except InferenceBusy:
+                    result = _BUSY_RESULT
+
+            if binary:
+                await websocket.send_bytes(ws_protocol.encode_result(result, frame_id, flags))
+            else:
+                await websocket.send_text(_json.dumps(result))
 
     except WebSocketDisconnect:
-        logger.info("WebSocket /ws/recognize: client disconnected")
+        logger.info(f"WebSocket /ws/recognize: client disconnected ({tracker!r})")
     except Exception as exc:
         logger.warning(f"WebSocket /ws/recognize error: {exc}")
+    finally:
+        if scheduler is not None:
+            scheduler.stream_closed()
 
 
 # ---------------------------------------------------------------------------
 # WebSocket: server-side camera stream
 # ---------------------------------------------------------------------------
 
-# Thread pool for offloading CPU-bound recognition work
-import concurrent.futures as _cf
-_recognition_pool = _cf.ThreadPoolExecutor(max_workers=1, thread_name_prefix="recognition")
-
-
 @app.websocket("/ws/camera-stream")
 async def ws_camera_stream(websocket: WebSocket):
     """
@@ -267,19 +399,31 @@ async def ws_camera_stream(websocket: WebSocket):
     Client sends a JSON config once to start:
       {"mode": "recognize" | "extract" | "view",
        "jpeg_quality": 60,
-       "process_every": 3}
+       "process_every": 3,
+       "scene_gate": true,    # optional: skip recognition while the scene is static
+       "binary": false,       # optional: raw JPEG frames (api/ws_protocol.py)
+       "msgpack": false}      # optional: msgpack metadata in binary mode
 
     Server continuously sends back:
       {"frame": "<base64 JPEG>",
        "width": int, "height": int,
        "results": <RecognitionResult or ExtractResult or null>,
+       "reused": bool,        # results repeated from an earlier frame
        "frame_id": int,
        "fps": float}
 
+    In binary mode each message is header + metadata (the same fields minus
+    "frame") + the raw JPEG bytes, with no base64.
+
     Frames are always streamed at camera FPS.  Recognition/extraction
     runs every ``process_every`` frames (default 3) in a background thread
-    so the event loop is never blocked.  Frames in between carry the
-    previous ``results`` (or null).
+    so the event loop is never blocked.  Frames in between carry
+    ``results: null``.
+
+    With the scene gate on, a scheduled frame that barely differs from the
+    last processed one (see recognition/scene_gate.py) is not processed:
+    it carries the previous ``results`` with ``reused: true``.  An idle
+    classroom camera then costs little more than JPEG encoding.
     """
     logger.info("WebSocket /ws/camera-stream: client connected")
     await websocket.accept()
@@ -291,7 +435,9 @@ async def ws_camera_stream(websocket: WebSocket):
         await websocket.close()
         return
 
-    loop = asyncio.get_event_loop()
+    scheduler = _scheduler_ref["scheduler"]
+    if scheduler is not None:
+        scheduler.stream_opened()
 
     try:
         # Wait for client config message
@@ -300,9 +446,20 @@ async def ws_camera_stream(websocket: WebSocket):
         mode: str = config.get("mode", "recognize")
         jpeg_quality: int = max(30, min(95, int(config.get("jpeg_quality", 60))))
         process_every: int = max(1, int(config.get("process_every", 3)))
-        logger.info(f"Camera stream mode={mode}, quality={jpeg_quality}, process_every={process_every}")
+        binary: bool = bool(config.get("binary", False))
+        wire_flags: int = ws_protocol.FLAG_MSGPACK if config.get("msgpack") else 0
+        use_gate: bool = bool(config.get(
+            "scene_gate", os.getenv("SCENE_GATE", "true").lower() == "true",
+        ))
+        logger.info(
+            f"Camera stream mode={mode}, quality={jpeg_quality}, "
+            f"process_every={process_every}, binary={binary}, scene_gate={use_gate}"
+        )
 
         engine = _engine_ref["engine"]
+        tracker = FaceTracker.from_env()
+        gate = SceneGate.from_env()
+        session_version = -1
         last_frame_id = -1
         fps_counter = 0
         fps_timer = _time.time()
@@ -317,11 +474,15 @@ async def ws_camera_stream(websocket: WebSocket):
                 cmd = _json.loads(msg)
                 if "mode" in cmd:
                     mode = cmd["mode"]
+                    gate.reset()
                     logger.info(f"Camera stream mode switched to: {mode}")
                 if "jpeg_quality" in cmd:
                     jpeg_quality = max(30, min(95, int(cmd["jpeg_quality"])))
                 if "process_every" in cmd:
                     process_every = max(1, int(cmd["process_every"]))
+                if "scene_gate" in cmd:
+                    use_gate = bool(cmd["scene_gate"])
+                    gate.reset()
                 if cmd.get("action") == "stop":
                     break
             except asyncio.TimeoutError:
@@ -341,24 +502,31 @@ async def ws_camera_stream(websocket: WebSocket):
                 and mode != "view"
                 and frame_counter % process_every == 0
             )
-            if should_process:
-                if mode == "recognize":
-                    last_results = await loop.run_in_executor(
-                        _recognition_pool,
-                        engine.recognize_frame_with_session, frame, _session_store,
-                    )
-                elif mode == "extract":
-                    last_results = await loop.run_in_executor(
-                        _recognition_pool,
-                        engine.extract_single, frame,
-                    )
+            reused = False
+            if should_process and use_gate:
+                # A newly loaded session can change results for the same scene
+                if _session_store.version != session_version:
+                    session_version = _session_store.version
+                    gate.reset()
+                signature = scene_signature(frame)
+                reused = last_results is not None and not gate.changed(signature)
+            if should_process and not reused:
+                try:
+                    if mode == "recognize":
+                        last_results = await _recognize_session_frame(engine, frame, tracker)
+                    elif mode == "extract":
+                        last_results = await _inference_pool.run(engine.extract_single, frame)
+                    if use_gate:
+                        gate.accept(signature)
+                except InferenceBusy:
+                    # Keep streaming video; retry recognition on a later frame
+                    should_process = False
 
             # Encode frame as JPEG
             _, jpeg_buf = cv2.imencode(
                 ".jpg", frame,
                 [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality],
             )
-            frame_b64 = base64.b64encode(jpeg_buf).decode("ascii")
 
             # FPS tracking
             fps_counter += 1
@@ -370,14 +538,20 @@ async def ws_camera_stream(websocket: WebSocket):
 
             h, w = frame.shape[:2]
             payload = {
-                "frame": frame_b64,
                 "width": w,
                 "height": h,
                 "results": last_results if should_process else None,
+                "reused": reused,
                 "frame_id": frame_id,
                 "fps": round(current_fps, 1),
             }
-            await websocket.send_text(_json.dumps(payload))
+            if binary:
+                await websocket.send_bytes(ws_protocol.encode_camera_frame(
+                    payload, jpeg_buf.tobytes(), frame_id, wire_flags,
+                ))
+            else:
+                payload["frame"] = base64.b64encode(jpeg_buf).decode("ascii")
+                await websocket.send_text(_json.dumps(payload))
 
             # Yield to event loop
             await asyncio.sleep(0)
@@ -389,6 +563,8 @@ async def ws_camera_stream(websocket: WebSocket):
     except Exception as exc:
         logger.warning(f"WebSocket /ws/camera-stream error: {exc}")
     finally:
+        if scheduler is not None:
+            scheduler.stream_closed()
         _camera.release()
         logger.info("WebSocket /ws/camera-stream: camera released")
 
@@ -0,0 +1,131 @@
+"""
+ws_protocol.py
+--------------
+Binary WebSocket sub-protocol for /ws/recognize and /ws/camera-stream.
+
+The original protocol sends ``{"image": "<base64 JPEG>"}`` text frames and
+``{"frame": "<base64 JPEG>", ...}`` replies.  Base64 costs 33% extra
+bandwidth plus an extra copy in each direction, so clients can instead send
+raw JPEG bytes in a binary frame.  Text frames keep working for old clients.
+
+Frame layout (all integers little-endian)
+-----------------------------------------
+Every binary message starts with an 8-byte header::
+
+    offset  size  field
+    0       1     version    (PROTOCOL_VERSION)
+    1       1     flags      (FLAG_* bits below)
+    2       2     reserved   (0)
+    4       4     frame_id   (uint32, echoed back in the reply)
+
+Client → server (/ws/recognize)::
+
+    header | JPEG bytes
+
+Server → client (/ws/recognize)::
+
+    header | result payload          (msgpack if FLAG_MSGPACK, else UTF-8 JSON)
+
+Server → client (/ws/camera-stream, config ``{"binary": true}``)::
+
+    header | uint32 meta_len | meta payload | JPEG bytes
+
+The client sets ``FLAG_MSGPACK`` to ask for msgpack results.  The server
+echoes the flag only when msgpack is installed, so the reply header always
+says how the payload is encoded.
+"""
+
+from __future__ import annotations
+
+import json
+import struct
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+
+# Optional dependency: compact binary results.  Fall back to JSON bytes.
+try:
+    import msgpack  # type: ignore
+    _MSGPACK_AVAILABLE = True
+except ImportError:
+    _MSGPACK_AVAILABLE = False
+
+
+PROTOCOL_VERSION = 1
+
+FLAG_MSGPACK = 0x01     # payload / requested reply encoding is msgpack
+FLAG_HAS_JPEG = 0x02    # camera-stream message carries JPEG bytes after the meta
+
+HEADER = struct.Struct("<BBHI")
+META_LEN = struct.Struct("<I")
+
+
+class ProtocolError(ValueError):
+    """Raised for malformed binary frames."""
+
+
+# ---------------------------------------------------------------------------
+# Decoding (client → server)
+# ---------------------------------------------------------------------------
+
+def decode_frame(data: bytes) -> Tuple[int, int, Optional[np.ndarray]]:
+    """
+    Parse a binary client frame.
+
+    Returns:
+        (frame_id, flags, img_bgr) — img_bgr is None if the JPEG could not be
+        decoded.
+
+    Raises:
+        ProtocolError: on a short frame or unknown protocol version.
+    """
+    if len(data) < HEADER.size:
+        raise ProtocolError(f"Binary frame too short ({len(data)} bytes)")
+    version, flags, _reserved, frame_id = HEADER.unpack_from(data)
+    if version != PROTOCOL_VERSION:
+        raise ProtocolError(f"Unsupported protocol version {version}")
+
+    # Decode straight from the received buffer (no base64, no extra copy)
+    buf = np.frombuffer(data, dtype=np.uint8, offset=HEADER.size)
+    img = cv2.imdecode(buf, cv2.IMREAD_COLOR) if buf.size else None
+    return frame_id, flags, img
+
+
+# ---------------------------------------------------------------------------
+# Encoding (server → client)
+# ---------------------------------------------------------------------------
+
+def _reply_flags(requested: int) -> int:
+    return FLAG_MSGPACK if (requested & FLAG_MSGPACK and _MSGPACK_AVAILABLE) else 0
+
+
+def _pack(obj: dict, flags: int) -> bytes:
+    if flags & FLAG_MSGPACK:
+        return msgpack.packb(obj, use_bin_type=True)
+    return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+
+def encode_result(result: dict, frame_id: int, requested_flags: int = 0) -> bytes:
+    """Encode a recognition result as a binary reply to *frame_id*."""
+    flags = _reply_flags(requested_flags)
+    return HEADER.pack(PROTOCOL_VERSION, flags, 0, frame_id & 0xFFFFFFFF) + _pack(result, flags)
+
+
+def encode_camera_frame(
+    meta: dict,
+    jpeg: Optional[bytes],
+    frame_id: int,
+    requested_flags: int = 0,
+) -> bytes:
+    """Encode a camera-stream message: metadata plus raw JPEG bytes."""
+    flags = _reply_flags(requested_flags)
+    if jpeg:
+        flags |= FLAG_HAS_JPEG
+    payload = _pack(meta, flags)
+    return b"".join((
+        HEADER.pack(PROTOCOL_VERSION, flags, 0, frame_id & 0xFFFFFFFF),
+        META_LEN.pack(len(payload)),
+        payload,
+        jpeg or b"",
+    ))
@@ -0,0 +1,180 @@
+"""
+attendance_writer.py
+--------------------
+Write-behind buffer for attendance records.
+
+A kiosk marking a full class emits one attendance row per recognised
+student, often within the same second.  Committing each row in its own
+transaction costs one WAL fsync per student, so records are queued here and
+written together:
+
+  log_attendance ──┐
+  log_attendance ──┼──► [buffer: ≤ ATTENDANCE_FLUSH_MS or ≤ ATTENDANCE_FLUSH_MAX]
+  batch ingest  ───┘            ↓
+                     write_fn(records)   (one transaction, executemany)
+                                ↓
+                  per-record result ─► caller futures
+
+Callers that need durability await their record's future (the default for
+``DBManager.log_attendance``); it resolves only after the batch containing
+the record has committed.  ``flush()`` writes everything queued so far.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from typing import Awaitable, Callable, List, Optional, Sequence, Tuple, Union
+
+from loguru import logger
+
+# Takes the queued records and returns, per record, its new row id or the
+# exception that rejected it.  Raising fails the whole batch.
+WriteFn = Callable[[List[dict]], Awaitable[List[Union[int, Exception]]]]
+
+
+class AttendanceWriter:
+    """
+    Coalesces attendance records into batched transactions.
+
+    Args:
+        write_fn:     Async batch writer, normally
+                      ``DBManager._insert_attendance_batch``.
+        flush_ms:     Longest a record waits in the buffer before a flush.
+        max_records:  Flush as soon as this many records are queued.
+    """
+
+    def __init__(
+        self,
+        write_fn: WriteFn,
+        flush_ms: float = 200.0,
+        max_records: int = 256,
+    ):
+        self._write_fn = write_fn
+        self.flush_s = max(0.0, flush_ms) / 1000.0
+        self.max_records = max(1, max_records)
+
+        self._pending: List[Tuple[dict, Optional[asyncio.Future]]] = []
+        self._lock: Optional[asyncio.Lock] = None
+        self._has_data: Optional[asyncio.Event] = None
+        self._full: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+        self.batches_written = 0
+        self.records_written = 0
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+
+    def start(self) -> None:
+        """Start the flush loop (must be called from a running event loop)."""
+        if self._task is not None:
+            return
+        self._lock = asyncio.Lock()
+        self._has_data = asyncio.Event()
+        self._full = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        logger.info(
+            f"AttendanceWriter started (flush={self.flush_s * 1000:.0f} ms, "
+            f"max_records={self.max_records})"
+        )
+
+    async def stop(self) -> None:
+        """Stop the flush loop and write whatever is still queued."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        await self.flush()
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    def submit(
+        self, records: Sequence[dict], wait: bool = True,
+    ) -> List[Optional[asyncio.Future]]:
+        """
+        Queue *records* for the next flush.
+
+        Returns one future per record (resolving to the new row id, or
+        raising the error that rejected it), or Nones when ``wait`` is False.
+        """
+        if self._task is None:
+            raise RuntimeError("AttendanceWriter.start() has not been called")
+        loop = asyncio.get_running_loop()
+        futures = [loop.create_future() if wait else None for _ in records]
+        self._pending.extend(zip(records, futures))
+        if self._pending:
+            self._has_data.set()
+        if len(self._pending) >= self.max_records:
+            self._full.set()
+        return futures
+
+    async def flush(self) -> int:
+        """Write every queued record now.  Returns the number of rows written."""
+        if self._lock is None:
+            return 0
+        async with self._lock:
+            batch, self._pending = self._pending, []
+            self._has_data.clear()
+            self._full.clear()
+            if not batch:
+                return 0
+
+            try:
+                results = await self._write_fn([rec for rec, _ in batch])
+            except Exception as exc:
+                logger.error(f"AttendanceWriter: batch of {len(batch)} failed: {exc}")
+                for _, fut in batch:
+                    if fut is not None and not fut.done():
+                        fut.set_exception(exc)
+                return 0
+
+            written = 0
+            for (rec, fut), res in zip(batch, results):
+                if isinstance(res, Exception):
+                    if fut is None:
+                        logger.warning(f"AttendanceWriter: dropped record for {rec.get('user_id')}: {res}")
+                    elif not fut.done():
+                        fut.set_exception(res)
+                    continue
+                written += 1
+                if fut is not None and not fut.done():
+                    fut.set_result(res)
+
+            self.batches_written += 1
+            self.records_written += written
+            return written
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "batches_written": self.batches_written,
+            "records_written": self.records_written,
+        }
+
+    # ------------------------------------------------------------------
+    # Flush loop
+    # ------------------------------------------------------------------
+
+    async def _run(self) -> None:
+        while True:
+            await self._has_data.wait()
+            try:
+                await asyncio.wait_for(self._full.wait(), self.flush_s)
+            except asyncio.TimeoutError:
+                pass
+            # Shielded so stop() never cancels a transaction half-way
+            await asyncio.shield(self.flush())
+
+    def __repr__(self) -> str:
+        return (
+            f"AttendanceWriter(flush_ms={self.flush_s * 1000:.0f}, "
+            f"max_records={self.max_records}, batches={self.batches_written}, "
+            f"records={self.records_written})"
+        )
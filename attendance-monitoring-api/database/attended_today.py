@@ -0,0 +1,111 @@
+"""
+attended_today.py
+-----------------
+In-memory "already attended today" set.
+
+Kiosks recognise the same student on many consecutive frames, and every
+recognition asks whether that student is already marked for the day.
+Answering that with ``SELECT COUNT(*) FROM attendance`` on every frame makes
+it the hottest query in the system, so DBManager keeps the answer in memory:
+
+  - loaded once at startup from the attendance rows of the current day,
+  - updated whenever a record is queued through ``log_attendance``,
+  - rolled over when the local day (in ``ATTENDANCE_TIMEZONE``) changes.
+
+The "day" is the calendar day of the record timestamp in the configured
+timezone, so a school in UTC+8 does not roll over at 08:00 local time.
+Timestamps without an offset are treated as UTC (what ``_utcnow`` writes).
+
+Not thread-safe; it is only touched from the event loop.
+"""
+
+from __future__ import annotations
+
+from datetime import date, datetime, timedelta, timezone, tzinfo
+from typing import Dict, Iterable, Optional, Set, Tuple
+from zoneinfo import ZoneInfo
+
+
+def resolve_timezone(name: Optional[str]) -> tzinfo:
+    """``"UTC"`` / ``""`` / None → UTC, anything else → ``ZoneInfo(name)``."""
+    if not name or name.upper() == "UTC":
+        return timezone.utc
+    return ZoneInfo(name)
+
+
+class AttendedToday:
+    """
+    Per-day sets of user ids that have an attendance record.
+
+    Args:
+        tz: Timezone whose midnight starts a new attendance day.
+    """
+
+    def __init__(self, tz: tzinfo = timezone.utc):
+        self.tz = tz
+        # Current day plus any later day seen early (client clock skew)
+        self._days: Dict[date, Set[str]] = {}
+        self._today: Optional[date] = None
+
+    # ------------------------------------------------------------------
+    # Day boundaries
+    # ------------------------------------------------------------------
+
+    def today(self, now: Optional[datetime] = None) -> date:
+        """Current attendance day; drops older days when it changes."""
+        day = (now or datetime.now(timezone.utc)).astimezone(self.tz).date()
+        if day != self._today:
+            self._today = day
+            for old in [d for d in self._days if d < day]:
+                del self._days[old]
+        return day
+
+    def day_of(self, timestamp: str) -> Optional[date]:
+        """Attendance day of an ISO-8601 timestamp, or None if unparsable."""
+        try:
+            ts = datetime.fromisoformat(timestamp)
+        except (TypeError, ValueError):
+            return None
+        if ts.tzinfo is None:
+            ts = ts.replace(tzinfo=timezone.utc)
+        return ts.astimezone(self.tz).date()
+
+    def load_since(self) -> str:
+        """
+        Lower bound for the startup query, as a UTC ISO string.
+
+        One day earlier than the local midnight so rows written with other
+        UTC offsets are not missed; :meth:`load` filters them exactly.
+        """
+        start = datetime.combine(self.today(), datetime.min.time(), tzinfo=self.tz)
+        return (start - timedelta(days=1)).astimezone(timezone.utc).date().isoformat()
+
+    # ------------------------------------------------------------------
+    # Updates / queries
+    # ------------------------------------------------------------------
+
+    def load(self, rows: Iterable[Tuple[str, str]]) -> int:
+        """Replace the contents with ``(user_id, timestamp)`` rows.  Returns today's count."""
+        self._days.clear()
+        self._today = None
+        today = self.today()
+        for user_id, timestamp in rows:
+            self.add(user_id, timestamp, today)
+        return len(self._days.get(today, ()))
+
+    def add(self, user_id: str, timestamp: str, today: Optional[date] = None) -> None:
+        """Record that *user_id* has a record at *timestamp* (past days ignored)."""
+        day = self.day_of(timestamp)
+        if day is not None and day >= (today or self.today()):
+            self._days.setdefault(day, set()).add(user_id)
+
+    def discard(self, user_id: str) -> None:
+        """Forget *user_id* on every day (its attendance rows were deleted)."""
+        for users in self._days.values():
+            users.discard(user_id)
+
+    def __contains__(self, user_id: str) -> bool:
+        return user_id in self._days.get(self.today(), ())
+
+    def __len__(self) -> int:
+        return len(self._days.get(self.today(), ()))
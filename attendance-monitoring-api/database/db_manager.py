@@ -8,8 +8,21 @@ Schema
   users
     id            TEXT  PRIMARY KEY   (UUID or employee ID string)
     name          TEXT  NOT NULL
-    embedding_vector  TEXT  NOT NULL  (JSON-encoded float32 list)
+    embedding_vector  TEXT  NOT NULL  (legacy JSON float list; '' once stored as BLOB)
     created_at    TEXT  NOT NULL
+    embedding     BLOB              (raw little-endian float32 bytes)
+    embedding_dtype TEXT            (numpy dtype string, e.g. '<f4')
+    embedding_dim INTEGER           (vector length)
+    templates     BLOB              (optional (K, embedding_dim) float32 templates)
+    generation    INTEGER NOT NULL  (value of the generation counter at last write)
+
+  user_tombstones
+    id            TEXT     PRIMARY KEY  (deleted user id)
+    generation    INTEGER  NOT NULL
+
+  schema_meta
+    key           TEXT     PRIMARY KEY  ('generation' = bumped on every user write)
+    value         INTEGER  NOT NULL
 
   attendance
     id            INTEGER  PRIMARY KEY  AUTOINCREMENT
@@ -18,30 +31,80 @@ Schema
     status        TEXT     NOT NULL  DEFAULT 'present'
     confidence    REAL
 
+  attendance_user_daily       (one row per user per attendance day)
+    day           TEXT     NOT NULL  ('YYYY-MM-DD' in attendance_timezone)
+    user_id       TEXT     NOT NULL
+    records       INTEGER  NOT NULL
+    present / late / absent  INTEGER  NOT NULL  (records per status)
+    first_seen    TEXT     NOT NULL  (earliest timestamp that day)
+    last_seen     TEXT     NOT NULL
+    confidence_sum REAL    NOT NULL  (average = confidence_sum / records)
+    PRIMARY KEY (day, user_id)
+
+  attendance_daily            (one row per attendance day)
+    day           TEXT     PRIMARY KEY
+    users         INTEGER  NOT NULL  (distinct users with a record)
+    records / present / late / absent / confidence_sum  (as above)
+
 Public API
 ----------
   await DBManager.create()                    → factory (creates tables)
-  await db.upsert_user(id, name, embedding)   → register / update user
+  await db.upsert_user(id, name, embedding, templates) → register / update user
+  await db.upsert_users([(id, name, embedding, templates), ...]) → bulk, one transaction
   await db.get_all_users_with_embeddings()    → list for FAISS rebuild
+  await db.migrate_embeddings_to_blob()       → convert legacy JSON rows
+  await db.get_generation()                   → current user-table generation
+  await db.get_user_changes_since(gen)        → (changed users, deleted ids)
   await db.get_user(user_id)                  → single user dict
   await db.delete_user(user_id)              → remove user + embeddings
-  await db.log_attendance(user_id, confidence, status) → write attendance
-  await db.get_attendance(...)                → query attendance records
-  await db.close()                            → clean up
+  await db.log_attendance(user_id, confidence, status) → buffered write, awaits commit
+  await db.log_attendance_many([{user_id, ...}, ...]) → batch ingest (offline sync)
+  await db.flush_attendance()                 → commit every buffered record now
+  await db.has_attended_today(user_id)        → in-memory check, no SQL
+  await db.get_attendance(..., cursor)        → one page, newest first (keyset on timestamp, id)
+  db.iter_attendance(...)                     → async generator over a server-side cursor
+  await db.get_attendance_summary(...)        → per-day or per-user rollups
+  await db.rebuild_attendance_summary()       → recompute summaries from attendance
+  await db.close()                            → flush buffered writes, clean up
+
+Attendance writes go through an :class:`AttendanceWriter` that commits
+queued records in one executemany transaction every ``attendance_flush_ms``
+or every ``attendance_flush_max`` records, whichever comes first.  The
+set of users with a record today (in ``attendance_timezone``) is kept in
+memory by :class:`AttendedToday`, so duplicate checks never hit SQLite.
+The summary tables are updated in the same transaction as the attendance
+rows they count; dashboards read O(days) rows instead of O(records).
+Reads do not wait for the buffer, so they can miss records up to
+``attendance_flush_ms`` old; pass ``flush=True`` (or call
+``flush_attendance()`` first) to include them.
+
+Connections
+-----------
+Writes go through one dedicated writer connection (pool of 1), so they are
+serialised in the pool instead of failing with "database is locked".
+Reads use a separate pool of ``readers`` connections opened with
+``query_only``; with WAL they never wait for the writer, so attendance
+lists stay fast while a registration or bulk enrollment is committing.
+Every connection gets the same PRAGMAs at connect time (synchronous=NORMAL,
+mmap_size, cache_size, temp_store=MEMORY, busy_timeout, foreign_keys) and a
+larger sqlite3 prepared-statement cache, so the fixed SQL of the hot
+queries is parsed once per connection.
 """
 
 from __future__ import annotations
 
+import asyncio
+import functools
 import json
 import sys
 import uuid
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
 import numpy as np
 from loguru import logger
-from sqlalchemy import text
+from sqlalchemy import bindparam, event, text
 from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 
@@ -49,6 +112,13 @@ _ROOT = Path(__file__).resolve().parent.parent
 if str(_ROOT) not in sys.path:
     sys.path.insert(0, str(_ROOT))
 
+from database.attendance_writer import AttendanceWriter  # noqa: E402
+from database.attended_today import AttendedToday, resolve_timezone  # noqa: E402
+
+
+class UnknownUserError(LookupError):
+    """Raised for an attendance record whose user_id is not registered."""
+
 
 # ---------------------------------------------------------------------------
 # SQL DDL
@@ -59,10 +129,73 @@ CREATE TABLE IF NOT EXISTS users (
     id              TEXT    PRIMARY KEY,
     name            TEXT    NOT NULL,
     embedding_vector TEXT   NOT NULL,
-    created_at      TEXT    NOT NULL
+    created_at      TEXT    NOT NULL,
+    embedding       BLOB,
+    embedding_dtype TEXT,
+    embedding_dim   INTEGER,
+    templates       BLOB,
+    generation      INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+# Columns added after the first release; ALTERed into older databases.
+_USERS_BLOB_COLUMNS = {
+    "embedding":       "BLOB",
+    "embedding_dtype": "TEXT",
+    "embedding_dim":   "INTEGER",
+    "templates":       "BLOB",
+    "generation":      "INTEGER NOT NULL DEFAULT 0",
+}
+
+# Embeddings are stored as raw little-endian float32 bytes.
+_EMBEDDING_DTYPE = np.dtype("<f4")
+
+_USER_COLUMNS = (
+    "id, name, embedding_vector, created_at, embedding, embedding_dtype, embedding_dim, templates"
+)
+
+_GET_USER_SQL = text(f"SELECT {_USER_COLUMNS} FROM users WHERE id = :id")
+
+_GET_GENERATION_SQL = text("SELECT value FROM schema_meta WHERE key = 'generation'")
+
+# Monotonic counter bumped by every user upsert / delete.  Index snapshots
+# record the generation they were built at, so startup can replay only the
+# rows written since.
+_CREATE_META_TABLE = """
+CREATE TABLE IF NOT EXISTS schema_meta (
+    key     TEXT    PRIMARY KEY,
+    value   INTEGER NOT NULL
+);
+"""
+
+_CREATE_TOMBSTONES_TABLE = """
+CREATE TABLE IF NOT EXISTS user_tombstones (
+    id          TEXT    PRIMARY KEY,
+    generation  INTEGER NOT NULL
 );
 """
 
+_CREATE_IDX_USERS_GENERATION = """
+CREATE INDEX IF NOT EXISTS idx_users_generation
+ON users (generation);
+"""
+
+_UPSERT_USER_SQL = text(
+    """
+    INSERT INTO users (id, name, embedding_vector, created_at,
+                       embedding, embedding_dtype, embedding_dim, templates, generation)
+    VALUES (:id, :name, '', :created_at, :emb, :dtype, :dim, :tpl, :gen)
+    ON CONFLICT(id) DO UPDATE SET
+        name             = excluded.name,
+        embedding_vector = excluded.embedding_vector,
+        embedding        = excluded.embedding,
+        embedding_dtype  = excluded.embedding_dtype,
+        embedding_dim    = excluded.embedding_dim,
+        templates        = excluded.templates,
+        generation       = excluded.generation
+    """
+)
+
 _CREATE_ATTENDANCE_TABLE = """
 CREATE TABLE IF NOT EXISTS attendance (
     id          INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -74,16 +207,171 @@ CREATE TABLE IF NOT EXISTS attendance (
 );
 """
 
+# Per-user history and the ON DELETE CASCADE lookup both use this index;
+# it replaces the older single-column idx_attendance_user_id.
 _CREATE_IDX_ATTENDANCE_USER = """
-CREATE INDEX IF NOT EXISTS idx_attendance_user_id
-ON attendance (user_id);
+CREATE INDEX IF NOT EXISTS idx_attendance_user_time
+ON attendance (user_id, timestamp);
+"""
+
+_DROP_IDX_ATTENDANCE_USER_LEGACY = "DROP INDEX IF EXISTS idx_attendance_user_id"
+
+_SUMMARY_COUNTS = """
+    records         INTEGER NOT NULL DEFAULT 0,
+    present         INTEGER NOT NULL DEFAULT 0,
+    late            INTEGER NOT NULL DEFAULT 0,
+    absent          INTEGER NOT NULL DEFAULT 0,
+    confidence_sum  REAL    NOT NULL DEFAULT 0"""
+
+_CREATE_USER_DAILY_TABLE = f"""
+CREATE TABLE IF NOT EXISTS attendance_user_daily (
+    day             TEXT    NOT NULL,
+    user_id         TEXT    NOT NULL,
+    first_seen      TEXT    NOT NULL,
+    last_seen       TEXT    NOT NULL,{_SUMMARY_COUNTS},
+    PRIMARY KEY (day, user_id)
+);
 """
 
+_CREATE_IDX_USER_DAILY_USER = """
+CREATE INDEX IF NOT EXISTS idx_attendance_user_daily_user
+ON attendance_user_daily (user_id, day);
+"""
+
+_CREATE_DAILY_TABLE = f"""
+CREATE TABLE IF NOT EXISTS attendance_daily (
+    day             TEXT    PRIMARY KEY,
+    users           INTEGER NOT NULL DEFAULT 0,{_SUMMARY_COUNTS}
+);
+"""
+
+_UPSERT_USER_DAILY_SQL = text(
+    """
+    INSERT INTO attendance_user_daily
+        (day, user_id, first_seen, last_seen, records, present, late, absent, confidence_sum)
+    VALUES
+        (:day, :user_id, :first_seen, :last_seen, :records, :present, :late, :absent, :confidence_sum)
+    ON CONFLICT(day, user_id) DO UPDATE SET
+        first_seen     = MIN(first_seen, excluded.first_seen),
+        last_seen      = MAX(last_seen, excluded.last_seen),
+        records        = records + excluded.records,
+        present        = present + excluded.present,
+        late           = late + excluded.late,
+        absent         = absent + excluded.absent,
+        confidence_sum = confidence_sum + excluded.confidence_sum
+    """
+)
+
+_UPSERT_DAILY_SQL = text(
+    """
+    INSERT INTO attendance_daily
+        (day, users, records, present, late, absent, confidence_sum)
+    VALUES
+        (:day, :users, :records, :present, :late, :absent, :confidence_sum)
+    ON CONFLICT(day) DO UPDATE SET
+        users          = users + excluded.users,
+        records        = records + excluded.records,
+        present        = present + excluded.present,
+        late           = late + excluded.late,
+        absent         = absent + excluded.absent,
+        confidence_sum = confidence_sum + excluded.confidence_sum
+    """
+)
+
+# Recompute attendance_daily rows from attendance_user_daily (rebuilds / deletes)
+_REFRESH_DAILY_SQL = text(
+    """
+    INSERT OR REPLACE INTO attendance_daily
+        (day, users, records, present, late, absent, confidence_sum)
+    SELECT day, COUNT(*), SUM(records), SUM(present), SUM(late), SUM(absent),
+           SUM(confidence_sum)
+    FROM attendance_user_daily
+    WHERE day IN :days
+    GROUP BY day
+    """
+).bindparams(bindparam("days", expanding=True))
+
+_EXISTING_USER_DAYS_SQL = text(
+    "SELECT user_id FROM attendance_user_daily WHERE day = :day AND user_id IN :ids"
+).bindparams(bindparam("ids", expanding=True))
+
+_DELETE_DAILY_SQL = text(
+    "DELETE FROM attendance_daily WHERE day IN :days"
+).bindparams(bindparam("days", expanding=True))
+
+_ATTENDANCE_STATUSES = ("present", "late", "absent")
+
+# SQLite appends the rowid (attendance.id) to every index entry, so this
+# index already serves ORDER BY / keyset comparisons on (timestamp, id).
 _CREATE_IDX_ATTENDANCE_TIME = """
 CREATE INDEX IF NOT EXISTS idx_attendance_timestamp
 ON attendance (timestamp);
 """
 
+_INSERT_ATTENDANCE_SQL = text(
+    """
+    INSERT INTO attendance (user_id, timestamp, status, confidence)
+    VALUES (:user_id, :timestamp, :status, :confidence)
+    """
+)
+
+_KNOWN_USER_IDS_SQL = text(
+    "SELECT id FROM users WHERE id IN :ids"
+).bindparams(bindparam("ids", expanding=True))
+
+# The batch's rows must be exactly the rows with id >= its first id
+_ATTENDANCE_IDS_FROM_SQL = text(
+    "SELECT COUNT(*), MAX(id) FROM attendance WHERE id >= :first"
+)
+_LAST_INSERT_ROWID_SQL = text("SELECT last_insert_rowid()")
+
+# Bound parameters per user-id lookup (stays well under SQLite's variable limit)
+_ID_LOOKUP_CHUNK = 500
+
+
+# ---------------------------------------------------------------------------
+# Connections
+# ---------------------------------------------------------------------------
+
+# sqlite3 prepared statements kept per connection (stdlib default: 128)
+_STATEMENT_CACHE_SIZE = 512
+
+# Seconds a session waits for a free pooled connection before failing
+_POOL_TIMEOUT = 60
+
+
+def _connection_pragmas(mmap_mb: int, cache_mb: int) -> tuple:
+    """PRAGMAs run on every new connection (writer and readers)."""
+    return (
+        "foreign_keys=ON",
+        "synchronous=NORMAL",       # safe with WAL; no fsync per commit
+        f"mmap_size={max(0, mmap_mb) * 1024 * 1024}",
+        f"cache_size=-{max(1, cache_mb) * 1024}",   # negative = KiB
+        "temp_store=MEMORY",
+        "busy_timeout=5000",
+    )
+
+
+def _create_sqlite_engine(url: str, pool_size: int, pragmas: tuple) -> AsyncEngine:
+    """Async engine with a fixed-size pool and *pragmas* applied on connect."""
+    engine = create_async_engine(
+        url,
+        echo=False,
+        pool_size=pool_size,
+        max_overflow=0,
+        pool_timeout=_POOL_TIMEOUT,
+        connect_args={"cached_statements": _STATEMENT_CACHE_SIZE},
+    )
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def _on_connect(dbapi_conn, _record):
+        cursor = dbapi_conn.cursor()
+        for pragma in pragmas:
+            cursor.execute(f"PRAGMA {pragma}")
+        cursor.close()
+
+    return engine
+
 
 # ---------------------------------------------------------------------------
 # DBManager
@@ -99,41 +387,118 @@ class DBManager:
         db = await DBManager.create("database/embeddings.db")
     """
 
-    def __init__(self, engine: AsyncEngine, session_factory):
+    def __init__(
+        self,
+        engine: AsyncEngine,
+        session_factory,
+        read_engine: Optional[AsyncEngine] = None,
+        read_session_factory=None,
+        attendance_flush_ms: float = 200.0,
+        attendance_flush_max: int = 256,
+        attendance_timezone: Optional[str] = None,
+    ):
         self._engine = engine
         self._session_factory = session_factory
+        # Readers default to the writer (e.g. a DBManager built by hand)
+        self._read_engine = read_engine
+        self._read_session_factory = read_session_factory or session_factory
+        self._attendance_writer = AttendanceWriter(
+            self._insert_attendance_batch,
+            flush_ms=attendance_flush_ms,
+            max_records=attendance_flush_max,
+        )
+        self._attended_today = AttendedToday(resolve_timezone(attendance_timezone))
 
     # ------------------------------------------------------------------
     @classmethod
-    async def create(cls, db_path: str = "database/embeddings.db") -> "DBManager":
+    async def create(
+        cls,
+        db_path: str = "database/embeddings.db",
+        attendance_flush_ms: float = 200.0,
+        attendance_flush_max: int = 256,
+        attendance_timezone: Optional[str] = None,
+        readers: int = 4,
+        mmap_mb: int = 256,
+        cache_mb: int = 32,
+    ) -> "DBManager":
         """
         Factory method: creates the database file (+ all tables if needed)
         and returns a ready-to-use DBManager.
+
+        Args:
+            db_path:              SQLite file path.
+            attendance_flush_ms:  Longest an attendance record stays buffered.
+            attendance_flush_max: Flush the attendance buffer at this many records.
+            attendance_timezone:  IANA zone whose midnight starts a new
+                                  attendance day (default: UTC).
+            readers:              Read-only connections in the reader pool.
+            mmap_mb:              PRAGMA mmap_size per connection, MiB.
+            cache_mb:             PRAGMA cache_size per connection, MiB.
         """
         db_file = Path(db_path)
         db_file.parent.mkdir(parents=True, exist_ok=True)
 
         url = f"sqlite+aiosqlite:///{db_file.resolve()}"
-        engine = create_async_engine(url, echo=False, future=True)
+        pragmas = _connection_pragmas(mmap_mb, cache_mb)
+        engine = _create_sqlite_engine(url, pool_size=1, pragmas=pragmas)
 
-        # Enable WAL mode and foreign keys
+        # WAL is persistent in the file; the per-connection PRAGMAs
+        # (foreign keys, synchronous, ...) are applied on connect.
         async with engine.begin() as conn:
             await conn.execute(text("PRAGMA journal_mode=WAL;"))
-            await conn.execute(text("PRAGMA foreign_keys=ON;"))
             await conn.execute(text(_CREATE_USERS_TABLE))
+            await conn.execute(text(_CREATE_META_TABLE))
+            await conn.execute(text(_CREATE_TOMBSTONES_TABLE))
             await conn.execute(text(_CREATE_ATTENDANCE_TABLE))
             await conn.execute(text(_CREATE_IDX_ATTENDANCE_USER))
+            await conn.execute(text(_DROP_IDX_ATTENDANCE_USER_LEGACY))
+            await conn.execute(text(_CREATE_USER_DAILY_TABLE))
+            await conn.execute(text(_CREATE_IDX_USER_DAILY_USER))
+            await conn.execute(text(_CREATE_DAILY_TABLE))
             await conn.execute(text(_CREATE_IDX_ATTENDANCE_TIME))
 
+            # Bring older databases up to the BLOB embedding schema
+            existing = {
+                r[1] for r in (await conn.execute(text("PRAGMA table_info(users)"))).all()
+            }
+            for col, col_type in _USERS_BLOB_COLUMNS.items():
+                if col not in existing:
+                    await conn.execute(text(f"ALTER TABLE users ADD COLUMN {col} {col_type}"))
+            await conn.execute(text(_CREATE_IDX_USERS_GENERATION))
+            await conn.execute(text(
+                "INSERT OR IGNORE INTO schema_meta (key, value) VALUES ('generation', 0)"
+            ))
+
+        read_engine = _create_sqlite_engine(
+            url, pool_size=max(1, readers), pragmas=pragmas + ("query_only=ON",),
+        )
         session_factory = sessionmaker(
             engine, class_=AsyncSession, expire_on_commit=False
         )
-        logger.info(f"Database ready at: {db_file.resolve()}")
-        return cls(engine, session_factory)
+        read_session_factory = sessionmaker(
+            read_engine, class_=AsyncSession, expire_on_commit=False
+        )
+        logger.info(f"Database ready at: {db_file.resolve()} (1 writer, {max(1, readers)} readers)")
+        db = cls(
+            engine, session_factory,
+            read_engine=read_engine,
+            read_session_factory=read_session_factory,
+            attendance_flush_ms=attendance_flush_ms,
+            attendance_flush_max=attendance_flush_max,
+            attendance_timezone=attendance_timezone,
+        )
+        await db.migrate_embeddings_to_blob()
+        await db._load_attended_today()
+        await db._backfill_attendance_summary()
+        db._attendance_writer.start()
+        return db
 
     # ------------------------------------------------------------------
     async def close(self) -> None:
-        """Dispose the async engine (release connections)."""
+        """Commit buffered attendance, then dispose the async engines."""
+        await self._attendance_writer.stop()
+        if self._read_engine is not None:
+            await self._read_engine.dispose()
         await self._engine.dispose()
 
     # ------------------------------------------------------------------
@@ -145,6 +510,7 @@ class DBManager:
         user_id: str,
         name: str,
         embedding: np.ndarray,
+        templates: Optional[np.ndarray] = None,
     ) -> Dict[str, Any]:
         """
         Insert or replace a user record.
@@ -153,43 +519,49 @@ class DBManager:
             user_id:    Unique user identifier string.
             name:       Display name.
             embedding:  512-D float32 numpy vector.
+            templates:  Optional (K, 512) matrix of diverse per-user templates.
 
         Returns:
             Dict representation of the stored user.
         """
-        emb_json = json.dumps(embedding.astype(np.float32).tolist())
         now = _utcnow()
-
-        sql = text(
-            """
-            INSERT INTO users (id, name, embedding_vector, created_at)
-            VALUES (:id, :name, :emb, :created_at)
-            ON CONFLICT(id) DO UPDATE SET
-                name             = excluded.name,
-                embedding_vector = excluded.embedding_vector
-            """
-        )
-
         async with self._session_factory() as session:
             async with session.begin():
+                gen = await _bump_generation(session)
                 await session.execute(
-                    sql,
-                    {
-                        "id":         user_id,
-                        "name":       name,
-                        "emb":        emb_json,
-                        "created_at": now,
-                    },
+                    _UPSERT_USER_SQL, _user_params(user_id, name, embedding, templates, now, gen),
                 )
 
         logger.debug(f"Upserted user id={user_id!r} name={name!r}")
         return {"id": user_id, "name": name, "created_at": now}
 
+    async def upsert_users(self, users: List[tuple]) -> int:
+        """
+        Insert or replace many users in ONE transaction (bulk enrollment).
+
+        Args:
+            users: [(user_id, name, embedding, templates_or_None), ...]
+
+        Returns:
+            Number of rows written.
+        """
+        if not users:
+            return 0
+        now = _utcnow()
+        async with self._session_factory() as session:
+            async with session.begin():
+                gen = await _bump_generation(session)
+                await session.execute(
+                    _UPSERT_USER_SQL,
+                    [_user_params(uid, name, emb, tpl, now, gen) for uid, name, emb, tpl in users],
+                )
+        logger.debug(f"Upserted {len(users)} users in one transaction")
+        return len(users)
+
     async def get_user(self, user_id: str) -> Optional[Dict[str, Any]]:
         """Retrieve a single user by id.  Returns None if not found."""
-        sql = text("SELECT id, name, embedding_vector, created_at FROM users WHERE id = :id")
-        async with self._session_factory() as session:
-            row = (await session.execute(sql, {"id": user_id})).one_or_none()
+        async with self._read_session_factory() as session:
+            row = (await session.execute(_GET_USER_SQL, {"id": user_id})).one_or_none()
         if row is None:
             return None
         return _row_to_user_dict(row)
@@ -197,7 +569,7 @@ class DBManager:
     async def get_all_users(self) -> List[Dict[str, Any]]:
         """Return all users WITHOUT the embedding vector (for list endpoints)."""
         sql = text("SELECT id, name, created_at FROM users ORDER BY name")
-        async with self._session_factory() as session:
+        async with self._read_session_factory() as session:
             rows = (await session.execute(sql)).all()
         return [{"id": r[0], "name": r[1], "created_at": r[2]} for r in rows]
 
@@ -206,11 +578,79 @@ class DBManager:
         Return all users INCLUDING their embedding vectors.
         Used by RecognitionEngine.load_embeddings_from_db().
         """
-        sql = text("SELECT id, name, embedding_vector, created_at FROM users")
-        async with self._session_factory() as session:
+        sql = text(f"SELECT {_USER_COLUMNS} FROM users")
+        async with self._read_session_factory() as session:
             rows = (await session.execute(sql)).all()
         return [_row_to_user_dict(r) for r in rows]
 
+    async def get_generation(self) -> int:
+        """Current value of the user-table generation counter."""
+        async with self._read_session_factory() as session:
+            value = (await session.execute(_GET_GENERATION_SQL)).scalar_one_or_none()
+        return int(value or 0)
+
+    async def get_user_changes_since(
+        self, generation: int,
+    ) -> tuple[List[Dict[str, Any]], List[str]]:
+        """
+        Users written and ids deleted after *generation*.
+
+        Returns:
+            (changed_users, deleted_ids) — changed users include their
+            embeddings.  An id can appear in both if it was deleted and
+            re-registered; the row in ``changed_users`` is the current state.
+        """
+        users_sql = text(f"SELECT {_USER_COLUMNS} FROM users WHERE generation > :gen")
+        tomb_sql = text("SELECT id FROM user_tombstones WHERE generation > :gen")
+        async with self._read_session_factory() as session:
+            rows = (await session.execute(users_sql, {"gen": generation})).all()
+            deleted = (await session.execute(tomb_sql, {"gen": generation})).scalars().all()
+        return [_row_to_user_dict(r) for r in rows], [str(d) for d in deleted]
+
+    async def migrate_embeddings_to_blob(self, batch_size: int = 500) -> int:
+        """
+        Convert users still stored as JSON text into BLOB embeddings.
+
+        Runs automatically from :meth:`create`; safe to call repeatedly.
+        Returns the number of rows converted.
+        """
+        select_sql = text(
+            """
+            SELECT id, embedding_vector FROM users
+            WHERE embedding IS NULL AND embedding_vector != ''
+            LIMIT :limit
+            """
+        )
+        update_sql = text(
+            """
+            UPDATE users
+            SET embedding = :emb, embedding_dtype = :dtype, embedding_dim = :dim,
+                embedding_vector = ''
+            WHERE id = :id
+            """
+        )
+
+        converted = 0
+        while True:
+            async with self._session_factory() as session:
+                async with session.begin():
+                    rows = (await session.execute(select_sql, {"limit": batch_size})).all()
+                    if not rows:
+                        break
+                    params = []
+                    for uid, emb_json in rows:
+                        emb_blob, emb_dim = _embedding_to_blob(np.asarray(json.loads(emb_json)))
+                        params.append({
+                            "id": uid, "emb": emb_blob,
+                            "dtype": _EMBEDDING_DTYPE.str, "dim": emb_dim,
+                        })
+                    await session.execute(update_sql, params)
+            converted += len(rows)
+
+        if converted:
+            logger.info(f"Migrated {converted} user embedding(s) from JSON to BLOB.")
+        return converted
+
     async def delete_user(self, user_id: str) -> bool:
         """
         Delete a user and cascade-delete their attendance records.
@@ -228,7 +668,19 @@ class DBManager:
                 if count == 0:
                     return False
                 await session.execute(delete_sql, {"id": user_id})
+                await self._drop_user_from_attendance_summary(session, user_id)
+                gen = await _bump_generation(session)
+                await session.execute(
+                    text(
+                        """
+                        INSERT INTO user_tombstones (id, generation) VALUES (:id, :gen)
+                        ON CONFLICT(id) DO UPDATE SET generation = excluded.generation
+                        """
+                    ),
+                    {"id": user_id, "gen": gen},
+                )
 
+        self._attended_today.discard(user_id)
         logger.info(f"Deleted user id={user_id!r}")
         return True
 
@@ -242,46 +694,141 @@ class DBManager:
         confidence: float = 0.0,
         status: str = "present",
         timestamp: Optional[str] = None,
+        wait: bool = True,
     ) -> Dict[str, Any]:
         """
-        Write an attendance record.
+        Write an attendance record through the write buffer.
 
         Args:
             user_id:    Must match an existing user id.
             confidence: Recognition confidence (cosine similarity).
             status:     "present" | "late" | "absent" — default "present".
             timestamp:  ISO-8601 string; defaults to UTC now.
+            wait:       Return only after the record's batch has committed.
+                        With False the record is queued, ``id`` is None and
+                        the user counts as attended once the batch commits.
 
         Returns:
             Dict with the new attendance record.
+
+        Raises:
+            UnknownUserError: if *user_id* is not registered (``wait`` only).
         """
-        ts = timestamp or _utcnow()
-        sql = text(
-            """
-            INSERT INTO attendance (user_id, timestamp, status, confidence)
-            VALUES (:user_id, :timestamp, :status, :confidence)
-            """
-        )
+        record = _attendance_record(user_id, confidence, status, timestamp)
+        (fut,) = self._attendance_writer.submit([record])
+        if not wait:
+            # Marked attended only once the batch has committed
+            fut.add_done_callback(functools.partial(self._on_attendance_written, record))
+            return {"id": None, **record}
+
+        # Marked right away so frames arriving during the flush window see
+        # it; undone if the write fails (unless an earlier record counts).
+        attended = user_id in self._attended_today
+        self._attended_today.add(user_id, record["timestamp"])
+        try:
+            record_id = await fut
+        except Exception:
+            if not attended:
+                self._attended_today.discard(user_id)
+            raise
+        return {"id": record_id, **record}
+
+    def _on_attendance_written(self, record: Dict[str, Any], fut: asyncio.Future) -> None:
+        """Done-callback of a ``wait=False`` record."""
+        exc = fut.exception()
+        if exc is not None:
+            logger.warning(f"Attendance for {record['user_id']!r} not written: {exc}")
+            return
+        self._attended_today.add(record["user_id"], record["timestamp"])
+
+    async def log_attendance_many(
+        self, records: List[Dict[str, Any]],
+    ) -> List[Optional[Dict[str, Any]]]:
+        """
+        Write many attendance records (e.g. an offline client catching up)
+        and wait for them to commit.
+
+        Each input dict takes the keyword arguments of :meth:`log_attendance`.
+        Returns one entry per input: the stored record, or None if its
+        user_id is not registered.
+        """
+        queued = [
+            _attendance_record(
+                r["user_id"], r.get("confidence", 0.0),
+                r.get("status", "present"), r.get("timestamp"),
+            )
+            for r in records
+        ]
+        futures = self._attendance_writer.submit(queued)
+        await self._attendance_writer.flush()
+        results = await asyncio.gather(*futures, return_exceptions=True)
+
+        # Only committed records mark their user as attended
+        out: List[Optional[Dict[str, Any]]] = []
+        error: Optional[BaseException] = None
+        for record, res in zip(queued, results):
+            if isinstance(res, UnknownUserError):
+                out.append(None)
+            elif isinstance(res, BaseException):
+                error = error or res
+            else:
+                self._attended_today.add(record["user_id"], record["timestamp"])
+                out.append({"id": res, **record})
+        if error is not None:
+            raise error
+        return out
+
+    async def flush_attendance(self) -> int:
+        """Commit every buffered attendance record now.  Returns rows written."""
+        return await self._attendance_writer.flush()
+
+    async def _insert_attendance_batch(
+        self, records: List[Dict[str, Any]],
+    ) -> List[Any]:
+        """
+        AttendanceWriter callback: insert *records* in one transaction.
+
+        Unknown user ids are checked once per batch (instead of per request)
+        and come back as :class:`UnknownUserError` without failing the rest.
+        """
+        wanted = list({r["user_id"] for r in records})
         async with self._session_factory() as session:
             async with session.begin():
-                result = await session.execute(
-                    sql,
-                    {
-                        "user_id":    user_id,
-                        "timestamp":  ts,
-                        "status":     status,
-                        "confidence": confidence,
-                    },
-                )
-                record_id = result.lastrowid
-
-        return {
-            "id":         record_id,
-            "user_id":    user_id,
-            "timestamp":  ts,
-            "status":     status,
-            "confidence": confidence,
-        }
+                known = set()
+                for i in range(0, len(wanted), _ID_LOOKUP_CHUNK):
+                    rows = await session.execute(
+                        _KNOWN_USER_IDS_SQL, {"ids": wanted[i:i + _ID_LOOKUP_CHUNK]}
+                    )
+                    known.update(r[0] for r in rows)
+
+                valid = [r for r in records if r["user_id"] in known]
+                next_id = 0
+                if valid:
+                    await session.execute(_INSERT_ATTENDANCE_SQL, valid)
+                    # Read before the summary upserts: they insert into rowid
+                    # tables too and would move last_insert_rowid().
+                    last_id = int((await session.execute(_LAST_INSERT_ROWID_SQL)).scalar_one())
+                    # AUTOINCREMENT rows inserted inside one write transaction
+                    # get consecutive ids, ending at last_insert_rowid().
+                    next_id = last_id - len(valid) + 1
+                    count, max_id = (await session.execute(
+                        _ATTENDANCE_IDS_FROM_SQL, {"first": next_id},
+                    )).one()
+                    if count != len(valid) or max_id != last_id:
+                        raise RuntimeError(
+                            f"Attendance ids {next_id}..{last_id} do not match the "
+                            f"{len(valid)} inserted row(s)"
+                        )
+                    await self._add_to_attendance_summary(session, valid)
+
+        results: List[Any] = []
+        for r in records:
+            if r["user_id"] in known:
+                results.append(next_id)
+                next_id += 1
+            else:
+                results.append(UnknownUserError(f"Unknown user_id {r['user_id']!r}"))
+        return results
 
     async def get_attendance(
         self,
@@ -289,72 +836,287 @@ class DBManager:
         date_from: Optional[str] = None,
         date_to: Optional[str] = None,
         limit: int = 200,
+        cursor: Optional[Tuple[str, int]] = None,
+        flush: bool = False,
     ) -> List[Dict[str, Any]]:
         """
-        Query attendance records with optional filters.
+        Query one page of attendance records, newest first.
 
         Args:
             user_id:    Filter by user.
             date_from:  ISO date string "YYYY-MM-DD" (inclusive).
             date_to:    ISO date string "YYYY-MM-DD" (inclusive).
             limit:      Maximum rows to return.
+            cursor:     ``(timestamp, id)`` of the last row of the previous
+                        page; only older rows are returned.  Keyset
+                        pagination stays O(limit) however deep the page.
+            flush:      Commit buffered attendance first so records still
+                        waiting in the write buffer are included.
         """
-        conditions = []
-        params: Dict[str, Any] = {"limit": limit}
-
-        if user_id:
-            conditions.append("a.user_id = :user_id")
-            params["user_id"] = user_id
-        if date_from:
-            conditions.append("a.timestamp >= :date_from")
-            params["date_from"] = date_from
-        if date_to:
-            conditions.append("a.timestamp <= :date_to")
-            params["date_to"] = date_to + "T23:59:59"
+        conditions, params = _attendance_filters(user_id, date_from, date_to)
+        params["limit"] = limit
+        if cursor is not None:
+            conditions.append("(a.timestamp, a.id) < (:cursor_ts, :cursor_id)")
+            params["cursor_ts"], params["cursor_id"] = cursor[0], int(cursor[1])
 
         where_clause = ("WHERE " + " AND ".join(conditions)) if conditions else ""
 
+        if flush:
+            await self._attendance_writer.flush()
+
         sql = text(
             f"""
             SELECT a.id, a.user_id, u.name, a.timestamp, a.status, a.confidence
             FROM attendance a
             JOIN users u ON u.id = a.user_id
             {where_clause}
-            ORDER BY a.timestamp DESC
+            ORDER BY a.timestamp DESC, a.id DESC
             LIMIT :limit
             """
         )
 
-        async with self._session_factory() as session:
+        async with self._read_session_factory() as session:
             rows = (await session.execute(sql, params)).all()
 
-        return [
-            {
-                "id":         r[0],
-                "user_id":    r[1],
-                "name":       r[2],
-                "timestamp":  r[3],
-                "status":     r[4],
-                "confidence": r[5],
-            }
-            for r in rows
-        ]
+        return [_row_to_attendance_dict(r) for r in rows]
 
-    async def has_attended_today(self, user_id: str) -> bool:
-        """Return True if the user already has an attendance record today (UTC)."""
-        today = datetime.now(timezone.utc).date().isoformat()
+    async def iter_attendance(
+        self,
+        user_id: Optional[str] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        flush: bool = False,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Yield every matching attendance record, oldest first, from a
+        server-side cursor (rows are fetched in small chunks, never all
+        materialised).  Used for report exports.  ``flush`` as in
+        :meth:`get_attendance`.
+        """
+        conditions, params = _attendance_filters(user_id, date_from, date_to)
+        where_clause = ("WHERE " + " AND ".join(conditions)) if conditions else ""
         sql = text(
-            """
-            SELECT COUNT(*) FROM attendance
-            WHERE user_id = :user_id
-              AND timestamp >= :today
+            f"""
+            SELECT a.id, a.user_id, u.name, a.timestamp, a.status, a.confidence
+            FROM attendance a
+            JOIN users u ON u.id = a.user_id
+            {where_clause}
+            ORDER BY a.timestamp, a.id
             """
         )
+
+        if flush:
+            await self._attendance_writer.flush()
+        async with self._read_session_factory() as session:
+            result = await session.stream(sql, params)
+            async for row in result:
+                yield _row_to_attendance_dict(row)
+
+    async def get_attendance_summary(
+        self,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        user_id: Optional[str] = None,
+        by: str = "day",
+        flush: bool = False,
+    ) -> List[Dict[str, Any]]:
+        """
+        Read attendance rollups from the summary tables.
+
+        Args:
+            date_from:  Attendance day "YYYY-MM-DD" (inclusive).
+            date_to:    Attendance day "YYYY-MM-DD" (inclusive).
+            user_id:    Restrict to one user (per-day rows for that user).
+            by:         "day"  → one row per day (all users, or *user_id*);
+                        "user" → one row per user over the date range.
+            flush:      Commit buffered attendance first so the rollups
+                        include records still waiting in the write buffer.
+
+        Days are calendar days in ``attendance_timezone``.
+        """
+        if by not in ("day", "user"):
+            raise ValueError(f"Unknown summary grouping {by!r} (expected 'day' or 'user')")
+        conditions: List[str] = []
+        params: Dict[str, Any] = {}
+        if date_from:
+            conditions.append("s.day >= :date_from")
+            params["date_from"] = date_from
+        if date_to:
+            conditions.append("s.day <= :date_to")
+            params["date_to"] = date_to
+        if user_id:
+            conditions.append("s.user_id = :user_id")
+            params["user_id"] = user_id
+        where_clause = ("WHERE " + " AND ".join(conditions)) if conditions else ""
+
+        counts = "s.records, s.present, s.late, s.absent, s.confidence_sum"
+        if by == "user":
+            sql = f"""
+                SELECT s.user_id, u.name, COUNT(*), MIN(s.first_seen), MAX(s.last_seen),
+                       SUM(s.records), SUM(s.present), SUM(s.late), SUM(s.absent),
+                       SUM(s.confidence_sum)
+                FROM attendance_user_daily s
+                JOIN users u ON u.id = s.user_id
+                {where_clause}
+                GROUP BY s.user_id
+                ORDER BY u.name
+            """
+            keys = ("user_id", "name", "days", "first_seen", "last_seen")
+        elif user_id:
+            sql = f"""
+                SELECT s.day, s.first_seen, s.last_seen, {counts}
+                FROM attendance_user_daily s
+                {where_clause}
+                ORDER BY s.day
+            """
+            keys = ("day", "first_seen", "last_seen")
+        else:
+            sql = f"""
+                SELECT s.day, s.users, {counts}
+                FROM attendance_daily s
+                {where_clause}
+                ORDER BY s.day
+            """
+            keys = ("day", "users")
+
+        if flush:
+            await self._attendance_writer.flush()
+        async with self._read_session_factory() as session:
+            rows = (await session.execute(text(sql), params)).all()
+
+        out = []
+        for r in rows:
+            n = len(keys)
+            item = dict(zip(keys, r[:n]))
+            records, present, late, absent, conf_sum = r[n:]
+            item.update({
+                "records":        records,
+                "present":        present,
+                "late":           late,
+                "absent":         absent,
+                "avg_confidence": (conf_sum / records) if records else 0.0,
+            })
+            out.append(item)
+        return out
+
+    async def rebuild_attendance_summary(self) -> int:
+        """
+        Recompute both summary tables from the attendance table (e.g. after
+        changing ``attendance_timezone``).  Returns the number of day rows.
+        """
+        await self._attendance_writer.flush()
         async with self._session_factory() as session:
-            count = (
-                await session.execute(sql, {"user_id": user_id, "today": today})
-            ).scalar_one()
-        return count > 0
+            async with session.begin():
+                await session.execute(text("DELETE FROM attendance_user_daily"))
+                await session.execute(text("DELETE FROM attendance_daily"))
+                rows = await session.stream(text(
+                    "SELECT user_id, timestamp, status, confidence FROM attendance"
+                ))
+                per_user: Dict[tuple, Dict[str, Any]] = {}
+                async for user_id, ts, status, conf in rows:
+                    _summary_accumulate(
+                        per_user, self._attendance_day(ts), user_id, ts, status, conf,
+                    )
+                if per_user:
+                    await session.execute(_UPSERT_USER_DAILY_SQL, list(per_user.values()))
+                    days = sorted({k[0] for k in per_user})
+                    for i in range(0, len(days), _ID_LOOKUP_CHUNK):
+                        await session.execute(
+                            _REFRESH_DAILY_SQL, {"days": days[i:i + _ID_LOOKUP_CHUNK]}
+                        )
+        n_days = len({k[0] for k in per_user})
+        logger.info(f"Attendance summary rebuilt: {n_days} day(s), {len(per_user)} user-day row(s).")
+        return n_days
+
+    async def _backfill_attendance_summary(self) -> None:
+        """Build the summaries once for databases that predate them."""
+        sql = text(
+            """
+            SELECT EXISTS (SELECT 1 FROM attendance),
+                   EXISTS (SELECT 1 FROM attendance_user_daily)
+            """
+        )
+        async with self._read_session_factory() as session:
+            has_rows, has_summary = (await session.execute(sql)).one()
+        if has_rows and not has_summary:
+            await self.rebuild_attendance_summary()
+
+    async def _add_to_attendance_summary(
+        self, session, records: List[Dict[str, Any]],
+    ) -> None:
+        """Fold newly inserted *records* into the summaries (caller's transaction)."""
+        per_user: Dict[tuple, Dict[str, Any]] = {}
+        for r in records:
+            _summary_accumulate(
+                per_user, self._attendance_day(r["timestamp"]),
+                r["user_id"], r["timestamp"], r["status"], r["confidence"],
+            )
+
+        # (day, user) pairs not seen before add one to that day's user count
+        existing = set()
+        for day in {k[0] for k in per_user}:
+            users = [k[1] for k in per_user if k[0] == day]
+            for i in range(0, len(users), _ID_LOOKUP_CHUNK):
+                rows = await session.execute(
+                    _EXISTING_USER_DAYS_SQL,
+                    {"day": day, "ids": users[i:i + _ID_LOOKUP_CHUNK]},
+                )
+                existing.update((day, r[0]) for r in rows)
+
+        per_day: Dict[str, Dict[str, Any]] = {}
+        for key, row in per_user.items():
+            day = per_day.setdefault(key[0], {
+                "day": key[0], "users": 0, "records": 0, "present": 0,
+                "late": 0, "absent": 0, "confidence_sum": 0.0,
+            })
+            day["users"] += key not in existing
+            for col in ("records", *_ATTENDANCE_STATUSES, "confidence_sum"):
+                day[col] += row[col]
+
+        await session.execute(_UPSERT_USER_DAILY_SQL, list(per_user.values()))
+        await session.execute(_UPSERT_DAILY_SQL, list(per_day.values()))
+
+    async def _drop_user_from_attendance_summary(self, session, user_id: str) -> None:
+        """Remove a deleted user's summary rows and recompute the affected days."""
+        days = [
+            r[0] for r in await session.execute(
+                text("SELECT day FROM attendance_user_daily WHERE user_id = :id"),
+                {"id": user_id},
+            )
+        ]
+        if not days:
+            return
+        await session.execute(
+            text("DELETE FROM attendance_user_daily WHERE user_id = :id"), {"id": user_id}
+        )
+        for i in range(0, len(days), _ID_LOOKUP_CHUNK):
+            chunk = days[i:i + _ID_LOOKUP_CHUNK]
+            await session.execute(_DELETE_DAILY_SQL, {"days": chunk})
+            await session.execute(_REFRESH_DAILY_SQL, {"days": chunk})
+
+    def _attendance_day(self, timestamp: str) -> str:
+        """Summary day of *timestamp* in ``attendance_timezone``."""
+        day = self._attended_today.day_of(timestamp)
+        return day.isoformat() if day is not None else str(timestamp)[:10]
+
+    async def has_attended_today(self, user_id: str) -> bool:
+        """
+        Return True if the user already has an attendance record today
+        (the current day in ``attendance_timezone``).
+
+        Answered from memory; records count as soon as they are queued.
+        """
+        return user_id in self._attended_today
+
+    async def _load_attended_today(self) -> None:
+        """Fill the in-memory attended set from today's attendance rows."""
+        sql = text("SELECT user_id, timestamp FROM attendance WHERE timestamp >= :since")
+        async with self._read_session_factory() as session:
+            rows = (
+                await session.execute(sql, {"since": self._attended_today.load_since()})
+            ).all()
+        n = self._attended_today.load(rows)
+        logger.info(f"Attendance: {n} user(s) already marked today.")
 
 
 # ---------------------------------------------------------------------------
@@ -365,12 +1127,140 @@ def _utcnow() -> str:
     return datetime.now(timezone.utc).isoformat()
 
 
+def _attendance_filters(
+    user_id: Optional[str], date_from: Optional[str], date_to: Optional[str],
+) -> Tuple[List[str], Dict[str, Any]]:
+    """WHERE conditions + bind params shared by the attendance queries."""
+    conditions: List[str] = []
+    params: Dict[str, Any] = {}
+    if user_id:
+        conditions.append("a.user_id = :user_id")
+        params["user_id"] = user_id
+    if date_from:
+        conditions.append("a.timestamp >= :date_from")
+        params["date_from"] = date_from
+    if date_to:
+        conditions.append("a.timestamp <= :date_to")
+        params["date_to"] = date_to + "T23:59:59"
+    return conditions, params
+
+
+def _summary_accumulate(
+    per_user: Dict[tuple, Dict[str, Any]],
+    day: str,
+    user_id: str,
+    timestamp: str,
+    status: str,
+    confidence: Optional[float],
+) -> None:
+    """Add one attendance record to the (day, user_id) summary rows in *per_user*."""
+    row = per_user.get((day, user_id))
+    if row is None:
+        row = per_user[(day, user_id)] = {
+            "day": day, "user_id": user_id,
+            "first_seen": timestamp, "last_seen": timestamp,
+            "records": 0, "present": 0, "late": 0, "absent": 0, "confidence_sum": 0.0,
+        }
+    row["first_seen"] = min(row["first_seen"], timestamp)
+    row["last_seen"] = max(row["last_seen"], timestamp)
+    row["records"] += 1
+    if status in _ATTENDANCE_STATUSES:
+        row[status] += 1
+    row["confidence_sum"] += float(confidence or 0.0)
+
+
+def _row_to_attendance_dict(row) -> Dict[str, Any]:
+    """Convert (id, user_id, name, timestamp, status, confidence) to dict."""
+    return {
+        "id":         row[0],
+        "user_id":    row[1],
+        "name":       row[2],
+        "timestamp":  row[3],
+        "status":     row[4],
+        "confidence": row[5],
+    }
+
+
+def _attendance_record(
+    user_id: str, confidence: float, status: str, timestamp: Optional[str],
+) -> Dict[str, Any]:
+    """Bind parameters for ``_INSERT_ATTENDANCE_SQL`` (also the returned record)."""
+    return {
+        "user_id":    user_id,
+        "timestamp":  timestamp or _utcnow(),
+        "status":     status,
+        "confidence": confidence,
+    }
+
+
+async def _bump_generation(session) -> int:
+    """Increment the user-table generation inside the caller's transaction."""
+    await session.execute(
+        text("UPDATE schema_meta SET value = value + 1 WHERE key = 'generation'")
+    )
+    value = (await session.execute(_GET_GENERATION_SQL)).scalar_one()
+    return int(value)
+
+
+def _user_params(
+    user_id: str,
+    name: str,
+    embedding: np.ndarray,
+    templates: Optional[np.ndarray],
+    created_at: str,
+    generation: int,
+) -> Dict[str, Any]:
+    """Bind parameters for ``_UPSERT_USER_SQL``."""
+    emb_blob, emb_dim = _embedding_to_blob(embedding)
+    tpl_blob = None
+    if templates is not None and len(templates) > 0:
+        tpl_blob = np.ascontiguousarray(templates, dtype=_EMBEDDING_DTYPE).tobytes()
+    return {
+        "id":         user_id,
+        "name":       name,
+        "created_at": created_at,
+        "emb":        emb_blob,
+        "dtype":      _EMBEDDING_DTYPE.str,
+        "dim":        emb_dim,
+        "tpl":        tpl_blob,
+        "gen":        generation,
+    }
+
+
+def _embedding_to_blob(embedding: np.ndarray) -> tuple:
+    """Serialise an embedding to raw little-endian float32 bytes → (blob, dim)."""
+    vec = np.ascontiguousarray(np.asarray(embedding).flatten(), dtype=_EMBEDDING_DTYPE)
+    return vec.tobytes(), int(vec.shape[0])
+
+
+def _blob_to_embedding(blob: bytes, dtype: Optional[str], dim: Optional[int]) -> np.ndarray:
+    """Decode a BLOB embedding written by :func:`_embedding_to_blob`."""
+    vec = np.frombuffer(blob, dtype=np.dtype(dtype or _EMBEDDING_DTYPE))
+    if dim is not None and vec.shape[0] != dim:
+        raise ValueError(f"Embedding BLOB has {vec.shape[0]} values, expected {dim}")
+    return vec.astype(np.float32, copy=False)
+
+
 def _row_to_user_dict(row) -> Dict[str, Any]:
-    """Convert a DB row (id, name, embedding_vector, created_at) to dict."""
-    emb_list = json.loads(row[2])
+    """
+    Convert a DB row (id, name, embedding_vector, created_at, embedding,
+    embedding_dtype, embedding_dim, templates) to dict.
+
+    ``embedding_vector`` is a float32 numpy array, read from the BLOB column
+    (or parsed from legacy JSON text for rows not yet migrated).
+    ``templates`` is a (K, D) float32 array, or None for single-embedding users.
+    """
+    if row[4] is not None:
+        emb = _blob_to_embedding(row[4], row[5], row[6])
+    else:
+        emb = np.asarray(json.loads(row[2]), dtype=np.float32)
+    templates = None
+    if row[7] is not None:
+        templates = _blob_to_embedding(row[7], row[5], None).reshape(-1, emb.shape[0])
     return {
         "id":               row[0],
         "name":             row[1],
-        "embedding_vector": emb_list,
+        "embedding_vector": emb,
+        "templates":        templates,
         "created_at":       row[3],
     }
@@ -16,7 +16,9 @@ Both networks output a 3-class softmax:
     class 2 → replay attack (phone/monitor screen)
 
 The wrapper loads both models, runs inference, and combines their outputs
-by averaging the softmax probabilities (ensemble).
+by averaging the softmax probabilities (ensemble).  ``predict_batch`` scores
+every face of a frame at once: one (N, 3, 80, 80) tensor, one forward pass
+per model and a single device → host copy, instead of N × 2 of each.
 
 If the pretrained weights are not found, the module emits a clear error.
 """
@@ -27,14 +29,13 @@ import math
 from pathlib import Path
 from typing import List, Optional, Tuple, Union
 
-import cv2
 import numpy as np
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
 from loguru import logger
 
-from utils.preprocessing import to_antispoof_tensor, ANTISPOOF_INPUT_SIZE
+from utils.preprocessing import to_antispoof_batch
 
 
 # ---------------------------------------------------------------------------
@@ -341,33 +342,42 @@ class AntiSpoofDetector:
         Returns:
             :class:`AntiSpoofDetector.Result`
         """
+        return self.predict_batch([face_crop_bgr])[0]
+
+    def predict_batch(self, face_crops_bgr: List[np.ndarray]) -> List["AntiSpoofDetector.Result"]:
+        """
+        Classify several face crops (e.g. every face in a frame) together.
+
+        Args:
+            face_crops_bgr: BGR uint8 arrays of any size (resized to 80×80).
+
+        Returns:
+            One :class:`AntiSpoofDetector.Result` per crop, in order.
+        """
+        if not face_crops_bgr:
+            return []
         if not self._models:
             logger.error("No anti-spoof models loaded — defaulting to 'real'.")
             dummy = np.array([1.0, 0.0, 0.0], dtype=np.float32)
-            return self.Result(False, "real", 1.0, dummy)
+            return [self.Result(False, "real", 1.0, dummy.copy()) for _ in face_crops_bgr]
 
-        # Resize to anti-spoof input
-        resized = cv2.resize(face_crop_bgr, ANTISPOOF_INPUT_SIZE)
-        tensor = to_antispoof_tensor(resized, self.device)
+        batch = to_antispoof_batch(face_crops_bgr, self.device)   # (N, 3, 80, 80)
 
-        probs_list: List[np.ndarray] = []
         with torch.no_grad():
-            for model in self._models:
-                logits = model(tensor)              # (1, num_classes)
-                prob = F.softmax(logits, dim=1).squeeze().cpu().numpy()
-                probs_list.append(prob)
-
-        # Ensemble: arithmetic mean of probability vectors
-        avg_probs = np.mean(probs_list, axis=0).astype(np.float32)
+            # Ensemble: arithmetic mean of the per-model softmax, on device
+            probs = torch.stack([F.softmax(model(batch), dim=1) for model in self._models])
+            avg_probs = probs.mean(dim=0).cpu().numpy().astype(np.float32)   # (N, num_classes)
 
-        pred_class = int(np.argmax(avg_probs))
-        label = SPOOF_LABELS.get(pred_class, "unknown")
-        real_confidence = float(avg_probs[0])
+        pred_classes = avg_probs.argmax(axis=1)
+        real_confidence = avg_probs[:, 0]
         is_spoof = real_confidence < self.real_threshold
 
-        return self.Result(
-            is_spoof=is_spoof,
-            label=label,
-            real_confidence=real_confidence,
-            class_probs=avg_probs,
-        )
+        return [
+            self.Result(
+                is_spoof=bool(is_spoof[i]),
+                label=SPOOF_LABELS.get(int(pred_classes[i]), "unknown"),
+                real_confidence=float(real_confidence[i]),
+                class_probs=avg_probs[i],
+            )
+            for i in range(len(face_crops_bgr))
+        ]
@@ -0,0 +1,394 @@
+"""
+bulk_enrollment.py
+------------------
+Bulk enrollment of whole sections from a folder tree or an archive.
+
+Input layout (directory, .tar[.gz] or .zip)::
+
+    <root>/
+        2021-00123/            ← folder name = student / user id
+            name.txt           ← optional display name (defaults to the id)
+            front.jpg
+            left.jpg
+            ...
+        2021-00124/
+            ...
+
+Each identity goes through the registration pipeline (detection, one batched
+embedding pass, template selection) as one call on the server's shared
+InferencePool, so bulk work counts against the same cap and load-shedding as
+kiosk recognition.  A job keeps at most half of the pool's workers busy and
+backs off while the pool is saturated, instead of starving live traffic.  Finished identities
+are written with ONE DB transaction per batch, and the live index (when an
+engine is serving) is updated in bulk at the end.  A JSON checkpoint lists
+every committed id, so an interrupted job resumes where it stopped.
+
+Usage (CLI)
+-----------
+    python recognition/bulk_enrollment.py datasets/section_a \\
+        --db database/embeddings.db --workers 4 --batch-size 64
+
+    python recognition/bulk_enrollment.py section_a.tar.gz --checkpoint a.ckpt.json
+
+The CLI writes to the database only; a running API server picks the new users
+up on its next start (index snapshot replay).  Use
+``POST /api/v1/enroll/bulk`` to enroll into a live server.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tarfile
+import time
+import zipfile
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import AsyncIterator, BinaryIO, Dict, Iterable, Iterator, List, Optional, Union
+
+import cv2
+import numpy as np
+from loguru import logger
+
+_ROOT = Path(__file__).resolve().parent.parent
+if str(_ROOT) not in sys.path:
+    sys.path.insert(0, str(_ROOT))
+
+from api.inference_pool import InferenceBusy, InferencePool
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+NAME_FILE = "name.txt"
+
+# Wait before re-submitting an identity while the inference pool is saturated
+_BUSY_BACKOFF_S = 0.25
+
+
+# ---------------------------------------------------------------------------
+# Sources
+# ---------------------------------------------------------------------------
+
+@dataclass
+class EnrollmentItem:
+    """One identity to enroll.  ``images`` are file paths or raw bytes."""
+    student_id: str
+    name: str
+    images: List[Union[Path, bytes]] = field(default_factory=list)
+
+
+def iter_directory(root: Union[str, Path]) -> Iterator[EnrollmentItem]:
+    """Yield one item per ``<root>/<student_id>/`` folder (sorted by id)."""
+    root = Path(root)
+    for folder in sorted(p for p in root.iterdir() if p.is_dir()):
+        images = sorted(
+            p for p in folder.iterdir()
+            if p.is_file() and p.suffix.lower() in IMAGE_EXTENSIONS
+        )
+        name_file = folder / NAME_FILE
+        name = name_file.read_text(encoding="utf-8").strip() if name_file.exists() else ""
+        yield EnrollmentItem(folder.name, name or folder.name, images)
+
+
+def _split_member(path: str) -> Optional[tuple]:
+    """``[prefix/]student_id/file`` → (student_id, file), else None."""
+    parts = [p for p in path.replace("\\", "/").split("/") if p and p != "."]
+    if len(parts) < 2 or parts[-1].startswith("."):
+        return None
+    return parts[-2], parts[-1]
+
+
+def _add_member(items: Dict[str, EnrollmentItem], sid: str, fname: str, data: bytes) -> None:
+    item = items.setdefault(sid, EnrollmentItem(sid, sid))
+    if fname == NAME_FILE:
+        item.name = data.decode("utf-8", "replace").strip() or sid
+    elif fname.lower().endswith(IMAGE_EXTENSIONS):
+        item.images.append(data)
+
+
+def iter_archive(fileobj: BinaryIO, filename: str = "") -> Iterator[EnrollmentItem]:
+    """
+    Yield identities from a zip or tar(.gz/.bz2/.xz) stream.
+
+    Tar archives are read as a stream; an identity is emitted as soon as the
+    next folder starts, so members must be grouped by folder (as ``tar -c``
+    writes them).  Zip archives need a seekable file; the central directory
+    is grouped by folder and only one folder's members are decompressed at a
+    time.
+    """
+    if filename.lower().endswith(".zip") or (fileobj.seekable() and zipfile.is_zipfile(fileobj)):
+        fileobj.seek(0)
+        with zipfile.ZipFile(fileobj) as zf:
+            folders: Dict[str, List[tuple]] = {}
+            for info in zf.infolist():
+                split = None if info.is_dir() else _split_member(info.filename)
+                if split:
+                    folders.setdefault(split[0], []).append((split[1], info))
+            for sid in sorted(folders):
+                items: Dict[str, EnrollmentItem] = {}
+                for fname, info in folders.pop(sid):
+                    _add_member(items, sid, fname, zf.read(info))
+                yield items[sid]
+        return
+
+    if fileobj.seekable():
+        fileobj.seek(0)
+    with tarfile.open(fileobj=fileobj, mode="r|*") as tf:
+        current: Dict[str, EnrollmentItem] = {}
+        for member in tf:
+            split = _split_member(member.name) if member.isfile() else None
+            if not split:
+                continue
+            if current and split[0] not in current:
+                yield current.popitem()[1]
+            _add_member(current, split[0], split[1], tf.extractfile(member).read())
+        if current:
+            yield current.popitem()[1]
+
+
+def open_source(path: Union[str, Path]) -> Iterator[EnrollmentItem]:
+    """Items from a directory or an archive file on disk."""
+    path = Path(path)
+    if path.is_dir():
+        yield from iter_directory(path)
+        return
+    with open(path, "rb") as f:
+        yield from iter_archive(f, path.name)
+
+
+# ---------------------------------------------------------------------------
+# Checkpoint
+# ---------------------------------------------------------------------------
+
+class EnrollmentCheckpoint:
+    """JSON file of committed / failed ids; rewritten atomically per batch."""
+
+    def __init__(self, path: Optional[Union[str, Path]]):
+        self.path = Path(path) if path else None
+        self.done: set = set()
+        self.failed: Dict[str, str] = {}
+        if self.path is not None and self.path.exists():
+            data = json.loads(self.path.read_text())
+            self.done = set(data.get("done", []))
+            self.failed = dict(data.get("failed", {}))
+
+    def save(self) -> None:
+        if self.path is None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        tmp.write_text(json.dumps({"done": sorted(self.done), "failed": self.failed}))
+        os.replace(tmp, self.path)
+
+
+# ---------------------------------------------------------------------------
+# Job
+# ---------------------------------------------------------------------------
+
+class BulkEnrollment:
+    """
+    Runs the registration pipeline over many identities.
+
+    Args:
+        engine:         RecognitionEngine used for detection / embedding.
+        db:             DBManager to write users to.
+        pool:           Shared InferencePool the per-identity work runs on.
+                        None creates a private pool of ``workers`` threads
+                        (CLI use).
+        workers:        Identities processed in parallel (on a shared pool,
+                        at most half of its workers).
+        batch_size:     Identities per DB transaction.
+        min_images:     Usable faces required per identity.
+        checkpoint:     Path of the resume checkpoint (None = no checkpoint).
+        update_index:   Add the enrolled users to ``engine``'s live index.
+    """
+
+    def __init__(
+        self,
+        engine,
+        db,
+        pool: Optional[InferencePool] = None,
+        workers: int = 4,
+        batch_size: int = 64,
+        min_images: int = 1,
+        checkpoint: Optional[Union[str, Path]] = None,
+        update_index: bool = True,
+    ):
+        self.engine = engine
+        self.db = db
+        self.pool = pool
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.min_images = max(1, min_images)
+        self.checkpoint = EnrollmentCheckpoint(checkpoint)
+        self.update_index = update_index
+
+    def _process(self, item: EnrollmentItem) -> tuple:
+        """Worker: decode → detect → embed one identity.  Returns a result tuple."""
+        frames = []
+        for src in item.images:
+            data = src.read_bytes() if isinstance(src, Path) else src
+            img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if img is not None:
+                frames.append(img)
+        if not frames:
+            return item, None, None, "no decodable images"
+
+        crops = self.engine.registration_crops(frames)
+        embedding, templates, num_valid = self.engine.registration_templates_from_crops(
+            crops, self.min_images,
+        )
+        if embedding is None:
+            return item, None, None, f"only {num_valid} usable face(s) in {len(frames)} image(s)"
+        return item, embedding, templates, None
+
+    async def _submit(self, pool: InferencePool, item: EnrollmentItem) -> tuple:
+        """Run :meth:`_process` on *pool*, waiting while it sheds load."""
+        while True:
+            try:
+                return await pool.run(self._process, item)
+            except InferenceBusy:
+                await asyncio.sleep(_BUSY_BACKOFF_S)
+
+    async def run(self, items: Iterable[EnrollmentItem]) -> AsyncIterator[dict]:
+        """
+        Enroll *items*, yielding progress events (``{"stage": ...}``) after
+        every committed batch and a final ``"done"`` event with the report.
+        """
+        if self.pool is not None:
+            pool, own_pool = self.pool, False
+            in_flight = min(self.workers, max(1, pool.workers // 2))
+        else:
+            pool, own_pool = InferencePool(workers=self.workers, max_queue=self.workers), True
+            in_flight = self.workers
+        started = time.monotonic()
+        source = iter(items)
+        pending: set = set()
+        batch: List[tuple] = []
+        enrolled_users: List[tuple] = []
+        counts = {"enrolled": 0, "failed": 0, "skipped": 0}
+
+        def progress(stage: str) -> dict:
+            elapsed = time.monotonic() - started
+            done = counts["enrolled"] + counts["failed"]
+            return {
+                "stage": stage,
+                **counts,
+                "elapsed_s": round(elapsed, 2),
+                "identities_per_sec": round(done / elapsed, 2) if elapsed > 0 else 0.0,
+            }
+
+        async def commit() -> None:
+            if batch:
+                await self.db.upsert_users(batch)
+                self.checkpoint.done.update(uid for uid, _, _, _ in batch)
+                for uid, _, _, _ in batch:
+                    self.checkpoint.failed.pop(uid, None)
+                if self.update_index:
+                    enrolled_users.extend(batch)
+                counts["enrolled"] += len(batch)
+                batch.clear()
+            self.checkpoint.save()
+
+        try:
+            exhausted = False
+            while not exhausted or pending:
+                # Keep the workers fed (reading the source may block on I/O)
+                while not exhausted and len(pending) < in_flight:
+                    item = await asyncio.to_thread(next, source, None)
+                    if item is None:
+                        exhausted = True
+                    elif item.student_id in self.checkpoint.done:
+                        counts["skipped"] += 1
+                    else:
+                        pending.add(asyncio.ensure_future(self._submit(pool, item)))
+                if not pending:
+                    break
+
+                finished, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for fut in finished:
+                    item, embedding, templates, error = fut.result()
+                    if error:
+                        counts["failed"] += 1
+                        self.checkpoint.failed[item.student_id] = error
+                        logger.warning(f"Bulk enroll: skipped {item.student_id!r}: {error}")
+                    else:
+                        batch.append((item.student_id, item.name, embedding, templates))
+
+                if len(batch) >= self.batch_size:
+                    await commit()
+                    yield progress("batch")
+
+            await commit()
+        finally:
+            for fut in pending:
+                fut.cancel()
+            if own_pool:
+                pool.shutdown()
+
+        if enrolled_users:
+            self.engine.add_many_to_index(enrolled_users)
+        report = progress("done")
+        report["failures"] = dict(self.checkpoint.failed)
+        logger.info(
+            f"Bulk enroll finished: {counts['enrolled']} enrolled, {counts['failed']} failed, "
+            f"{counts['skipped']} skipped in {report['elapsed_s']}s "
+            f"({report['identities_per_sec']} identities/s)"
+        )
+        yield report
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Bulk-enroll students from a student_id/*.jpg folder tree or archive."
+    )
+    parser.add_argument("source", help="Directory, .zip or .tar[.gz] archive")
+    parser.add_argument("--db", default=os.getenv("DB_PATH", "database/embeddings.db"),
+                        help="SQLite database path")
+    parser.add_argument("--workers", type=int, default=4, help="Identities processed in parallel")
+    parser.add_argument("--batch-size", type=int, default=64, help="Identities per DB transaction")
+    parser.add_argument("--min-images", type=int, default=1, help="Usable faces required per identity")
+    parser.add_argument("--checkpoint", default=None,
+                        help="Resume checkpoint file (default: <source>.enroll-checkpoint.json)")
+    return parser.parse_args()
+
+
+async def _main(args: argparse.Namespace) -> None:
+    from database.db_manager import DBManager
+    from recognition.recognition_engine import RecognitionEngine
+
+    db = await DBManager.create(args.db)
+    engine = RecognitionEngine(
+        model_name=os.getenv("MODEL_NAME", "Facenet512"),
+        detector_backend=os.getenv("DETECTOR_BACKEND", "mtcnn"),
+        sim_threshold=float(os.getenv("SIM_THRESHOLD", "0.4")),
+        anti_spoofing=False,
+        db_manager=db,
+    )
+    checkpoint = args.checkpoint or f"{Path(args.source).resolve()}.enroll-checkpoint.json"
+    job = BulkEnrollment(
+        engine, db,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        min_images=args.min_images,
+        checkpoint=checkpoint,
+        update_index=False,
+    )
+    try:
+        async for event in job.run(open_source(args.source)):
+            logger.info(json.dumps(event))
+    finally:
+        await db.close()
+
+
+def main():
+    asyncio.run(_main(parse_args()))
+
+
+if __name__ == "__main__":
+    main()
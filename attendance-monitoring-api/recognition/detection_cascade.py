@@ -0,0 +1,259 @@
+"""
+detection_cascade.py
+--------------------
+Cheap first-stage face detector that gates the expensive DeepFace detector.
+
+MTCNN / RetinaFace build a full image pyramid for every frame, even when the
+kiosk is looking at an empty corridor.  A Haar cascade on a small grey copy
+of the frame costs a few milliseconds and is enough to answer "is there
+anything face-like here, and roughly where?":
+
+  frame ──► downscale + grey ──► Haar cascade ──► candidate boxes
+                                                     │
+                       none ─► no faces (MTCNN skipped)
+                       some ─► "gate": MTCNN on the full frame
+                               "roi":  MTCNN on padded regions around them
+
+ROIs are padded generously (``pad`` × box size on every side) so the aligned
+detector and the FasNet anti-spoof crop (2.7× / 4× the face box) still see
+the context they expect.  Crops are always cut from the full-resolution
+frame; only the cascade sees the downscaled copy.
+
+:class:`DetectionSettings` holds the per-session knobs applied before any
+of this: a kiosk region of interest (faces outside it are never searched)
+and a detector input scale.  Detection cost grows with the square of the
+input size, so ``scale=0.5`` makes the heavy pass roughly 4× cheaper; the
+engine maps boxes back and re-cuts aligned crops from the full frame.
+
+Environment variables:
+    DETECT_CASCADE        "off", "gate" or "roi"                  (default: gate)
+    DETECT_CASCADE_WIDTH  Width of the frame copy the cascade sees (default: 480)
+    DETECT_CASCADE_PAD    ROI padding per side, × candidate size   (default: 1.5)
+    DETECT_SCALE          Default detector input scale, 0.25–1    (default: 1.0)
+    DETECT_ROI            Default kiosk ROI "x1,y1,x2,y2" as frame fractions (default: whole frame)
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+from loguru import logger
+
+CASCADE_MODES = ("off", "gate", "roi")
+
+# Fall back to one full-frame pass when the ROIs cover this much of the frame
+_ROI_MAX_AREA_FRACTION = 0.5
+
+Box = Tuple[int, int, int, int]
+
+_MIN_DETECT_SCALE = 0.25
+
+
+@dataclass(frozen=True)
+class DetectionSettings:
+    """
+    Per-session detection input settings.
+
+    Attributes:
+        scale: Detector input scale (``_MIN_DETECT_SCALE``–1).  Boxes are
+               mapped back to full-resolution coordinates.
+        roi:   (x1, y1, x2, y2) as fractions of the frame, or None for the
+               whole frame.  A kiosk typically uses the middle third,
+               ``(0.33, 0.0, 0.67, 1.0)``.
+    """
+    scale: float = 1.0
+    roi: Optional[Tuple[float, float, float, float]] = None
+
+    def __post_init__(self):
+        if not _MIN_DETECT_SCALE <= self.scale <= 1.0:
+            raise ValueError(f"Detection scale must be in [{_MIN_DETECT_SCALE}, 1], got {self.scale}")
+        if self.roi is not None:
+            x1, y1, x2, y2 = self.roi
+            if not (0.0 <= x1 < x2 <= 1.0 and 0.0 <= y1 < y2 <= 1.0):
+                raise ValueError(f"Detection ROI must be fractions x1 < x2, y1 < y2 in [0, 1], got {self.roi}")
+
+    @classmethod
+    def from_env(cls) -> "DetectionSettings":
+        roi = os.getenv("DETECT_ROI", "").strip()
+        return cls(
+            scale=float(os.getenv("DETECT_SCALE", "1.0")),
+            roi=_parse_roi(roi.split(",")) if roi else None,
+        )
+
+    @classmethod
+    def from_dict(cls, data: Optional[dict], default: "DetectionSettings") -> "DetectionSettings":
+        """Settings from a request body (``{"scale", "roi"}``); missing keys keep *default*."""
+        if not data:
+            return default
+        roi = data.get("roi", default.roi)
+        return cls(
+            scale=float(data.get("scale", default.scale)),
+            roi=_parse_roi(roi) if roi else None,
+        )
+
+    @property
+    def is_default(self) -> bool:
+        return self.scale >= 1.0 and self.roi is None
+
+    def roi_pixels(self, frame_shape: Tuple[int, ...]) -> Box:
+        """ROI in pixel coordinates for a frame of *frame_shape*."""
+        h, w = frame_shape[:2]
+        if self.roi is None:
+            return (0, 0, w, h)
+        x1, y1, x2, y2 = self.roi
+        return (int(x1 * w), int(y1 * h), max(int(x1 * w) + 1, int(x2 * w)), max(int(y1 * h) + 1, int(y2 * h)))
+
+
+def _parse_roi(values: Sequence) -> Tuple[float, float, float, float]:
+    if len(values) != 4:
+        raise ValueError(f"Detection ROI needs 4 values (x1, y1, x2, y2), got {list(values)}")
+    return tuple(float(v) for v in values)
+
+
+def _haar_path() -> Optional[str]:
+    data_dir = getattr(getattr(cv2, "data", None), "haarcascades", None)
+    if not data_dir or not hasattr(cv2, "CascadeClassifier"):
+        return None
+    path = os.path.join(data_dir, "haarcascade_frontalface_default.xml")
+    return path if os.path.isfile(path) else None
+
+
+def padded_rois(boxes: np.ndarray, frame_shape: Tuple[int, ...], pad: float) -> List[Box]:
+    """
+    Pad (x1, y1, x2, y2) *boxes* by ``pad`` × their size on every side,
+    clip to the frame, and merge overlapping regions.
+    """
+    h, w = frame_shape[:2]
+    rois: List[List[int]] = []
+    for x1, y1, x2, y2 in np.asarray(boxes, dtype=np.float32).reshape(-1, 4):
+        px, py = pad * (x2 - x1), pad * (y2 - y1)
+        rois.append([
+            max(0, int(x1 - px)), max(0, int(y1 - py)),
+            min(w, int(np.ceil(x2 + px))), min(h, int(np.ceil(y2 + py))),
+        ])
+
+    # Merge until no two regions overlap (a face is never split between two)
+    merged = True
+    while merged and len(rois) > 1:
+        merged = False
+        for i in range(len(rois)):
+            for j in range(i + 1, len(rois)):
+                a, b = rois[i], rois[j]
+                if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                    rois[i] = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+                    del rois[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return [tuple(r) for r in rois]
+
+
+class DetectionCascade:
+    """
+    Haar-cascade pre-detector deciding where (and whether) to run the heavy
+    detector.
+
+    Args:
+        mode:          "off" | "gate" | "roi" (see module docstring).
+        width:         Frames wider than this are downscaled for the cascade.
+        pad:           ROI padding per side, as a multiple of the candidate size.
+        min_face_size: Smallest face of interest in full-resolution pixels.
+    """
+
+    def __init__(
+        self,
+        mode: str = "gate",
+        width: int = 480,
+        pad: float = 1.5,
+        min_face_size: int = 60,
+    ):
+        if mode not in CASCADE_MODES:
+            raise ValueError(f"Unknown cascade mode {mode!r}; expected one of {CASCADE_MODES}")
+        self.width = max(64, width)
+        self.pad = max(0.0, pad)
+        self.min_face_size = max(1, min_face_size)
+        self._haar_path = _haar_path() if mode != "off" else None
+        # CascadeClassifier is not safe to share between inference threads
+        self._local = threading.local()
+        if mode != "off" and self._haar_path is None:
+            logger.warning("Haar cascade data not found; detection cascade disabled.")
+            mode = "off"
+        self.mode = mode
+
+        self.frames = 0
+        self.skipped = 0        # no candidate → heavy detector not run
+        self.roi_passes = 0     # heavy detector run on ROIs only
+
+    @classmethod
+    def from_env(cls, min_face_size: int = 60) -> "DetectionCascade":
+        return cls(
+            mode=os.getenv("DETECT_CASCADE", "gate").lower(),
+            width=int(os.getenv("DETECT_CASCADE_WIDTH", "480")),
+            pad=float(os.getenv("DETECT_CASCADE_PAD", "1.5")),
+            min_face_size=min_face_size,
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off"
+
+    def candidates(self, img_bgr: np.ndarray) -> np.ndarray:
+        """Face-like boxes as an (K, 4) float32 array in full-frame coordinates."""
+        h, w = img_bgr.shape[:2]
+        scale = min(1.0, self.width / float(w))
+        grey = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2GRAY) if img_bgr.ndim == 3 else img_bgr
+        if scale < 1.0:
+            grey = cv2.resize(grey, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
+
+        # Lenient settings: a false candidate only costs one heavy pass,
+        # a missed one loses the face for this frame.
+        min_side = max(20, int(self.min_face_size * scale * 0.8))
+        found = self._classifier().detectMultiScale(
+            grey, scaleFactor=1.1, minNeighbors=3, minSize=(min_side, min_side),
+        )
+        if len(found) == 0:
+            return np.zeros((0, 4), dtype=np.float32)
+        boxes = np.asarray(found, dtype=np.float32)
+        boxes[:, 2:] += boxes[:, :2]
+        return boxes / scale
+
+    def _classifier(self) -> cv2.CascadeClassifier:
+        clf = getattr(self._local, "clf", None)
+        if clf is None:
+            clf = self._local.clf = cv2.CascadeClassifier(self._haar_path)
+        return clf
+
+    def plan(self, img_bgr: np.ndarray) -> Optional[List[Box]]:
+        """
+        Regions the heavy detector should search.
+
+        Returns [] to skip the frame, None for one full-frame pass, or a
+        list of (x1, y1, x2, y2) ROIs.
+        """
+        self.frames += 1
+        boxes = self.candidates(img_bgr)
+        if len(boxes) == 0:
+            self.skipped += 1
+            return []
+        if self.mode != "roi":
+            return None
+        rois = padded_rois(boxes, img_bgr.shape, self.pad)
+        area = sum((x2 - x1) * (y2 - y1) for x1, y1, x2, y2 in rois)
+        if area >= _ROI_MAX_AREA_FRACTION * img_bgr.shape[0] * img_bgr.shape[1]:
+            return None
+        self.roi_passes += 1
+        return rois
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "frames": self.frames,
+            "skipped": self.skipped,
+            "roi_passes": self.roi_passes,
+        }
@@ -0,0 +1,439 @@
+"""
+face_tracker.py
+---------------
+Lightweight frame-to-frame face tracker for streaming recognition.
+
+A kiosk sees the same student for many consecutive frames.  Re-running the
+embedding model on every one of them is wasted work, so each stream keeps a
+FaceTracker that:
+
+  1. Associates the faces detected in a frame with existing tracks
+     (greedy IoU, then a centroid-distance fallback for fast movement).
+  2. Reuses the last *confirmed* identity of a track instead of embedding
+     the face again.
+  3. Schedules a fresh embedding only when
+       - the track is new or still unidentified,
+       - ``reembed_every`` frames have passed since the last embedding,
+       - the box drifted (IoU with the box at last embedding < ``drift_iou``), or
+       - the face appearance changed (16×16 grey thumbnail mean abs diff
+         > ``appearance_threshold``).
+
+Liveness is tracked per face as well.  A live person does not stop being
+live between frames, so the anti-spoof model runs on a track only while its
+evidence is still being gathered (the first ``liveness_min_checks`` checks),
+every ``liveness_every`` frames after that, when the box jumps (IoU with
+the box at the last check < ``liveness_jump_iou``), whenever the face is
+re-embedded, and on every frame while the latest check disagrees with the
+accumulated verdict.  Evidence is dropped when the track's identity changes.  Each check's P(real)
+is folded into a running average weighted by its confidence (|2p − 1|, so a
+coin-flip score adds nothing) and decayed by ``liveness_decay`` so a phone
+swapped in front of the camera outweighs older evidence within a few checks.
+Every face is reported with the track's accumulated verdict, except on a
+frame whose check carried no evidence (a failed check), which keeps that
+check's own result.
+
+Spoofed faces are never served from the identity cache; only confirmed,
+live tracks reuse their identity fields.
+
+One tracker per stream (WebSocket connection); it is not thread-safe.
+"""
+
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from utils.similarity import SessionStore
+
+# Result fields copied from the last confirmed match onto reused faces
+_IDENTITY_FIELDS = ("matched", "studentId", "name", "studentNumber", "confidence")
+
+_THUMB_SIZE = (16, 16)
+
+
+# ---------------------------------------------------------------------------
+# Geometry helpers
+# ---------------------------------------------------------------------------
+
+def _face_bbox(face: dict) -> Tuple[float, float, float, float]:
+    fa = face.get("facial_area", {})
+    x, y = float(fa.get("x", 0)), float(fa.get("y", 0))
+    return (x, y, x + float(fa.get("w", 0)), y + float(fa.get("h", 0)))
+
+
+def _real_probability(face: dict) -> float:
+    """P(real) from DeepFace's ``is_real`` / ``antispoof_score`` (score of the predicted label)."""
+    score = float(face.get("antispoof_score", 1.0))
+    return score if face.get("is_real", True) else 1.0 - score
+
+
+def _clear_liveness(track: "Track") -> None:
+    track.live_sum = 0.0
+    track.live_weight = 0.0
+    track.live_checks = 0
+    track.live_last = 1.0
+    track.live_bbox = None
+
+
+def iou_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    Pairwise IoU between two sets of (x1, y1, x2, y2) boxes.
+
+    Args:
+        a: shape (N, 4)
+        b: shape (M, 4)
+
+    Returns:
+        (N, M) float32 IoU matrix.
+    """
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)), dtype=np.float32)
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - inter
+    return (inter / np.maximum(union, 1e-6)).astype(np.float32)
+
+
+def _thumbnail(face_crop: Optional[np.ndarray]) -> Optional[np.ndarray]:
+    """Tiny grey thumbnail used as a cheap appearance signature."""
+    if face_crop is None or face_crop.size == 0:
+        return None
+    img = face_crop
+    if img.dtype != np.uint8:
+        img = np.clip(img * (255.0 if img.max() <= 1.0 else 1.0), 0, 255).astype(np.uint8)
+    if img.ndim == 3:
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    return cv2.resize(img, _THUMB_SIZE, interpolation=cv2.INTER_AREA).astype(np.float32) / 255.0
+
+
+# ---------------------------------------------------------------------------
+# Track state
+# ---------------------------------------------------------------------------
+
+@dataclass
+class Track:
+    """State for one tracked face."""
+    track_id: int
+    bbox: Tuple[float, float, float, float]
+    last_seen: int
+    embed_bbox: Optional[Tuple[float, float, float, float]] = None
+    embed_thumb: Optional[np.ndarray] = None
+    frames_since_embed: int = 0
+    identity: Optional[dict] = None          # confirmed match fields, or None
+    live_sum: float = 0.0                    # Σ weight · P(real), decayed
+    live_weight: float = 0.0                 # Σ weight, decayed
+    live_checks: int = 0
+    live_last: float = 1.0                   # P(real) of the latest check
+    live_bbox: Optional[Tuple[float, float, float, float]] = None
+    frames_since_live: int = 0
+
+
+@dataclass
+class TrackPlan:
+    """Per-face decision for the current frame."""
+    track_id: int
+    needs_embedding: bool
+    thumb: Optional[np.ndarray] = None
+    needs_liveness: bool = True
+
+
+class FaceTracker:
+    """
+    IoU / centroid tracker that decides which faces need a fresh embedding.
+
+    Args:
+        iou_threshold:        Minimum IoU to continue a track.
+        centroid_threshold:   Fallback: max centroid distance, as a fraction
+                              of the track's box diagonal.
+        max_missed:           Drop a track after this many frames unseen.
+        reembed_every:        Re-verify a confirmed identity every N frames.
+        drift_iou:            Re-embed if IoU with the box at the last
+                              embedding falls below this.
+        appearance_threshold: Re-embed if the thumbnail mean abs diff
+                              exceeds this (0–1 scale).
+        liveness_every:       Re-run anti-spoofing on a track every N frames.
+        liveness_min_checks:  Confident checks gathered before the cached
+                              verdict is trusted.
+        liveness_jump_iou:    Re-check if IoU with the box at the last check
+                              falls below this.
+        liveness_decay:       Weight kept by older evidence per new check.
+    """
+
+    def __init__(
+        self,
+        iou_threshold: float = 0.3,
+        centroid_threshold: float = 0.5,
+        max_missed: int = 5,
+        reembed_every: int = 10,
+        drift_iou: float = 0.5,
+        appearance_threshold: float = 0.12,
+        liveness_every: int = 5,
+        liveness_min_checks: int = 3,
+        liveness_jump_iou: float = 0.5,
+        liveness_decay: float = 0.8,
+    ):
+        self.iou_threshold = iou_threshold
+        self.centroid_threshold = centroid_threshold
+        self.max_missed = max(1, max_missed)
+        self.reembed_every = max(1, reembed_every)
+        self.drift_iou = drift_iou
+        self.appearance_threshold = appearance_threshold
+        self.liveness_every = max(1, liveness_every)
+        self.liveness_min_checks = max(1, liveness_min_checks)
+        self.liveness_jump_iou = liveness_jump_iou
+        self.liveness_decay = min(1.0, max(0.0, liveness_decay))
+
+        self._tracks: Dict[int, Track] = {}
+        self._next_id = 1
+        self._frame_no = 0
+        self._session_version: Optional[int] = None
+
+        self.embeddings_requested = 0
+        self.embeddings_skipped = 0
+        self.liveness_checked = 0
+        self.liveness_skipped = 0
+
+    @classmethod
+    def from_env(cls) -> "FaceTracker":
+        return cls(
+            iou_threshold=float(os.getenv("TRACK_IOU_THRESHOLD", "0.3")),
+            max_missed=int(os.getenv("TRACK_MAX_MISSED", "5")),
+            reembed_every=int(os.getenv("TRACK_REEMBED_EVERY", "10")),
+            drift_iou=float(os.getenv("TRACK_DRIFT_IOU", "0.5")),
+            appearance_threshold=float(os.getenv("TRACK_APPEARANCE_THRESHOLD", "0.12")),
+            liveness_every=int(os.getenv("TRACK_LIVENESS_EVERY", "5")),
+            liveness_min_checks=int(os.getenv("TRACK_LIVENESS_MIN_CHECKS", "3")),
+            liveness_jump_iou=float(os.getenv("TRACK_LIVENESS_JUMP_IOU", "0.5")),
+            liveness_decay=float(os.getenv("TRACK_LIVENESS_DECAY", "0.8")),
+        )
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    def reset(self) -> None:
+        """Forget all tracks (e.g. when the class session changes)."""
+        self._tracks.clear()
+
+    def sync_session(self, session_store: SessionStore) -> None:
+        """
+        Drop cached identities when a session has been loaded or cleared.
+
+        A plain dict has no version, so changes to it are not detected.
+        """
+        version = getattr(session_store, "version", 0)
+        if version != self._session_version:
+            self._session_version = version
+            self.reset()
+
+    def plan(self, faces: List[dict]) -> List[TrackPlan]:
+        """
+        Associate *faces* with tracks and decide which need embedding and
+        which need a fresh liveness check.
+
+        Must be followed by :meth:`apply_liveness` and :meth:`merge` for the
+        same frame.
+        """
+        self._frame_no += 1
+        boxes = np.array([_face_bbox(f) for f in faces], dtype=np.float32).reshape(-1, 4)
+        assignment = self._associate(boxes)
+
+        plans: List[TrackPlan] = []
+        for i, face in enumerate(faces):
+            bbox = tuple(float(v) for v in boxes[i])
+            track_id = assignment.get(i)
+            if track_id is None:
+                track_id = self._next_id
+                self._next_id += 1
+                self._tracks[track_id] = Track(track_id=track_id, bbox=bbox, last_seen=self._frame_no)
+            track = self._tracks[track_id]
+            track.bbox = bbox
+            track.last_seen = self._frame_no
+            track.frames_since_embed += 1
+            track.frames_since_live += 1
+
+            thumb = _thumbnail(face.get("face"))
+            needs = self._needs_embedding(track, thumb)
+            if needs:
+                self.embeddings_requested += 1
+            else:
+                self.embeddings_skipped += 1
+            # Never embed (and possibly re-identify) a face on cached liveness
+            live = needs or self._needs_liveness(track)
+            if live:
+                self.liveness_checked += 1
+            else:
+                self.liveness_skipped += 1
+            plans.append(TrackPlan(
+                track_id=track_id, needs_embedding=needs, thumb=thumb, needs_liveness=live,
+            ))
+
+        # Expire tracks that have not been seen for a while
+        for tid in [t for t, tr in self._tracks.items()
+                    if self._frame_no - tr.last_seen > self.max_missed]:
+            del self._tracks[tid]
+        return plans
+
+    @staticmethod
+    def liveness_due(plans: List[TrackPlan]) -> List[int]:
+        """Indices of the faces whose anti-spoof check must run this frame."""
+        return [i for i, p in enumerate(plans) if p.needs_liveness]
+
+    def apply_liveness(self, plans: List[TrackPlan], faces: List[dict]) -> List[dict]:
+        """
+        Fold this frame's anti-spoof results (``is_real`` / ``antispoof_score``
+        on the faces that were checked) into their tracks, then set every
+        face's fields to its track's accumulated verdict.
+        """
+        for plan, face in zip(plans, faces):
+            track = self._tracks.get(plan.track_id)
+            if track is None:
+                continue
+            if plan.needs_liveness and "is_real" in face:
+                p_real = _real_probability(face)
+                weight = abs(2.0 * p_real - 1.0)
+                if weight == 0.0:
+                    # No evidence either way (e.g. a failed check): the
+                    # frame keeps the check's own verdict.
+                    continue
+                track.live_sum = track.live_sum * self.liveness_decay + weight * p_real
+                track.live_weight = track.live_weight * self.liveness_decay + weight
+                track.live_checks += 1
+                track.live_last = p_real
+                track.frames_since_live = 0
+                track.live_bbox = track.bbox
+            if track.live_weight > 0.0:
+                p_real = track.live_sum / track.live_weight
+                face["is_real"] = p_real >= 0.5
+                face["antispoof_score"] = p_real if p_real >= 0.5 else 1.0 - p_real
+        return faces
+
+    def filter_crops(
+        self, crops: List[Optional[np.ndarray]], plans: List[TrackPlan],
+    ) -> List[Optional[np.ndarray]]:
+        """Blank out crops whose track can reuse its cached identity."""
+        return [c if p.needs_embedding else None for c, p in zip(crops, plans)]
+
+    def merge(self, plans: List[TrackPlan], result_faces: List[dict]) -> List[dict]:
+        """
+        Fill reused faces from their track's cached identity and record new
+        confirmed matches.  Adds ``trackId`` and ``reused`` to every face.
+        """
+        for plan, rf in zip(plans, result_faces):
+            track = self._tracks.get(plan.track_id)
+            rf["trackId"] = plan.track_id
+            rf["reused"] = False
+            if track is None:
+                continue
+
+            if rf.get("spoofDetected"):
+                # Never serve an identity to a track judged a spoof.
+                track.identity = None
+                continue
+
+            if plan.needs_embedding:
+                track.frames_since_embed = 0
+                track.embed_bbox = track.bbox
+                track.embed_thumb = plan.thumb
+                identity = (
+                    {k: rf.get(k) for k in _IDENTITY_FIELDS} if rf.get("matched") else None
+                )
+                if track.identity is not None and (
+                    identity is None or identity["studentId"] != track.identity["studentId"]
+                ):
+                    # A different face now holds this track; its liveness
+                    # evidence belongs to the previous one.
+                    _clear_liveness(track)
+                track.identity = identity
+            elif track.identity is not None:
+                rf.update(track.identity)
+                rf["reused"] = True
+        return result_faces
+
+    def __len__(self) -> int:
+        return len(self._tracks)
+
+    def __repr__(self) -> str:
+        return (
+            f"FaceTracker(tracks={len(self)}, embedded={self.embeddings_requested}, "
+            f"skipped={self.embeddings_skipped}, liveness_checked={self.liveness_checked}, "
+            f"liveness_skipped={self.liveness_skipped})"
+        )
+
+    # ------------------------------------------------------------------
+    # Internals
+    # ------------------------------------------------------------------
+
+    def _needs_embedding(self, track: Track, thumb: Optional[np.ndarray]) -> bool:
+        if track.identity is None or track.embed_bbox is None:
+            return True
+        if track.frames_since_embed >= self.reembed_every:
+            return True
+        drift = iou_matrix(
+            np.array([track.bbox], dtype=np.float32),
+            np.array([track.embed_bbox], dtype=np.float32),
+        )[0, 0]
+        if drift < self.drift_iou:
+            return True
+        if thumb is not None and track.embed_thumb is not None:
+            if float(np.abs(thumb - track.embed_thumb).mean()) > self.appearance_threshold:
+                return True
+        return False
+
+    def _needs_liveness(self, track: Track) -> bool:
+        if track.live_checks < self.liveness_min_checks or track.live_bbox is None:
+            return True
+        if track.frames_since_live >= self.liveness_every:
+            return True
+        if (track.live_last >= 0.5) != (track.live_sum >= 0.5 * track.live_weight):
+            return True
+        jump = iou_matrix(
+            np.array([track.bbox], dtype=np.float32),
+            np.array([track.live_bbox], dtype=np.float32),
+        )[0, 0]
+        return bool(jump < self.liveness_jump_iou)
+
+    def _associate(self, boxes: np.ndarray) -> Dict[int, int]:
+        """Greedy IoU matching, then centroid fallback.  Returns {det_idx: track_id}."""
+        if len(boxes) == 0 or not self._tracks:
+            return {}
+        track_ids = list(self._tracks.keys())
+        track_boxes = np.array([self._tracks[t].bbox for t in track_ids], dtype=np.float32)
+
+        assignment: Dict[int, int] = {}
+        ious = iou_matrix(boxes, track_boxes)
+        work = ious.copy()
+        while work.size:
+            d, t = divmod(int(np.argmax(work)), work.shape[1])
+            if work[d, t] < self.iou_threshold:
+                break
+            assignment[d] = track_ids[t]
+            work[d, :] = -1.0
+            work[:, t] = -1.0
+
+        # Centroid fallback for fast moves that break IoU
+        used = set(assignment.values())
+        det_c = (boxes[:, :2] + boxes[:, 2:]) / 2.0
+        trk_c = (track_boxes[:, :2] + track_boxes[:, 2:]) / 2.0
+        trk_diag = np.linalg.norm(track_boxes[:, 2:] - track_boxes[:, :2], axis=1)
+        for d in range(len(boxes)):
+            if d in assignment:
+                continue
+            dist = np.linalg.norm(trk_c - det_c[d], axis=1) / np.maximum(trk_diag, 1e-6)
+            for t in np.argsort(dist):
+                if dist[t] > self.centroid_threshold:
+                    break
+                if track_ids[t] not in used:
+                    assignment[d] = track_ids[t]
+                    used.add(track_ids[t])
+                    break
+        return assignment
@@ -0,0 +1,178 @@
+"""
+inference_scheduler.py
+----------------------
+Micro-batching scheduler for the embedding model.
+
+Every connected WebSocket client runs face detection for its own frame, then
+hands its face crops to the scheduler.  The scheduler collects crops from all
+clients for a short window (or until a crop budget is reached), runs them
+through the embedding model as ONE batch, and routes each slice of the result
+back to the client that submitted it.
+
+  kiosk A ──crops──┐
+  kiosk B ──crops──┼──► [window: ≤ BATCH_WINDOW_MS or ≤ BATCH_MAX_CROPS]
+  camera  ──crops──┘            ↓
+                       get_embeddings_batch(all crops)   (one forward pass)
+                                ↓
+                  split rows ─► A / B / camera futures
+
+With a single active stream the window is skipped, so a lone kiosk sees no
+added latency.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures as _cf
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+EmbedFn = Callable[[List[Optional[np.ndarray]]], Tuple[np.ndarray, List[int]]]
+
+
+class InferenceScheduler:
+    """
+    Gathers face crops from concurrent clients into shared model batches.
+
+    Args:
+        embed_fn:   Batched embedding function, normally
+                    ``RecognitionEngine.get_embeddings_batch``.  Takes a list of
+                    crops and returns ``(embeddings, rows)``.
+        window_ms:  How long to wait for other clients before flushing.
+        max_crops:  Flush as soon as this many crops are queued.
+    """
+
+    def __init__(
+        self,
+        embed_fn: EmbedFn,
+        window_ms: float = 15.0,
+        max_crops: int = 32,
+    ):
+        self._embed_fn = embed_fn
+        self.window_s = max(0.0, window_ms) / 1000.0
+        self.max_crops = max(1, max_crops)
+
+        # The model runs on one dedicated thread: batches are serialised, and
+        # the event loop is never blocked by a forward pass.
+        self._executor = _cf.ThreadPoolExecutor(max_workers=1, thread_name_prefix="embed-batch")
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._active_streams = 0
+
+        self.batches_run = 0
+        self.crops_embedded = 0
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+
+    def start(self) -> None:
+        """Start the batching loop (must be called from a running event loop)."""
+        if self._task is not None:
+            return
+        self._queue = asyncio.Queue()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        logger.info(
+            f"InferenceScheduler started (window={self.window_s * 1000:.0f} ms, "
+            f"max_crops={self.max_crops})"
+        )
+
+    async def stop(self) -> None:
+        """Stop the batching loop and release the model thread."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._executor.shutdown(wait=False)
+
+    def stream_opened(self) -> None:
+        """Register a streaming client (enables the batching window)."""
+        self._active_streams += 1
+
+    def stream_closed(self) -> None:
+        self._active_streams = max(0, self._active_streams - 1)
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    async def embed(
+        self, crops: List[Optional[np.ndarray]],
+    ) -> Tuple[np.ndarray, List[int]]:
+        """
+        Embed *crops* as part of the next shared batch.
+
+        Returns the same ``(embeddings, rows)`` shape as ``embed_fn``, with
+        ``rows`` indexing into *crops*.
+        """
+        if self._queue is None:
+            raise RuntimeError("InferenceScheduler.start() has not been called")
+        if not any(c is not None and c.size > 0 for c in crops):
+            return self._embed_fn([])
+
+        fut = asyncio.get_running_loop().create_future()
+        await self._queue.put((crops, fut))
+        return await fut
+
+    # ------------------------------------------------------------------
+    # Batching loop
+    # ------------------------------------------------------------------
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            pending = [await self._queue.get()]
+            n_crops = len(pending[0][0])
+
+            if self._active_streams > 1:
+                deadline = loop.time() + self.window_s
+                while n_crops < self.max_crops:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                    pending.append(item)
+                    n_crops += len(item[0])
+
+            # Drop requests whose client went away while waiting
+            pending = [(crops, fut) for crops, fut in pending if not fut.done()]
+            if not pending:
+                continue
+
+            flat = [c for crops, _ in pending for c in crops]
+            try:
+                embs, rows = await loop.run_in_executor(self._executor, self._embed_fn, flat)
+            except Exception as exc:
+                logger.warning(f"InferenceScheduler batch failed: {exc}")
+                for _, fut in pending:
+                    if not fut.done():
+                        fut.set_exception(exc)
+                continue
+
+            self.batches_run += 1
+            self.crops_embedded += len(rows)
+
+            # Route each slice of the batch back to its client
+            rows_arr = np.asarray(rows, dtype=np.intp)
+            offset = 0
+            for crops, fut in pending:
+                end = offset + len(crops)
+                sel = np.nonzero((rows_arr >= offset) & (rows_arr < end))[0]
+                if not fut.done():
+                    fut.set_result((embs[sel], [int(rows_arr[j]) - offset for j in sel]))
+                offset = end
+
+    def __repr__(self) -> str:
+        return (
+            f"InferenceScheduler(window_ms={self.window_s * 1000:.0f}, "
+            f"max_crops={self.max_crops}, batches={self.batches_run}, "
+            f"crops={self.crops_embedded})"
+        )
@@ -5,6 +5,8 @@ Orchestrates the full face recognition pipeline using DeepFace:
 
   Camera Frame
        ↓
+  [Haar pre-detector on a downscaled copy — skips empty frames]
+       ↓
   Face Detection  (DeepFace — configurable backend: mtcnn, retinaface, etc.)
        ↓
   Anti-Spoof Check (DeepFace FasNet — MiniFASNet ensemble with original weights)
@@ -38,7 +40,17 @@ if str(_ROOT) not in sys.path:
     sys.path.insert(0, str(_ROOT))
 
 from deepface import DeepFace
-from utils.similarity import FaissIndex, average_embeddings, l2_normalize
+from recognition.detection_cascade import DetectionCascade, DetectionSettings
+from recognition.face_tracker import FaceTracker
+from utils.similarity import (
+    FaissIndex,
+    SessionGallery,
+    SessionStore,
+    average_embeddings,
+    l2_normalize,
+    select_templates,
+    top2_scores,
+)
 
 
 # ---------------------------------------------------------------------------
@@ -115,6 +127,7 @@ class RecognitionEngine:
         self.detector_backend = detector_backend
         self.sim_threshold = sim_threshold
         self.anti_spoofing_enabled = anti_spoofing
+        self._antispoof_model = None
         self._db = db_manager
 
         # Session (kiosk) matching guardrails.
@@ -125,12 +138,24 @@ class RecognitionEngine:
         self.min_match_margin = float(os.getenv("MIN_MATCH_MARGIN", "0.06"))
         self.min_match_margin = max(0.0, min(0.2, self.min_match_margin))
         self.session_faiss_fallback = os.getenv("SESSION_FAISS_FALLBACK", "false").lower() == "true"
+        # Diverse templates kept per registered user (1 = averaged embedding only)
+        self.max_templates = max(1, int(os.getenv("MAX_TEMPLATES", "5")))
+
+        # Cheap pre-detector gating the DeepFace detector on streaming frames
+        self._cascade = DetectionCascade.from_env(
+            min_face_size=int(getattr(self, "min_face_size", 60)),
+        )
+        # Detection scale / kiosk ROI: env default, overridable per session
+        self._default_detection = DetectionSettings.from_env()
+        self._session_detection: Optional[DetectionSettings] = None
 
         logger.info("Initialising RecognitionEngine (DeepFace)")
         logger.info(f"  model_name:       {model_name}")
         logger.info(f"  detector_backend: {detector_backend}")
         logger.info(f"  sim_threshold:    {sim_threshold}")
         logger.info(f"  anti_spoofing:    {anti_spoofing}")
+        logger.info(f"  detect_cascade:   {self._cascade.mode}")
+        logger.info(f"  detect_settings:  {self._default_detection}")
 
         # Pre-load models so first request isn't slow
         logger.info("Pre-loading DeepFace recognition model...")
@@ -144,7 +169,7 @@ class RecognitionEngine:
             try:
                 import torch  # noqa: F401
                 logger.info("Pre-loading DeepFace anti-spoofing model (FasNet)...")
-                DeepFace.build_model("Fasnet", task="spoofing")
+                self._antispoof_model = DeepFace.build_model("Fasnet", task="spoofing")
             except Exception as exc:
                 self.anti_spoofing_enabled = False
                 logger.warning(
@@ -155,8 +180,16 @@ class RecognitionEngine:
         self._embedding_dim = _MODEL_DIMS.get(model_name, 512)
         logger.info(f"  embedding_dim:    {self._embedding_dim}")
 
+        # Batched embedding path (one forward pass for all faces in a frame)
+        self._batch_model = None
+        self._batch_input_size: Tuple[int, int] = (0, 0)
+        if os.getenv("BATCH_EMBEDDING", "true").lower() == "true":
+            self._init_batch_embedder()
+        logger.info(f"  batch_embedding:  {self._batch_model is not None}")
+
         # In-memory vector index
-        self._index: FaissIndex = FaissIndex(embedding_dim=self._embedding_dim)
+        self._index: FaissIndex = FaissIndex.from_env(embedding_dim=self._embedding_dim)
+        logger.info(f"  index_type:       {self._index.index_type}")
         self._name_cache: dict[str, str] = {}
 
         logger.info("RecognitionEngine (DeepFace) ready.")
@@ -168,56 +201,228 @@ class RecognitionEngine:
     def set_db_manager(self, db_manager) -> None:
         self._db = db_manager
 
-    async def load_embeddings_from_db(self) -> int:
+    async def load_embeddings_from_db(self, snapshot_dir: Optional[str] = None) -> int:
+        """
+        Populate the index from the database.
+
+        With *snapshot_dir*, a saved index snapshot is loaded first and only
+        the users written or deleted since its DB generation are replayed;
+        the refreshed snapshot is then written back.  Without a usable
+        snapshot every user row is loaded.
+        """
         if self._db is None:
             logger.warning("No DB manager set. Index will be empty.")
             return 0
 
-        users = await self._db.get_all_users_with_embeddings()
-        loaded = 0
+        generation = await self._db.get_generation()
+        snap_gen = self._index.load(snapshot_dir) if snapshot_dir else None
+        if snap_gen is not None and snap_gen > generation:
+            logger.warning(
+                f"Index snapshot generation {snap_gen} is ahead of the DB ({generation}); "
+                "rebuilding from the database."
+            )
+            self._index = FaissIndex.from_env(embedding_dim=self._embedding_dim)
+            snap_gen = None
+
+        if snap_gen is None:
+            users = await self._db.get_all_users_with_embeddings()
+            replayed = len(users)
+        else:
+            users, deleted = await self._db.get_user_changes_since(snap_gen)
+            for uid in set(deleted) | {str(u["id"]) for u in users}:
+                self._index.remove(uid)
+            replayed = len(users) + len(deleted)
+            logger.info(
+                f"Loaded index snapshot (generation {snap_gen}, {len(self._index)} vectors); "
+                f"replaying {len(users)} changed / {len(deleted)} deleted user(s)."
+            )
+
+        labels: List[str] = []
+        blocks: List[np.ndarray] = []
         for user in users:
             uid = str(user["id"])
-            name = user.get("name", uid)
-            emb = np.array(user["embedding_vector"], dtype=np.float32)
+            emb = np.asarray(user["embedding_vector"], dtype=np.float32)
             if len(emb) != self._embedding_dim:
                 logger.warning(
                     f"Skipping user {uid}: embedding dim {len(emb)} != "
                     f"{self._embedding_dim}. Re-register with the new model."
                 )
                 continue
-            self._index.add(uid, emb)
-            self._name_cache[uid] = name
-            loaded += 1
+            # Multi-template users index every template; others their mean
+            block = user.get("templates")
+            if block is None:
+                block = emb.reshape(1, -1)
+            labels.extend([uid] * len(block))
+            blocks.append(block)
+        if blocks:
+            self._index.add_batch(labels, np.concatenate(blocks))
+
+        # Names come from the cheap id/name query; embeddings are not re-read
+        self._name_cache = {str(u["id"]): u.get("name", str(u["id"]))
+                            for u in await self._db.get_all_users()}
+
+        if snapshot_dir and (snap_gen is None or replayed):
+            try:
+                self._index.save(snapshot_dir, generation)
+            except OSError as exc:
+                logger.warning(f"Could not write index snapshot to {snapshot_dir}: {exc}")
 
-        logger.info(f"Loaded {loaded} user embeddings into FAISS index.")
+        # Train the ANN index (if configured) now rather than on the first query
+        self._index.build_ann()
+
+        loaded = self._index.num_identities
+        logger.info(
+            f"Loaded {loaded} user(s) ({len(self._index)} template vectors) into FAISS index."
+        )
         return loaded
 
-    def add_to_index(self, user_id: str, name: str, embedding: np.ndarray) -> None:
-        self._index.add(user_id, embedding)
+    def add_to_index(
+        self,
+        user_id: str,
+        name: str,
+        embedding: np.ndarray,
+        templates: Optional[np.ndarray] = None,
+    ) -> None:
+        """Index a (re-)registered user, replacing any vectors they had."""
+        self._index.remove(user_id)
+        if templates is not None and len(templates) > 0:
+            self._index.add_batch([user_id] * len(templates), templates)
+        else:
+            self._index.add(user_id, embedding)
         self._name_cache[user_id] = name
 
+    def add_many_to_index(self, users: List[tuple]) -> None:
+        """
+        Bulk form of :meth:`add_to_index` — one ``add_batch`` for all users.
+
+        Args:
+            users: [(user_id, name, embedding, templates_or_None), ...]
+        """
+        labels: List[str] = []
+        blocks: List[np.ndarray] = []
+        for user_id, name, embedding, templates in users:
+            self._index.remove(user_id)
+            block = templates if templates is not None and len(templates) > 0 else embedding
+            block = np.asarray(block, dtype=np.float32).reshape(-1, self._embedding_dim)
+            labels.extend([user_id] * len(block))
+            blocks.append(block)
+            self._name_cache[user_id] = name
+        if blocks:
+            self._index.add_batch(labels, np.concatenate(blocks))
+
     def remove_from_index(self, user_id: str) -> None:
         self._index.remove(user_id)
         self._name_cache.pop(user_id, None)
 
+    @property
+    def detection_settings(self) -> DetectionSettings:
+        """Scale / ROI used for session (kiosk) detection."""
+        return self._session_detection or self._default_detection
+
+    def set_session_detection(self, data: Optional[dict]) -> DetectionSettings:
+        """
+        Apply ``{"scale", "roi"}`` from /load-session (None restores the
+        DETECT_SCALE / DETECT_ROI defaults).  Raises ValueError when invalid.
+        """
+        settings = DetectionSettings.from_dict(data, self._default_detection)
+        self._session_detection = None if data is None else settings
+        return settings
+
+    def detection_stats(self) -> dict:
+        """Pre-detector counters (frames seen / skipped / ROI-only passes)."""
+        return self._cascade.stats()
+
+    def index_stats(self) -> dict:
+        return self._index.stats()
+
     # ------------------------------------------------------------------
     # DeepFace wrappers
     # ------------------------------------------------------------------
 
-    def _detect_faces(self, img_bgr: np.ndarray) -> List[dict]:
+    def _detect_faces(
+        self,
+        img_bgr: np.ndarray,
+        cascade: bool = False,
+        settings: Optional[DetectionSettings] = None,
+        anti_spoofing: Optional[bool] = None,
+    ) -> List[dict]:
         """
         Detect faces with optional anti-spoofing via DeepFace.
 
+        With ``cascade=True`` (streaming / recognition frames) the Haar
+        pre-detector runs first: frames without a candidate return [] without
+        touching DeepFace, and in "roi" mode DeepFace only searches padded
+        regions around the candidates.  Registration keeps the full pass.
+
+        *settings* restrict the search to a region of interest and/or run
+        the detector on a downscaled copy.  Boxes are always returned in
+        full-frame coordinates and crops come from the full-resolution frame.
+        On those passes FasNet runs afterwards on the full frame, not on the
+        downscaled or clipped region the detector saw.
+
+        ``anti_spoofing=False`` skips the per-face FasNet pass (callers that
+        cache liveness per track run :meth:`check_liveness` themselves).
+
         Returns list of dicts from DeepFace.extract_faces(), each containing:
           face, facial_area, confidence, is_real, antispoof_score
         """
+        if (not cascade or not self._cascade.enabled) and (settings is None or settings.is_default):
+            return self._extract_faces(img_bgr, anti_spoofing)
+
+        ox, oy = 0, 0
+        scale = 1.0
+        region = img_bgr
+        if settings is not None:
+            scale = settings.scale
+            if settings.roi is not None:
+                ox, oy, x2, y2 = settings.roi_pixels(img_bgr.shape)
+                region = img_bgr[oy:y2, ox:x2]
+
+        passes = None
+        if cascade and self._cascade.enabled:
+            passes = self._cascade.plan(region)
+        if passes is None:
+            passes = [(0, 0, region.shape[1], region.shape[0])]
+
+        faces: List[dict] = []
+        for x1, y1, x2, y2 in passes:
+            for face in self._extract_faces_scaled(region[y1:y2, x1:x2], scale, anti_spoofing=False):
+                faces.append(_offset_face(face, ox + x1, oy + y1))
+        if anti_spoofing is None or anti_spoofing:
+            self.check_liveness(img_bgr, faces, list(range(len(faces))))
+        return faces
+
+    def _extract_faces_scaled(
+        self, img_bgr: np.ndarray, scale: float, anti_spoofing: Optional[bool] = None,
+    ) -> List[dict]:
+        """
+        Run the detector on *img_bgr* resized by *scale*; map boxes back and
+        re-cut each aligned face from the full-resolution *img_bgr*.
+        """
+        h, w = img_bgr.shape[:2]
+        if scale >= 1.0 or min(h, w) * scale < 32:
+            return self._extract_faces(img_bgr, anti_spoofing)
+        small = cv2.resize(
+            img_bgr, (max(1, int(w * scale)), max(1, int(h * scale))),
+            interpolation=cv2.INTER_AREA,
+        )
+        faces = self._extract_faces(small, anti_spoofing)
+        for face in faces:
+            _scale_face(face, 1.0 / scale)
+            face["face"] = _aligned_crop(img_bgr, face["facial_area"])
+        return faces
+
+    def _extract_faces(self, img_bgr: np.ndarray, anti_spoofing: Optional[bool] = None) -> List[dict]:
+        """One DeepFace.extract_faces pass over *img_bgr*."""
+        if anti_spoofing is None:
+            anti_spoofing = self.anti_spoofing_enabled
         try:
             results = DeepFace.extract_faces(
                 img_path=img_bgr,
                 detector_backend=self.detector_backend,
                 enforce_detection=False,
                 align=True,
-                anti_spoofing=self.anti_spoofing_enabled,
+                anti_spoofing=anti_spoofing and self.anti_spoofing_enabled,
                 color_face="bgr",
                 normalize_face=False,
             )
@@ -253,6 +458,75 @@ class RecognitionEngine:
             logger.warning(f"DeepFace embedding extraction error: {e}")
             return None
 
+    def _init_batch_embedder(self) -> None:
+        """
+        Set up the batched embedding path.
+
+        DeepFace.represent() only takes one image per call, so batching goes
+        straight to the underlying Keras model with the same resize /
+        channel order DeepFace uses.  A one-off parity check against
+        _get_embedding() guards against preprocessing drift between DeepFace
+        releases; on any mismatch the engine keeps the per-face path.
+        """
+        try:
+            from deepface.modules import preprocessing as df_preprocessing
+
+            client = DeepFace.build_model(self.model_name)
+            keras_model = getattr(client, "model", None)
+            if keras_model is None or not callable(keras_model):
+                logger.info(f"Batched embedding unavailable for {self.model_name}; using per-face path.")
+                return
+            self._df_resize = df_preprocessing.resize_image
+            self._batch_model = keras_model
+            self._batch_input_size = tuple(client.input_shape)
+
+            probe = np.random.default_rng(0).integers(0, 256, (120, 100, 3), dtype=np.uint8)
+            single = self._get_embedding(probe)
+            batched, rows = self.get_embeddings_batch([probe, probe])
+            if single is None or rows != [0, 1] or not np.allclose(batched, single, atol=1e-3):
+                raise ValueError("batched embeddings differ from DeepFace.represent()")
+        except Exception as exc:
+            self._batch_model = None
+            logger.warning(f"Batched embedding disabled: {exc}")
+
+    def get_embeddings_batch(
+        self, face_crops_bgr: List[np.ndarray],
+    ) -> Tuple[np.ndarray, List[int]]:
+        """
+        Extract embeddings for many BGR uint8 face crops in one forward pass.
+
+        Returns:
+            (embeddings, rows) — an (M, D) L2-normalised float32 matrix and
+            the indices into *face_crops_bgr* each row belongs to.  Crops that
+            are empty or fail to embed are left out.
+        """
+        rows = [i for i, c in enumerate(face_crops_bgr) if c is not None and c.size > 0]
+        if not rows:
+            return np.zeros((0, self._embedding_dim), dtype=np.float32), []
+
+        if self._batch_model is not None and len(rows) > 1:
+            try:
+                h, w = self._batch_input_size
+                batch = np.concatenate([
+                    self._df_resize(img=face_crops_bgr[i][:, :, ::-1], target_size=(w, h))
+                    for i in rows
+                ])
+                embs = np.asarray(self._batch_model(batch, training=False), dtype=np.float32)
+                return l2_normalize(embs), rows
+            except Exception as e:
+                logger.warning(f"Batched embedding failed, falling back to per-face: {e}")
+
+        embs: List[np.ndarray] = []
+        ok_rows: List[int] = []
+        for i in rows:
+            emb = self._get_embedding(face_crops_bgr[i])
+            if emb is not None:
+                embs.append(emb)
+                ok_rows.append(i)
+        if not embs:
+            return np.zeros((0, self._embedding_dim), dtype=np.float32), []
+        return np.stack(embs), ok_rows
+
     @staticmethod
     def _spoof_fields(face_dict: dict) -> Tuple[bool, str, float]:
         """
@@ -353,14 +627,10 @@ class RecognitionEngine:
         Returns a dict matching the /extract-multiple-embeddings API response.
         """
         faces = self._detect_faces(img_bgr)
+        embs, rows = self.get_embeddings_batch([f.get("face") for f in faces])
         face_results = []
-        for i, face in enumerate(faces):
-            face_crop = face.get("face")
-            if face_crop is None or face_crop.size == 0:
-                continue
-            emb = self._get_embedding(face_crop)
-            if emb is None:
-                continue
+        for emb, i in zip(embs, rows):
+            face = faces[i]
             fa = face.get("facial_area", {})
             x1, y1, x2, y2 = self._bbox_from_facial_area(fa)
             face_results.append({
@@ -439,22 +709,79 @@ class RecognitionEngine:
     # Used by /recognize-frame and WebSocket /ws/recognize
     # ------------------------------------------------------------------
 
+    @staticmethod
+    def _session_gallery(session_store: dict) -> SessionGallery:
+        """
+        Return the compiled gallery for the loaded session(s).
+
+        /load-session stores a :class:`SessionGallery` per section; plain
+        ``{studentId: {...}}`` dicts are still accepted and compiled here.
+        """
+        galleries = [
+            g if isinstance(g, SessionGallery) else SessionGallery.from_students(g)
+            for g in session_store.values()
+        ]
+        return SessionGallery.merge(galleries)
+
     def recognize_frame_with_session(
         self,
         img_bgr: np.ndarray,
-        session_store: dict,
+        session_store: SessionStore,
+        tracker: Optional[FaceTracker] = None,
     ) -> dict:
         """
         Detect all faces, run anti-spoof + embedding per face, match
         against session_store (and FAISS fallback).
 
+        With a per-stream *tracker*, faces that continue a track with a
+        confirmed identity skip the embedding stage and reuse that identity,
+        and anti-spoofing only re-runs when the track's liveness is due
+        (see recognition/face_tracker.py).
+
         Returns a dict matching the frontend RecognitionResult interface.
         """
         if img_bgr is None or img_bgr.size == 0:
             return {"detected": False, "faces": [], "num_faces": 0, "processing_time_ms": 0.0}
 
         t0 = time.perf_counter()
-        faces = self._detect_faces(img_bgr)
+        faces = self.detect_session_faces(img_bgr, anti_spoofing=tracker is None)
+        plans = None
+        if tracker is not None:
+            tracker.sync_session(session_store)
+            plans = tracker.plan(faces)
+            self.check_liveness(img_bgr, faces, tracker.liveness_due(plans))
+            tracker.apply_liveness(plans, faces)
+        crops = self.live_face_crops(faces)
+        if tracker is not None:
+            crops = tracker.filter_crops(crops, plans)
+        embeddings, ok_rows = self.get_embeddings_batch(crops)
+        result_faces = self.match_session_faces(faces, embeddings, ok_rows, session_store)
+        if tracker is not None:
+            result_faces = tracker.merge(plans, result_faces)
+
+        proc_ms = (time.perf_counter() - t0) * 1000.0
+        return {
+            "detected": len(result_faces) > 0,
+            "faces": result_faces,
+            "num_faces": len(result_faces),
+            "processing_time_ms": proc_ms,
+        }
+
+    # The three stages below make up recognize_frame_with_session().  They are
+    # public so the WebSocket inference scheduler can run detection per client
+    # and batch the embedding stage across clients.
+
+    def detect_session_faces(self, img_bgr: np.ndarray, anti_spoofing: bool = True) -> List[dict]:
+        """
+        Detect faces and drop weak / tiny detections (kiosk guardrails).
+
+        ``anti_spoofing=False`` leaves liveness to :meth:`check_liveness`.
+        """
+        if img_bgr is None or img_bgr.size == 0:
+            return []
+        faces = self._detect_faces(
+            img_bgr, cascade=True, settings=self.detection_settings, anti_spoofing=anti_spoofing,
+        )
 
         # Filter weak detections to avoid false positives (e.g., background patterns
         # incorrectly detected as faces). These guardrails are especially important
@@ -472,14 +799,75 @@ class RecognitionEngine:
             if w < min_face_size or h < min_face_size:
                 continue
             filtered_faces.append(f)
-        faces = filtered_faces
-        result_faces = []
+        return filtered_faces
+
+    def check_liveness(self, img_bgr: np.ndarray, faces: List[dict], indices: List[int]) -> None:
+        """
+        Run FasNet on ``faces[i]`` for every i in *indices*, setting
+        ``is_real`` / ``antispoof_score`` as DeepFace.extract_faces does.
 
+        The check sees the full frame, so the 2.7× / 4× context crops are
+        never clipped by a detection ROI.  A failed check marks the face as
+        not real with a 0.5 score (no evidence either way).
+        """
+        if not self.anti_spoofing_enabled or self._antispoof_model is None:
+            return
+        for i in indices:
+            face = faces[i]
+            x1, y1, x2, y2 = self._bbox_from_facial_area(face.get("facial_area", {}))
+            try:
+                is_real, score = self._antispoof_model.analyze(
+                    img=img_bgr, facial_area=(x1, y1, x2 - x1, y2 - y1),
+                )
+            except Exception as e:
+                logger.warning(f"Anti-spoofing check failed: {e}")
+                is_real, score = False, 0.5
+            face["is_real"] = bool(is_real)
+            face["antispoof_score"] = float(score)
+
+    def live_face_crops(self, faces: List[dict]) -> List[Optional[np.ndarray]]:
+        """Face crops to embed; spoofed faces map to None so they are skipped."""
+        return [
+            None if self._spoof_fields(face)[0] else face.get("face")
+            for face in faces
+        ]
+
+    def match_session_faces(
+        self,
+        faces: List[dict],
+        embeddings: np.ndarray,
+        ok_rows: List[int],
+        session_store: dict,
+    ) -> List[dict]:
+        """
+        Match embedded faces against the session gallery and build the
+        per-face result dicts.
+
+        Args:
+            faces:        Output of detect_session_faces().
+            embeddings:   (M, D) matrix from get_embeddings_batch().
+            ok_rows:      Index into *faces* for each embedding row.
+        """
+        face_infos = [self._spoof_fields(face) for face in faces]
+        emb_rows: List[Optional[int]] = [None] * len(faces)
+        for row, face_idx in enumerate(ok_rows):
+            emb_rows[face_idx] = row
+
+        # Score every embedding against the session gallery in one
+        # (faces x templates) product, reduced per student; best vs
+        # runner-up margin per face.
+        gallery = self._session_gallery(session_store)
+        best_idx = best_sims = second_sims = None
+        if len(embeddings) > 0 and len(gallery) > 0 and gallery.dim == embeddings.shape[1]:
+            scores = gallery.identity_scores(embeddings, self._index.template_agg)
+            best_idx, best_sims, second_sims = top2_scores(scores)
+
+        result_faces = []
         for idx, face in enumerate(faces):
             fa = face.get("facial_area", {})
             x1, y1, x2, y2 = self._bbox_from_facial_area(fa)
-            det_conf = face.get("confidence", 0.0)
-            spoof_detected, spoof_label, real_confidence = self._spoof_fields(face)
+            spoof_detected, spoof_label, real_confidence = face_infos[idx]
+            row = emb_rows[idx]
 
             matched = False
             student_id = None
@@ -487,60 +875,40 @@ class RecognitionEngine:
             student_number = None
             match_confidence = 0.0
 
-            if not spoof_detected:
-                face_crop = face.get("face")
-                emb = self._get_embedding(face_crop) if (face_crop is not None and face_crop.size > 0) else None
-
-                if emb is not None:
-                    # 1) Session store match (best vs runner-up margin)
-                    a = emb.astype(np.float32)
-                    best_sim = -1.0
-                    second_sim = -1.0
-                    best_sid = None
-                    best_data = None
-
-                    for _sec, students in session_store.items():
-                        for sid, sdata in students.items():
-                            b = sdata["embedding"].astype(np.float32)
-                            na, nb = np.linalg.norm(a), np.linalg.norm(b)
-                            sim = float(np.dot(a / (na + 1e-8), b / (nb + 1e-8)))
-                            if sim > best_sim:
-                                second_sim = best_sim
-                                best_sim = sim
-                                best_sid = sid
-                                best_data = sdata
-                            elif sim > second_sim:
-                                second_sim = sim
-
+            if row is not None:
+                # 1) Session store match (best vs runner-up margin)
+                if best_idx is not None:
+                    best_sim = float(best_sims[row])
+                    second_sim = float(second_sims[row])
                     if (
-                        best_sid is not None
-                        and best_sim >= self.session_sim_threshold
+                        best_sim >= self.session_sim_threshold
                         and (best_sim - second_sim) >= self.min_match_margin
                     ):
+                        col = int(best_idx[row])
                         matched = True
-                        student_id = best_sid
-                        student_name = (best_data or {}).get("name", "Unknown")
-                        student_number = (best_data or {}).get("student_number")
-                        match_confidence = float(best_sim)
-
-                    # 2) Optional global fallback (OFF by default for kiosk)
-                    if (
-                        not matched
-                        and self.session_faiss_fallback
-                        and len(session_store) == 0
-                        and len(self._index) > 0
-                    ):
-                        try:
-                            results = self._index.search(emb, threshold=self.session_sim_threshold, top_k=2)
-                            uid1, sim1 = results[0]
-                            sim2 = results[1][1] if len(results) > 1 else -1.0
-                            if uid1 is not None and (float(sim1) - float(sim2)) >= self.min_match_margin:
-                                matched = True
-                                student_id = uid1
-                                student_name = self._name_cache.get(uid1, "Unknown")
-                                match_confidence = float(sim1)
-                        except Exception:
-                            pass
+                        student_id = gallery.ids[col]
+                        student_name = gallery.meta[col].get("name", "Unknown")
+                        student_number = gallery.meta[col].get("student_number")
+                        match_confidence = best_sim
+
+                # 2) Optional global fallback (OFF by default for kiosk)
+                if (
+                    not matched
+                    and self.session_faiss_fallback
+                    and len(session_store) == 0
+                    and len(self._index) > 0
+                ):
+                    try:
+                        results = self._index.search(embeddings[row], threshold=self.session_sim_threshold, top_k=2)
+                        uid1, sim1 = results[0]
+                        sim2 = results[1][1] if len(results) > 1 else -1.0
+                        if uid1 is not None and (float(sim1) - float(sim2)) >= self.min_match_margin:
+                            matched = True
+                            student_id = uid1
+                            student_name = self._name_cache.get(uid1, "Unknown")
+                            match_confidence = float(sim1)
+                    except Exception:
+                        pass
 
             result_faces.append({
                 "index": idx,
@@ -557,14 +925,7 @@ class RecognitionEngine:
                 "spoofLabel": spoof_label,
                 "realConfidence": real_confidence,
             })
-
-        proc_ms = (time.perf_counter() - t0) * 1000.0
-        return {
-            "detected": len(result_faces) > 0,
-            "faces": result_faces,
-            "num_faces": len(result_faces),
-            "processing_time_ms": proc_ms,
-        }
+        return result_faces
 
     # ------------------------------------------------------------------
     # Registration
@@ -579,27 +940,58 @@ class RecognitionEngine:
         Compute the averaged embedding from a list of BGR images.
         Returns (averaged_embedding, num_valid) or (None, num_valid).
         """
-        valid: List[np.ndarray] = []
-        for img in image_list:
-            faces = self._detect_faces(img)
-            if not faces:
-                continue
-            face = max(
-                faces,
-                key=lambda f: f.get("facial_area", {}).get("w", 0) * f.get("facial_area", {}).get("h", 0),
-            )
-            if face.get("confidence", 0) < 0.5:
-                continue
-            face_crop = face.get("face")
-            if face_crop is None or face_crop.size == 0:
-                continue
-            emb = self._get_embedding(face_crop)
-            if emb is not None:
-                valid.append(emb)
+        embedding, _, num_valid = self.get_registration_templates(image_list, min_images)
+        return embedding, num_valid
+
+    def get_registration_templates(
+        self,
+        image_list: List[np.ndarray],
+        min_images: int = 5,
+    ) -> Tuple[Optional[np.ndarray], Optional[np.ndarray], int]:
+        """
+        Compute the averaged embedding plus up to ``max_templates`` diverse
+        templates (farthest-point sampling) from a list of BGR images.
+
+        Returns (averaged_embedding, templates, num_valid), with None for both
+        arrays when fewer than *min_images* faces were usable.
+        """
+        crops = self.registration_crops(image_list)
+        return self.registration_templates_from_crops(crops, min_images)
+
+    def registration_crops(self, image_list: List[np.ndarray]) -> List[Optional[np.ndarray]]:
+        """
+        Largest confident face crop of every image (None where there is none).
+
+        Runs sequentially on the calling thread; async callers spread the
+        images over the shared inference pool with :meth:`registration_crop`.
+        """
+        return [self.registration_crop(img) for img in image_list]
+
+    def registration_crop(self, img: np.ndarray) -> Optional[np.ndarray]:
+        """Largest confident face crop of one registration image, or None."""
+        faces = self._detect_faces(img)
+        if not faces:
+            return None
+        face = max(
+            faces,
+            key=lambda f: f.get("facial_area", {}).get("w", 0) * f.get("facial_area", {}).get("h", 0),
+        )
+        if face.get("confidence", 0) < 0.5:
+            return None
+        return face.get("face")
 
+    def registration_templates_from_crops(
+        self,
+        crops: List[Optional[np.ndarray]],
+        min_images: int = 5,
+    ) -> Tuple[Optional[np.ndarray], Optional[np.ndarray], int]:
+        """Embedding stage of :meth:`get_registration_templates`."""
+        # All accepted crops go through the model in a single batch.
+        valid, _ = self.get_embeddings_batch(crops)
         if len(valid) < min_images:
-            return None, len(valid)
-        return average_embeddings(valid), len(valid)
+            return None, None, len(valid)
+        templates = select_templates(valid, self.max_templates)
+        return average_embeddings(list(valid)), templates, len(valid)
 
     # ------------------------------------------------------------------
     # Recognition (single frame — used by /api/v1/recognize)
@@ -610,7 +1002,7 @@ class RecognitionEngine:
         frame_bgr: np.ndarray,
     ) -> Optional[RecognitionResult]:
         """Recognize the largest face in a frame against the FAISS index."""
-        faces = self._detect_faces(frame_bgr)
+        faces = self._detect_faces(frame_bgr, cascade=True)
         if not faces:
             return None
 
@@ -618,7 +1010,7 @@ class RecognitionEngine:
             faces,
             key=lambda f: f.get("facial_area", {}).get("w", 0) * f.get("facial_area", {}).get("h", 0),
         )
-        return self._process_face(face)
+        return self._process_faces([face])[0]
 
     def recognize_frame(
         self,
@@ -627,7 +1019,7 @@ class RecognitionEngine:
     ) -> List[RecognitionResult]:
         """Run the full pipeline on a single BGR frame."""
         t0 = time.perf_counter()
-        faces = self._detect_faces(frame_bgr)
+        faces = self._detect_faces(frame_bgr, cascade=True)
         if not faces:
             return []
 
@@ -637,46 +1029,110 @@ class RecognitionEngine:
             reverse=True,
         )[:max_faces]
 
-        results = [self._process_face(f) for f in faces]
+        results = self._process_faces(faces)
         total_ms = (time.perf_counter() - t0) * 1000
         logger.debug(f"recognize_frame: {len(faces)} face(s), {total_ms:.1f} ms total")
         return results
 
-    def _process_face(self, face: dict) -> RecognitionResult:
-        """Process a single detected face through anti-spoof → embed → search."""
-        fa = face.get("facial_area", {})
-        bbox = self._bbox_from_facial_area(fa)
-        spoof_detected, spoof_label, real_confidence = self._spoof_fields(face)
+    def _process_faces(self, faces: List[dict]) -> List[RecognitionResult]:
+        """
+        Process detected faces through anti-spoof → embed → search.
 
-        if spoof_detected:
-            return RecognitionResult(
-                user_id=None, name=None, confidence=0.0,
-                spoof_detected=True, spoof_label=spoof_label,
-                real_confidence=real_confidence, bbox=bbox,
-            )
+        Live faces are embedded in one batched forward pass.
+        """
+        spoof_info = [self._spoof_fields(face) for face in faces]
+        live_crops = [
+            None if spoof_detected else face.get("face")
+            for face, (spoof_detected, _, _) in zip(faces, spoof_info)
+        ]
+        embs, rows = self.get_embeddings_batch(live_crops)
+        emb_by_face = dict(zip(rows, embs))
+
+        results: List[RecognitionResult] = []
+        for i, face in enumerate(faces):
+            fa = face.get("facial_area", {})
+            bbox = self._bbox_from_facial_area(fa)
+            spoof_detected, spoof_label, real_confidence = spoof_info[i]
+
+            if spoof_detected:
+                results.append(RecognitionResult(
+                    user_id=None, name=None, confidence=0.0,
+                    spoof_detected=True, spoof_label=spoof_label,
+                    real_confidence=real_confidence, bbox=bbox,
+                ))
+                continue
 
-        face_crop = face.get("face")
-        if face_crop is None or face_crop.size == 0:
-            return RecognitionResult(
-                user_id=None, name=None, confidence=0.0,
-                spoof_detected=False, spoof_label="real",
-                real_confidence=real_confidence, bbox=bbox,
-            )
+            emb = emb_by_face.get(i)
+            if emb is None or len(self._index) == 0:
+                results.append(RecognitionResult(
+                    user_id=None, name=None, confidence=0.0,
+                    spoof_detected=False, spoof_label="real",
+                    real_confidence=real_confidence, bbox=bbox,
+                ))
+                continue
 
-        emb = self._get_embedding(face_crop)
-        if emb is None or len(self._index) == 0:
-            return RecognitionResult(
-                user_id=None, name=None, confidence=0.0,
+            matches = self._index.search(emb, threshold=self.sim_threshold, top_k=1)
+            best_label, best_sim = matches[0]
+            name = self._name_cache.get(best_label) if best_label else None
+
+            results.append(RecognitionResult(
+                user_id=best_label, name=name, confidence=best_sim,
                 spoof_detected=False, spoof_label="real",
                 real_confidence=real_confidence, bbox=bbox,
-            )
+            ))
+        return results
 
-        matches = self._index.search(emb, threshold=self.sim_threshold, top_k=1)
-        best_label, best_sim = matches[0]
-        name = self._name_cache.get(best_label) if best_label else None
 
-        return RecognitionResult(
-            user_id=best_label, name=name, confidence=best_sim,
-            spoof_detected=False, spoof_label="real",
-            real_confidence=real_confidence, bbox=bbox,
-        )
+# ---------------------------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------------------------
+
+# Landmark points DeepFace may add to ``facial_area``
+_LANDMARK_KEYS = ("left_eye", "right_eye", "nose", "mouth_left", "mouth_right")
+
+
+def _scale_face(face: dict, factor: float) -> dict:
+    """Scale a DeepFace result's box and landmarks by *factor* (in place)."""
+    fa = dict(face.get("facial_area", {}))
+    for key in ("x", "y", "w", "h"):
+        fa[key] = int(round(fa.get(key, 0) * factor))
+    for key in _LANDMARK_KEYS:
+        pt = fa.get(key)
+        if pt is not None:
+            fa[key] = (int(round(pt[0] * factor)), int(round(pt[1] * factor)))
+    face["facial_area"] = fa
+    return face
+
+
+def _aligned_crop(img_bgr: np.ndarray, fa: dict) -> np.ndarray:
+    """
+    Cut the face box from *img_bgr*, rotated upright about its centre using
+    the eye landmarks (the same eye-line rotation DeepFace's ``align=True``
+    applies).  Without landmarks the box is cut as is.
+    """
+    x, y, w, h = (int(fa.get(k, 0)) for k in ("x", "y", "w", "h"))
+    w, h = max(1, w), max(1, h)
+    left, right = fa.get("left_eye"), fa.get("right_eye")
+    if left is None or right is None:
+        ih, iw = img_bgr.shape[:2]
+        return img_bgr[max(0, y):min(ih, y + h), max(0, x):min(iw, x + w)].copy()
+
+    angle = float(np.degrees(np.arctan2(left[1] - right[1], left[0] - right[0])))
+    cx, cy = x + w / 2.0, y + h / 2.0
+    m = cv2.getRotationMatrix2D((cx, cy), angle, 1.0)
+    m[0, 2] += w / 2.0 - cx
+    m[1, 2] += h / 2.0 - cy
+    return cv2.warpAffine(img_bgr, m, (w, h), flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT)
+
+
+def _offset_face(face: dict, dx: int, dy: int) -> dict:
+    """Shift a DeepFace result found in an ROI back to full-frame coordinates."""
+    fa = dict(face.get("facial_area", {}))
+    fa["x"] = fa.get("x", 0) + dx
+    fa["y"] = fa.get("y", 0) + dy
+    for key in _LANDMARK_KEYS:
+        pt = fa.get(key)
+        if pt is not None:
+            fa[key] = (pt[0] + dx, pt[1] + dy)
+    face["facial_area"] = fa
+    return face
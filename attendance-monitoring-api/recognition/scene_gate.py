@@ -0,0 +1,116 @@
+"""
+scene_gate.py
+-------------
+Scene-change gate for streaming recognition.
+
+A classroom camera spends most of the day looking at the same static
+scene.  Running detection + recognition on it every few frames produces the
+same answer each time, so each stream keeps a SceneGate that compares a tiny
+blurred grey thumbnail of the frame with the one of the last frame that was
+actually processed:
+
+  frame ──► 64×36 grey, blurred ──► pixels that moved vs last processed
+                                          │
+                      ≤ min_area ─► static: reuse the previous results
+                      > min_area ─► changed: run recognition, new reference
+
+A changed-pixel fraction is used rather than the mean difference: a student
+entering at the back of the room covers ~1% of the frame, which would vanish
+in a frame-wide mean.
+
+Comparing against the last *processed* frame (not the previous frame) means
+a slow change — someone walking in gradually — still adds up and triggers a
+pass.  ``max_skip`` forces a pass every N gated frames anyway, so results
+never go stale indefinitely (lighting drift, liveness re-checks).
+
+One gate per stream (WebSocket connection); it is not thread-safe.
+
+Environment variables:
+    SCENE_GATE            Enable the gate for /ws/camera-stream  (default: true)
+    SCENE_DIFF_THRESHOLD  Per-pixel thumbnail diff that counts as change, 0–1 (default: 0.06)
+    SCENE_CHANGE_AREA     Fraction of changed pixels that counts as a scene change (default: 0.002)
+    SCENE_MAX_SKIP        Force a pass after this many skips     (default: 150)
+"""
+
+from __future__ import annotations
+
+import os
+from typing import Optional
+
+import cv2
+import numpy as np
+
+_THUMB_SIZE = (64, 36)
+
+
+def scene_signature(img_bgr: np.ndarray) -> np.ndarray:
+    """Tiny blurred grey thumbnail (float32, 0–1) used for change detection."""
+    grey = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2GRAY) if img_bgr.ndim == 3 else img_bgr
+    thumb = cv2.resize(grey, _THUMB_SIZE, interpolation=cv2.INTER_AREA)
+    # Blur so sensor noise and JPEG artefacts do not count as change
+    thumb = cv2.GaussianBlur(thumb, (3, 3), 0)
+    return thumb.astype(np.float32) / 255.0
+
+
+class SceneGate:
+    """
+    Decides whether a frame differs enough from the last processed one.
+
+    Args:
+        threshold: Per-pixel absolute thumbnail difference (0–1) counted as change.
+        min_area:  Fraction of changed pixels that makes the scene "changed".
+        max_skip:  Report a change after this many consecutive static frames.
+    """
+
+    def __init__(self, threshold: float = 0.06, min_area: float = 0.002, max_skip: int = 150):
+        self.threshold = max(0.0, threshold)
+        self.min_area = max(0.0, min_area)
+        self.max_skip = max(1, max_skip)
+        self._reference: Optional[np.ndarray] = None
+        self._skipped = 0
+
+        self.frames_processed = 0
+        self.frames_reused = 0
+
+    @classmethod
+    def from_env(cls) -> "SceneGate":
+        return cls(
+            threshold=float(os.getenv("SCENE_DIFF_THRESHOLD", "0.06")),
+            min_area=float(os.getenv("SCENE_CHANGE_AREA", "0.002")),
+            max_skip=int(os.getenv("SCENE_MAX_SKIP", "150")),
+        )
+
+    def changed(self, signature: np.ndarray) -> bool:
+        """
+        True if the frame with *signature* should be processed.
+
+        Call :meth:`accept` once it has been; otherwise the frame counts as
+        reused.
+        """
+        if self._reference is None or self._reference.shape != signature.shape:
+            return True
+        if self._skipped >= self.max_skip:
+            return True
+        moved = np.abs(signature - self._reference) > self.threshold
+        if float(moved.mean()) > self.min_area:
+            return True
+        self._skipped += 1
+        self.frames_reused += 1
+        return False
+
+    def accept(self, signature: np.ndarray) -> None:
+        """Make *signature* the reference (its frame was processed)."""
+        self._reference = signature
+        self._skipped = 0
+        self.frames_processed += 1
+
+    def reset(self) -> None:
+        """Force the next frame through (e.g. after a mode switch)."""
+        self._reference = None
+        self._skipped = 0
+
+    def __repr__(self) -> str:
+        return (
+            f"SceneGate(threshold={self.threshold}, processed={self.frames_processed}, "
+            f"reused={self.frames_reused})"
+        )
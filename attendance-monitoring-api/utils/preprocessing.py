@@ -153,6 +153,24 @@ def to_antispoof_tensor(image: np.ndarray, device: str = "cpu") -> torch.Tensor:
     return tensor.unsqueeze(0).to(device)
 
 
+_ANTISPOOF_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+_ANTISPOOF_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+
+def to_antispoof_batch(images: List[np.ndarray], device: str = "cpu") -> torch.Tensor:
+    """
+    Resize BGR uint8 crops to :data:`ANTISPOOF_INPUT_SIZE` and stack them
+    into one MiniFASNet batch, normalized like :func:`to_antispoof_tensor`.
+
+    Returns:
+        torch.Tensor of shape (N, 3, H, W), dtype float32.
+    """
+    batch = np.stack([cv2.resize(img, ANTISPOOF_INPUT_SIZE) for img in images])
+    # BGR → RGB and ImageNet normalization on the whole (N, H, W, 3) block
+    batch = (batch[..., ::-1].astype(np.float32) / 255.0 - _ANTISPOOF_MEAN) / _ANTISPOOF_STD
+    return torch.from_numpy(np.ascontiguousarray(batch.transpose(0, 3, 1, 2))).to(device)
+
+
 # ---------------------------------------------------------------------------
 # Augmentation pipelines (albumentations)
 # ---------------------------------------------------------------------------
@@ -8,13 +8,24 @@ Includes:
   - L2 normalisation
   - Cosine similarity (single pair and batch)
   - Nearest-neighbour search helpers (both numpy brute-force and FAISS)
+  - On-disk index snapshots for fast startup
+  - Pre-compiled session galleries with vectorised top-2 matching
+  - Versioned session store (kiosk session changes)
+  - Multi-template identities (template selection + per-identity aggregation)
   - Threshold-based recognition decision
 """
 
 from __future__ import annotations
 
+import json
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
 import numpy as np
-from typing import List, Optional, Tuple
+from loguru import logger
+from typing import Dict, List, Optional, Tuple
 
 # Try to import FAISS; fall back gracefully to numpy brute-force
 try:
@@ -123,36 +134,407 @@ def find_best_match(
     return None, best_sim
 
 
+def top2_similarities(
+    queries: np.ndarray,
+    gallery: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Best and runner-up cosine similarity for every query against a gallery.
+
+    Both inputs must already be L2-normalised float32 matrices, so a single
+    matrix product gives all similarities.  ``np.argpartition`` selects the
+    top-2 columns per row without sorting the whole gallery.
+
+    Args:
+        queries: shape (F, D)
+        gallery: shape (N, D), N >= 1
+
+    Returns:
+        (best_idx, best_sim, second_sim), each of shape (F,).
+        ``second_sim`` is -1.0 when the gallery holds a single entry.
+    """
+    return top2_scores(queries @ gallery.T)
+
+
+def top2_scores(sims: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Best and runner-up column per row of a (F, N) score matrix.
+
+    Same return convention as :func:`top2_similarities`.
+    """
+    rows = np.arange(sims.shape[0])
+    if sims.shape[1] == 1:
+        best_idx = np.zeros(sims.shape[0], dtype=np.intp)
+        return best_idx, sims[:, 0], np.full(sims.shape[0], -1.0, dtype=np.float32)
+
+    top2 = np.argpartition(-sims, 1, axis=1)[:, :2]         # unordered pair
+    pair = sims[rows[:, None], top2]
+    first = np.argmax(pair, axis=1)
+    best_idx = top2[rows, first]
+    best_sim = pair[rows, first]
+    second_sim = pair[rows, 1 - first]
+    return best_idx, best_sim, second_sim
+
+
+# ---------------------------------------------------------------------------
+# Multi-template identities
+# ---------------------------------------------------------------------------
+
+TEMPLATE_AGGREGATIONS = ("max", "soft")
+
+# Temperature of the "soft" aggregate (log-mean-exp over an identity's
+# templates): close to max, but one lucky template counts for less.
+_SOFT_TEMPERATURE = 0.05
+
+
+def select_templates(embeddings: np.ndarray, k: int) -> np.ndarray:
+    """
+    Pick up to *k* diverse templates from one identity's embeddings.
+
+    Farthest-point sampling: start from the embedding closest to the mean,
+    then repeatedly add the one least similar to everything chosen so far.
+    Deterministic, and cheap for the 5–40 images of a registration.
+
+    Args:
+        embeddings: shape (N, D)
+        k:          maximum number of templates
+
+    Returns:
+        (min(k, N), D) L2-normalised float32 matrix.
+    """
+    vecs = l2_normalize(np.asarray(embeddings, dtype=np.float32).reshape(len(embeddings), -1))
+    k = max(1, min(k, len(vecs)))
+    chosen = [int(np.argmax(vecs @ l2_normalize(vecs.mean(axis=0))))]
+    closest = vecs @ vecs[chosen[0]]                    # max sim to chosen set
+    while len(chosen) < k:
+        nxt = int(np.argmin(closest))
+        chosen.append(nxt)
+        closest = np.maximum(closest, vecs @ vecs[nxt])
+    return vecs[chosen].astype(np.float32)
+
+
+def aggregate_template_scores(
+    sims: np.ndarray,
+    starts: np.ndarray,
+    mode: str = "max",
+) -> np.ndarray:
+    """
+    Reduce per-template scores to per-identity scores.
+
+    Args:
+        sims:   shape (F, R) — scores against R template rows, with each
+                identity's templates in one contiguous run.
+        starts: shape (S,) — first row of each identity's run.
+        mode:   "max", or "soft" (log-mean-exp, see ``_SOFT_TEMPERATURE``).
+
+    Returns:
+        (F, S) scores.
+    """
+    best = np.maximum.reduceat(sims, starts, axis=1)
+    if mode != "soft":
+        return best
+    counts = np.diff(np.append(starts, sims.shape[1]))
+    shifted = np.exp((sims - np.repeat(best, counts, axis=1)) / _SOFT_TEMPERATURE)
+    mean = np.add.reduceat(shifted, starts, axis=1) / counts
+    return best + _SOFT_TEMPERATURE * np.log(mean)
+
+
+# ---------------------------------------------------------------------------
+# Session gallery (kiosk class sessions)
+# ---------------------------------------------------------------------------
+
+class SessionGallery:
+    """
+    One class section compiled into a contiguous, L2-normalised float32
+    matrix plus a side table of student ids and display fields.
+
+    A student may contribute several template rows; their rows are
+    contiguous and ``starts[i]`` is the first row of student ``i``.
+
+    Built once when a session is loaded so per-frame matching is a single
+    matrix product instead of a Python loop over students.
+    """
+
+    def __init__(
+        self,
+        ids: List[str],
+        meta: List[dict],
+        matrix: np.ndarray,
+        starts: Optional[np.ndarray] = None,
+    ):
+        self.ids = ids
+        self.meta = meta            # [{"name", "student_number"}] aligned with ids
+        self.matrix = matrix        # (R, D) float32, C-contiguous, unit rows
+        self.starts = (             # (len(ids),) first template row per student
+            np.arange(len(ids), dtype=np.intp) if starts is None
+            else np.asarray(starts, dtype=np.intp)
+        )
+
+    @classmethod
+    def from_students(cls, students: Dict[str, dict]) -> "SessionGallery":
+        """
+        Compile ``{student_id: {"name", "student_number", "embedding"}}``.
+
+        A ``"templates"`` entry (shape (K, D)) is used instead of
+        ``"embedding"`` when present.  Entries whose embedding dimension
+        differs from the first student's are skipped, since they cannot share
+        a matrix.
+        """
+        ids: List[str] = []
+        meta: List[dict] = []
+        blocks: List[np.ndarray] = []
+        starts: List[int] = []
+        rows = 0
+        dim: Optional[int] = None
+        for sid, sdata in students.items():
+            templates = sdata.get("templates")
+            if templates is None or len(templates) == 0:
+                templates = [sdata["embedding"]]
+            block = np.asarray(templates, dtype=np.float32)
+            block = block.reshape(len(block), -1)
+            if dim is None:
+                dim = block.shape[1]
+            elif block.shape[1] != dim:
+                continue
+            ids.append(sid)
+            meta.append({
+                "name": sdata.get("name", ""),
+                "student_number": sdata.get("student_number"),
+            })
+            starts.append(rows)
+            blocks.append(block)
+            rows += len(block)
+
+        if blocks:
+            matrix = np.ascontiguousarray(l2_normalize(np.concatenate(blocks)), dtype=np.float32)
+        else:
+            matrix = np.zeros((0, dim or 0), dtype=np.float32)
+        return cls(ids, meta, matrix, np.asarray(starts, dtype=np.intp))
+
+    @classmethod
+    def merge(cls, galleries: List["SessionGallery"]) -> "SessionGallery":
+        """Concatenate several compiled galleries into one."""
+        galleries = [g for g in galleries if len(g) > 0]
+        if len(galleries) == 1:
+            return galleries[0]
+        if not galleries:
+            return cls([], [], np.zeros((0, 0), dtype=np.float32))
+        ids = [sid for g in galleries for sid in g.ids]
+        meta = [m for g in galleries for m in g.meta]
+        offsets = np.cumsum([0] + [len(g.matrix) for g in galleries[:-1]])
+        starts = np.concatenate([g.starts + off for g, off in zip(galleries, offsets)])
+        matrix = np.ascontiguousarray(np.concatenate([g.matrix for g in galleries]))
+        return cls(ids, meta, matrix, starts)
+
+    def identity_scores(self, queries: np.ndarray, mode: str = "max") -> np.ndarray:
+        """(F, len(self)) per-student scores for L2-normalised *queries*."""
+        sims = queries @ self.matrix.T
+        if len(self.matrix) == len(self.ids):
+            return sims                         # one template per student
+        return aggregate_template_scores(sims, self.starts, mode)
+
+    @property
+    def dim(self) -> int:
+        return self.matrix.shape[1]
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __repr__(self) -> str:
+        return f"SessionGallery(n={len(self)}, templates={len(self.matrix)}, dim={self.dim})"
+
+
+class SessionStore(dict):
+    """
+    ``sectionId → SessionGallery`` for the loaded kiosk session(s).
+
+    ``version`` is bumped by /load-session and /clear-session.  Per-stream
+    caches (face tracker, scene gate) compare it to notice a new session;
+    object ids are not safe for that, as a freed gallery's id can be reused.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.version = 0
+
+
 # ---------------------------------------------------------------------------
 # FAISS-accelerated search (optional)
 # ---------------------------------------------------------------------------
 
 class FaissIndex:
     """
-    Thin wrapper around a flat L2 FAISS index for fast nearest-neighbour
-    search over face embeddings.
-
-    Falls back to numpy brute-force if FAISS is unavailable.
+    Thin wrapper around a flat inner-product FAISS index for fast
+    nearest-neighbour search over face embeddings.
+
+    A label may own several vectors (templates); searches rank labels, not
+    vectors.  Every vector gets an internal int64 id.  With FAISS the flat index is
+    wrapped in an ``IndexIDMap2``, so removing a user is ``remove_ids`` on
+    their ids instead of a full rebuild.
+
+    Approximate search (FAISS only)
+    -------------------------------
+    For campus-scale galleries an ANN index can sit in front of the flat
+    one.  ``index_type`` selects it:
+
+      flat    exact scan only
+      ivf     IVF-Flat (inverted lists, native remove_ids)
+      hnsw    HNSW graph (removals are tombstoned, graph rebuilt later)
+      ivfpq   IVF with product-quantised vectors (smallest memory)
+      auto    flat below ``ann_min_size`` vectors, ivf above
+
+    The flat index stays the source of truth: the ANN index is (re)trained
+    from it, only proposes candidates, and candidates are re-scored exactly
+    against the flat vectors.  Similarities therefore stay true cosines and
+    the best / runner-up margin checks behave as with the flat index.  Every
+    ``recall_sample_every``-th query is also run on the flat index to track
+    top-1 recall (see :meth:`stats`).
+
+    Searches run on inference worker threads while adds and removes run on
+    the event loop, and FAISS indexes must not be searched while they are
+    modified.  Searches therefore share a read lock and mutations take it
+    exclusively.  The ANN index is never trained inside ``search()``:
+    ``add_batch`` / ``remove`` / ``load`` start a background retrain when it
+    is missing or stale (queries use the flat scan meanwhile); training runs
+    outside the lock and the new index is swapped in under the write lock.
+
+    Falls back to numpy brute-force if FAISS is unavailable.  The numpy
+    backend keeps a preallocated, L2-normalised float32 matrix that grows by
+    doubling and is updated in place: removal moves the last row into the
+    freed slot, and search is one mat-vec product plus ``argpartition``.
     """
 
-    def __init__(self, embedding_dim: int = 512):
+    _INITIAL_CAPACITY = 64
+    INDEX_TYPES = ("auto", "flat", "ivf", "hnsw", "ivfpq")
+
+    def __init__(
+        self,
+        embedding_dim: int = 512,
+        index_type: str = "flat",
+        ann_min_size: int = 5000,
+        nprobe: int = 16,
+        hnsw_ef_search: int = 64,
+        recall_sample_every: int = 50,
+        template_agg: str = "max",
+    ):
         self.dim = embedding_dim
-        self._labels: List[str] = []
-        self._embeddings: List[np.ndarray] = []
+        index_type = index_type.lower()
+        if index_type not in self.INDEX_TYPES:
+            raise ValueError(f"index_type must be one of {self.INDEX_TYPES}, got {index_type!r}")
+        self.index_type = index_type
+        self.ann_min_size = max(1, ann_min_size)
+        self.nprobe = max(1, nprobe)
+        self.hnsw_ef_search = max(1, hnsw_ef_search)
+        self.recall_sample_every = max(0, recall_sample_every)
+        if template_agg not in TEMPLATE_AGGREGATIONS:
+            raise ValueError(f"template_agg must be one of {TEMPLATE_AGGREGATIONS}")
+        self.template_agg = template_agg
+        # Searches hold it shared; mutation and the ANN swap exclusively
+        self._lock = _ReadWriteLock()
+        # One ANN training at a time (held while training, without _lock)
+        self._build_lock = threading.Lock()
+        self._build_flag_lock = threading.Lock()
+        self._ann_building = False
+        self._reset()
+
+    @classmethod
+    def from_env(cls, embedding_dim: int = 512) -> "FaissIndex":
+        return cls(
+            embedding_dim=embedding_dim,
+            index_type=os.getenv("INDEX_TYPE", "auto"),
+            ann_min_size=int(os.getenv("INDEX_ANN_MIN_SIZE", "5000")),
+            nprobe=int(os.getenv("INDEX_NPROBE", "16")),
+            hnsw_ef_search=int(os.getenv("INDEX_HNSW_EF_SEARCH", "64")),
+            recall_sample_every=int(os.getenv("INDEX_RECALL_SAMPLE_EVERY", "50")),
+            template_agg=os.getenv("TEMPLATE_AGG", "max").lower(),
+        )
+
+    def _reset(self) -> None:
+        self._next_id = 0
+        self._id_to_label: Dict[int, str] = {}
+        self._label_ids: Dict[str, List[int]] = {}
+        self._max_templates = 1         # most vectors held by one label
+
+        # numpy backend: rows [0, _size) of _matrix are live; _row_ids holds
+        # the id of each row and _id_row the reverse mapping.
+        self._matrix = np.zeros((0, self.dim), dtype=np.float32)
+        self._row_ids = np.zeros(0, dtype=np.int64)
+        self._id_row: Dict[int, int] = {}
+        self._size = 0
 
         if _FAISS_AVAILABLE:
             # Inner-product index on L2-normalised vectors == cosine similarity
-            self._index = faiss.IndexFlatIP(embedding_dim)
+            self._index = faiss.IndexIDMap2(faiss.IndexFlatIP(self.dim))
         else:
             self._index = None
 
+        # Optional ANN accelerator in front of the flat index
+        self._ann = None
+        self._ann_kind = "flat"
+        self._ann_trained_size = 0
+        self._ann_tombstones: set = set()
+        self._queries = 0
+        self._recall_samples = 0
+        self._recall_hits = 0
+
     def add(self, label: str, embedding: np.ndarray) -> None:
         """Add a normalised embedding and its label to the index."""
-        vec = l2_normalize(embedding.flatten()).astype(np.float32)
-        self._labels.append(label)
-        self._embeddings.append(vec)
+        self.add_batch([label], embedding.reshape(1, -1))
+
+    def add_batch(self, labels: List[str], matrix: np.ndarray) -> None:
+        """
+        Add many embeddings in one call.
+
+        Args:
+            labels: N identity labels (may repeat for multi-image users).
+            matrix: shape (N, D); rows are L2-normalised here.
+        """
+        if len(labels) == 0:
+            return
+        matrix = np.asarray(matrix, dtype=np.float32).reshape(len(labels), -1)
+        if matrix.shape[1] != self.dim:
+            raise ValueError(f"Expected {self.dim}-D embeddings, got {matrix.shape[1]}")
+        vecs = np.ascontiguousarray(l2_normalize(matrix), dtype=np.float32)
+        with self._lock.write():
+            self._add_locked(labels, vecs)
+        self._schedule_ann_build()
+
+    def _add_locked(self, labels: List[str], vecs: np.ndarray) -> None:
+        ids = np.arange(self._next_id, self._next_id + len(labels), dtype=np.int64)
+        self._next_id += len(labels)
+
+        for vid, label in zip(ids.tolist(), labels):
+            self._id_to_label[vid] = label
+            label_ids = self._label_ids.setdefault(label, [])
+            label_ids.append(vid)
+            self._max_templates = max(self._max_templates, len(label_ids))
+
         if self._index is not None:
-            self._index.add(vec.reshape(1, -1))
+            self._index.add_with_ids(vecs, ids)
+            if self._ann is not None:
+                if len(self) > 4 * self._ann_trained_size:
+                    self._ann = None            # outgrew its training; retrain
+                else:
+                    self._ann.add_with_ids(vecs, ids)
+        else:
+            start, end = self._size, self._size + len(ids)
+            self._reserve(end)
+            self._matrix[start:end] = vecs
+            self._row_ids[start:end] = ids
+            self._id_row.update(zip(ids.tolist(), range(start, end)))
+            self._size = end
+
+    def _reserve(self, rows: int) -> None:
+        """Grow the numpy gallery (by doubling) to hold at least *rows* rows."""
+        capacity = self._matrix.shape[0]
+        if rows <= capacity:
+            return
+        new_cap = max(rows, 2 * capacity, self._INITIAL_CAPACITY)
+        matrix = np.zeros((new_cap, self.dim), dtype=np.float32)
+        row_ids = np.zeros(new_cap, dtype=np.int64)
+        matrix[:self._size] = self._matrix[:self._size]
+        row_ids[:self._size] = self._row_ids[:self._size]
+        self._matrix, self._row_ids = matrix, row_ids
 
     def search(
         self,
@@ -163,64 +545,436 @@ class FaissIndex:
         """
         Search for the *top_k* nearest identities.
 
+        An identity with several templates is scored by its best template
+        (``template_agg="max"``) or a soft aggregate of all of them
+        (``"soft"``), so a label never appears twice in the results.
+
         Returns:
             List of (label, similarity) tuples, sorted descending by similarity.
             Labels are None if similarity < threshold.
         """
-        if not self._labels:
+        if not self._id_to_label:
             return [(None, 0.0)]
 
         q_vec = l2_normalize(query.flatten()).astype(np.float32).reshape(1, -1)
-
+        top_k = max(1, top_k)
+
+        with self._lock.read():
+            if not self._id_to_label:
+                return [(None, 0.0)]
+            # The top_k best identities always appear among the
+            # top_k * max_templates best vectors.
+            hits = self._vector_hits(q_vec, min(top_k * self._max_templates, len(self)))
+            scores: Dict[str, float] = {}
+            for vid, sim in hits:
+                scores.setdefault(self._id_to_label[vid], sim)
+            if self.template_agg == "soft" and self._max_templates > 1:
+                scores = self._soft_scores(q_vec, list(scores))
+
+        ranked = sorted(scores.items(), key=lambda kv: -kv[1])[:top_k]
+        results = [(label if sim >= threshold else None, sim) for label, sim in ranked]
+        return results if results else [(None, 0.0)]
+
+    def _vector_hits(self, q_vec: np.ndarray, k: int) -> List[Tuple[int, float]]:
+        """The *k* most similar vectors as [(id, sim)], best first."""
         if self._index is not None:
-            k = min(top_k, len(self._labels))
+            if self._wanted_ann_kind() != "flat":
+                ann_hits = self._search_ann(q_vec, k)
+                if ann_hits is not None:
+                    return ann_hits
             distances, indices = self._index.search(q_vec, k)
-            results = []
-            for dist, idx in zip(distances[0], indices[0]):
-                if idx == -1:
-                    continue
-                sim = float(dist)
-                label = self._labels[idx] if sim >= threshold else None
-                results.append((label, sim))
-            return results if results else [(None, 0.0)]
-
-        # Numpy fallback
-        gallery = np.stack(self._embeddings).astype(np.float32)
-        sims = batch_cosine_similarity(query, gallery)
-        top_indices = np.argsort(sims)[::-1][:top_k]
-        results = []
-        for idx in top_indices:
-            sim = float(sims[idx])
-            label = self._labels[idx] if sim >= threshold else None
-            results.append((label, sim))
-        return results
+            return [(int(vid), float(dist))
+                    for dist, vid in zip(distances[0], indices[0]) if vid != -1]
+
+        # Numpy fallback: gallery rows are already normalised
+        sims = self._matrix[:self._size] @ q_vec[0]
+        if k < self._size:
+            top_indices = np.argpartition(-sims, k - 1)[:k]
+            top_indices = top_indices[np.argsort(-sims[top_indices])]
+        else:
+            top_indices = np.argsort(-sims)
+        return [(int(self._row_ids[i]), float(sims[i])) for i in top_indices]
+
+    def _soft_scores(self, q_vec: np.ndarray, labels: List[str]) -> Dict[str, float]:
+        """Soft per-identity scores over all templates of *labels*."""
+        ids = [vid for label in labels for vid in self._label_ids[label]]
+        if self._index is not None:
+            vecs = np.stack([self._index.reconstruct(vid) for vid in ids])
+        else:
+            vecs = self._matrix[[self._id_row[vid] for vid in ids]]
+        starts = np.cumsum([0] + [len(self._label_ids[lb]) for lb in labels[:-1]])
+        agg = aggregate_template_scores((vecs @ q_vec[0])[None, :], starts, "soft")[0]
+        return {label: float(score) for label, score in zip(labels, agg)}
+
+    # ------------------------------------------------------------------
+    # Approximate search
+    # ------------------------------------------------------------------
+
+    def _wanted_ann_kind(self) -> str:
+        if self._index is None or self.index_type == "flat":
+            return "flat"
+        if self.index_type == "auto":
+            return "ivf" if len(self) >= self.ann_min_size else "flat"
+        return self.index_type
+
+    def build_ann(self) -> None:
+        """
+        (Re)train the ANN index from the flat vectors and swap it in.
+
+        Blocking; called at startup after the bulk load, and on a background
+        thread after :meth:`add_batch` / :meth:`remove` / :meth:`load` leave
+        the ANN index missing or stale.  Vectors added or removed while it
+        trains are applied to the new index before the swap.  A no-op for
+        the flat / numpy backends.
+        """
+        self._build_ann(if_missing=False)
+
+    def _build_ann(self, if_missing: bool) -> None:
+        with self._build_lock:
+            with self._lock.read():
+                if if_missing and self._ann is not None:
+                    return                  # another build got there first
+                kind = self._wanted_ann_kind() if len(self) else "flat"
+                if kind != "flat":
+                    matrix, _ = self._rows()
+                    ids = faiss.vector_to_array(self._index.id_map).astype(np.int64)
+            if kind == "flat":
+                with self._lock.write():
+                    self._ann = None
+                    self._ann_tombstones = set()
+                return
+
+            ann, kind = self._train_ann(kind, matrix, ids)
+
+            with self._lock.write():
+                # Catch up with the flat index's changes since the snapshot
+                current = faiss.vector_to_array(self._index.id_map).astype(np.int64)
+                added = np.setdiff1d(current, ids, assume_unique=True)
+                removed = np.setdiff1d(ids, current, assume_unique=True)
+                tombstones: set = set()
+                if len(added):
+                    vecs = np.stack([self._index.reconstruct(int(v)) for v in added])
+                    ann.add_with_ids(vecs, added)
+                if len(removed):
+                    if kind == "hnsw":
+                        tombstones.update(removed.tolist())
+                    else:
+                        ann.remove_ids(removed)
+                self._ann_tombstones = tombstones
+                self._ann = ann
+                self._ann_kind = kind
+                self._ann_trained_size = len(ids)
+
+    def _train_ann(self, kind: str, matrix: np.ndarray, ids: np.ndarray) -> Tuple[object, str]:
+        """Train a new ANN index of *kind* on *matrix*.  Returns (index, kind)."""
+        n = len(ids)
+
+        # ~4·sqrt(n) lists, with enough points per list to train on
+        nlist = int(max(1, min(4 * np.sqrt(n), n // 39)))
+        if kind == "ivfpq" and n < 256 * 39:
+            kind = "ivf"                    # too few vectors to train 8-bit codebooks
+        if kind == "hnsw":
+            base = faiss.IndexHNSWFlat(self.dim, 32, faiss.METRIC_INNER_PRODUCT)
+            base.hnsw.efConstruction = 80
+            base.hnsw.efSearch = self.hnsw_ef_search
+        else:
+            quantizer = faiss.IndexFlatIP(self.dim)
+            if kind == "ivfpq":
+                m = next(m for m in (64, 32, 16, 8, 4, 2, 1) if self.dim % m == 0)
+                base = faiss.IndexIVFPQ(quantizer, self.dim, nlist, m, 8,
+                                        faiss.METRIC_INNER_PRODUCT)
+            else:
+                base = faiss.IndexIVFFlat(quantizer, self.dim, nlist,
+                                          faiss.METRIC_INNER_PRODUCT)
+            base.train(matrix)
+            base.nprobe = min(self.nprobe, nlist)
+
+        # IVF indexes store our ids natively (and remove_ids keeps them
+        # valid); HNSW needs an id map, which is safe as it never removes.
+        ann = faiss.IndexIDMap2(base) if kind == "hnsw" else base
+        ann.add_with_ids(matrix, ids)
+        return ann, kind
+
+    def _schedule_ann_build(self) -> None:
+        """Start a background :meth:`build_ann` if the ANN index is missing."""
+        with self._build_flag_lock:
+            if self._ann is not None or self._ann_building or self._wanted_ann_kind() == "flat":
+                return
+            self._ann_building = True
+        threading.Thread(target=self._ann_build_worker, name="ann-build", daemon=True).start()
+
+    def _ann_build_worker(self) -> None:
+        try:
+            self._build_ann(if_missing=True)
+        except Exception as exc:            # keep serving from the flat index
+            logger.warning(f"ANN index build failed: {exc}")
+        finally:
+            with self._build_flag_lock:
+                self._ann_building = False
+
+    def _search_ann(self, q_vec: np.ndarray, k: int) -> Optional[List[Tuple[int, float]]]:
+        """
+        Candidates from the ANN index, re-scored exactly.  Returns
+        [(id, sim)] best first, or None to fall back to the flat scan.
+        """
+        ann, tombstones = self._ann, self._ann_tombstones
+        if ann is None:
+            self._schedule_ann_build()
+            return None
+
+        n_cand = min(max(4 * k, 16) + len(tombstones), ann.ntotal)
+        if n_cand <= 0:
+            return None
+        _, cand = ann.search(q_vec, n_cand)
+        cand_ids = [int(v) for v in cand[0] if v != -1 and int(v) not in tombstones]
+        if not cand_ids:
+            return None
+        vecs = np.stack([self._index.reconstruct(v) for v in cand_ids])
+        sims = vecs @ q_vec[0]
+        order = np.argsort(-sims)[:k]
+        hits = [(cand_ids[i], float(sims[i])) for i in order]
+
+        self._queries += 1
+        if self.recall_sample_every and self._queries % self.recall_sample_every == 0:
+            _, exact = self._index.search(q_vec, 1)
+            self._recall_samples += 1
+            self._recall_hits += int(hits[0][0] == int(exact[0][0]))
+        return hits
+
+    def stats(self) -> dict:
+        """Index type, size and sampled top-1 recall of the ANN index vs flat."""
+        return {
+            "backend": "faiss" if self._index is not None else "numpy",
+            "index_type": self.index_type,
+            "active": self._ann_kind if self._ann is not None else "flat",
+            "size": len(self),
+            "recall_samples": self._recall_samples,
+            "recall_at_1": (
+                round(self._recall_hits / self._recall_samples, 4)
+                if self._recall_samples else None
+            ),
+        }
 
     def rebuild(self) -> None:
-        """Rebuild FAISS index from stored embeddings (e.g., after deletions)."""
-        if self._index is None:
+        """Shrink the numpy gallery's spare capacity (e.g. after bulk deletions)."""
+        if self._index is not None:
             return
-        self._index.reset()
-        if self._embeddings:
-            matrix = np.stack(self._embeddings).astype(np.float32)
-            self._index.add(matrix)
+        with self._lock.write():
+            capacity = max(self._size, self._INITIAL_CAPACITY)
+            if capacity < self._matrix.shape[0]:
+                self._matrix = self._matrix[:capacity].copy()
+                self._row_ids = self._row_ids[:capacity].copy()
 
     def remove(self, label: str) -> int:
         """Remove all entries for *label*. Returns count removed."""
-        indices_to_remove = [i for i, lb in enumerate(self._labels) if lb == label]
-        if not indices_to_remove:
+        with self._lock.write():
+            removed = self._remove_locked(label)
+        if removed and self._index is not None:
+            self._schedule_ann_build()
+        return removed
+
+    def _remove_locked(self, label: str) -> int:
+        ids = self._label_ids.pop(label, [])
+        if not ids:
             return 0
-        for idx in sorted(indices_to_remove, reverse=True):
-            del self._labels[idx]
-            del self._embeddings[idx]
-        self.rebuild()
-        return len(indices_to_remove)
+        for vid in ids:
+            del self._id_to_label[vid]
+
+        if self._index is not None:
+            id_arr = np.asarray(ids, dtype=np.int64)
+            self._index.remove_ids(id_arr)
+            if self._ann is not None:
+                if self._ann_kind == "hnsw":
+                    # HNSW cannot delete; hide the ids and rebuild once they pile up
+                    self._ann_tombstones.update(ids)
+                    if len(self._ann_tombstones) > 0.1 * max(1, self._ann.ntotal):
+                        self._ann = None
+                else:
+                    self._ann.remove_ids(id_arr)
+            return len(ids)
+
+        for vid in ids:
+            row = self._id_row.pop(vid)
+            last = self._size - 1
+            if row != last:
+                moved = int(self._row_ids[last])
+                self._matrix[row] = self._matrix[last]
+                self._row_ids[row] = moved
+                self._id_row[moved] = row
+            self._size = last
+        return len(ids)
+
+    def _rows(self) -> Tuple[np.ndarray, List[str]]:
+        """Live vectors as an (N, D) matrix plus their labels, in index order."""
+        if self._index is not None:
+            ids = faiss.vector_to_array(self._index.id_map).tolist()
+            n = self._index.ntotal
+            matrix = self._index.index.reconstruct_n(0, n) if n else None
+        else:
+            ids = self._row_ids[:self._size].tolist()
+            matrix = self._matrix[:self._size].copy() if self._size else None
+        if matrix is None:
+            matrix = np.zeros((0, self.dim), dtype=np.float32)
+        return matrix.astype(np.float32, copy=False), [self._id_to_label[v] for v in ids]
+
+    # ------------------------------------------------------------------
+    # Snapshots
+    # ------------------------------------------------------------------
+
+    _SNAPSHOT_META = "meta.json"
+    _SNAPSHOT_LABELS = "labels.json"
+    _SNAPSHOT_MATRIX = "embeddings.npy"
+    _SNAPSHOT_FAISS = "faiss.index"
+
+    def save(self, directory: str, generation: int) -> None:
+        """
+        Write a snapshot of the index to *directory*.
+
+        Layout: ``embeddings.npy`` (normalised float32 matrix, mmap-able),
+        ``labels.json`` (row-aligned), ``faiss.index`` (when FAISS is
+        available) and ``meta.json`` carrying *generation* — the DB
+        generation the snapshot reflects.  ``meta.json`` is written last, so
+        a half-written snapshot is never loaded.
+        """
+        path = Path(directory)
+        path.mkdir(parents=True, exist_ok=True)
+        with self._lock.read():
+            matrix, labels = self._rows()
+
+        # Invalidate the old snapshot before replacing its files
+        meta_file = path / self._SNAPSHOT_META
+        if meta_file.exists():
+            meta_file.unlink()
+
+        _atomic_write(path / self._SNAPSHOT_MATRIX, lambda f: np.save(f, matrix))
+        _atomic_write(
+            path / self._SNAPSHOT_LABELS,
+            lambda f: f.write(json.dumps(labels).encode("utf-8")),
+        )
+        if self._index is not None:
+            tmp = str(path / (self._SNAPSHOT_FAISS + ".tmp"))
+            faiss.write_index(self._index, tmp)
+            os.replace(tmp, path / self._SNAPSHOT_FAISS)
+        meta = {"dim": self.dim, "count": len(labels), "generation": int(generation)}
+        _atomic_write(meta_file, lambda f: f.write(json.dumps(meta).encode("utf-8")))
+
+    def load(self, directory: str) -> Optional[int]:
+        """
+        Replace the index contents with the snapshot in *directory*.
+
+        The embedding matrix is memory-mapped; the FAISS index file is read
+        directly when present instead of re-adding every vector.
+
+        Returns:
+            The snapshot's DB generation, or None if there is no usable
+            snapshot (missing, partial, or built for another dimension).
+        """
+        path = Path(directory)
+        try:
+            meta = json.loads((path / self._SNAPSHOT_META).read_text())
+            if int(meta["dim"]) != self.dim:
+                return None
+            labels = [str(lb) for lb in json.loads((path / self._SNAPSHOT_LABELS).read_text())]
+            matrix = np.load(path / self._SNAPSHOT_MATRIX, mmap_mode="r")
+        except (OSError, ValueError, KeyError):
+            return None
+        count = int(meta["count"])
+        if len(labels) != count or matrix.shape != (count, self.dim):
+            return None
+
+        index = None
+        if _FAISS_AVAILABLE:
+            faiss_file = path / self._SNAPSHOT_FAISS
+            if faiss_file.exists():
+                try:
+                    index = faiss.read_index(str(faiss_file))
+                except RuntimeError:
+                    index = None
+            if (index is None or not isinstance(index, faiss.IndexIDMap2)
+                    or index.ntotal != count or index.d != self.dim):
+                index = None
+
+        with self._lock.write():
+            self._reset()
+            if index is not None:
+                # Keep the ids stored in the index file; labels are row-aligned
+                ids = faiss.vector_to_array(index.id_map).tolist()
+                for vid, label in zip(ids, labels):
+                    self._id_to_label[vid] = label
+                    label_ids = self._label_ids.setdefault(label, [])
+                    label_ids.append(vid)
+                    self._max_templates = max(self._max_templates, len(label_ids))
+                self._next_id = max(ids, default=-1) + 1
+                self._index = index
+            else:
+                vecs = np.ascontiguousarray(l2_normalize(np.asarray(matrix, dtype=np.float32)))
+                self._add_locked(labels, vecs)
+        self._schedule_ann_build()
+        return int(meta["generation"])
+
+    @property
+    def num_identities(self) -> int:
+        return len(self._label_ids)
 
     def __len__(self) -> int:
-        return len(self._labels)
+        return len(self._id_to_label)
 
     def __repr__(self) -> str:
         backend = "FAISS" if self._index is not None else "numpy"
-        return f"FaissIndex(dim={self.dim}, n={len(self)}, backend={backend})"
+        return (
+            f"FaissIndex(dim={self.dim}, n={len(self)}, backend={backend}, "
+            f"type={self.index_type})"
+        )
+
+
+class _ReadWriteLock:
+    """
+    Many readers or one writer (not re-entrant).  Waiting writers block new
+    readers, so a steady stream of searches cannot starve an add / remove.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writer or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if self._readers == 0:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
+def _atomic_write(target: Path, write) -> None:
+    """Write via a temp file + rename so readers never see a partial file."""
+    tmp = target.with_name(target.name + ".tmp")
+    with open(tmp, "wb") as f:
+        write(f)
+    os.replace(tmp, target)
 
 
 # ---------------------------------------------------------------------------
@@ -27,8 +27,10 @@ import numpy as np
 import json
 from typing import List, Optional
 import base64
+import struct
 import time
 import asyncio
+from concurrent.futures import ThreadPoolExecutor
 
 # ============ Environment Config ============
 
@@ -41,6 +43,11 @@ ALLOWED_ORIGINS = [o.strip() for o in _cors_env.split(",") if o.strip()]
 
 RECOG_THRESHOLD = float(os.environ.get("RECOGNITION_THRESHOLD", "0.70"))
 
+# Inference executor: detection/embedding never runs on the event loop.
+# Calls beyond workers + queue depth are shed with 503 instead of piling up.
+INFERENCE_WORKERS = max(1, int(os.environ.get("INFERENCE_WORKERS", "2")))
+INFERENCE_MAX_QUEUE = max(0, int(os.environ.get("INFERENCE_MAX_QUEUE", str(4 * INFERENCE_WORKERS))))
+
 # Suppress TensorFlow warnings
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
 
@@ -114,10 +121,14 @@ app.add_middleware(
 
 # ============ Session Cache ============
 
+EMBEDDING_DIM = 512
+
 _session = {
     "active": False,
     "section_id": None,
     "students": [],
+    # Pre-normalized (N, EMBEDDING_DIM) float32 matrix; row i belongs to students[i]
+    "gallery": np.zeros((0, EMBEDDING_DIM), dtype=np.float32),
 }
 
 
@@ -128,6 +139,71 @@ class VerifyRequest(BaseModel):
     stored_embedding: List[float]
 
 
+# ============ Inference Executor ============
+
+_inference_pool = ThreadPoolExecutor(max_workers=INFERENCE_WORKERS, thread_name_prefix="inference")
+_inference_state = {"in_flight": 0, "rejected": 0}
+
+
+async def run_inference(fn, *args):
+    """
+    Run a blocking detection/embedding call on the inference pool.
+    Raises HTTPException(503) when workers and queue are all taken.
+    """
+    if _inference_state["in_flight"] >= INFERENCE_WORKERS + INFERENCE_MAX_QUEUE:
+        _inference_state["rejected"] += 1
+        raise HTTPException(
+            status_code=503,
+            detail="Recognition server busy, retry shortly",
+            headers={"Retry-After": "1"},
+        )
+    _inference_state["in_flight"] += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_inference_pool, fn, *args)
+    finally:
+        _inference_state["in_flight"] -= 1
+
+
+# ============ Binary WebSocket Protocol ============
+#
+# Same wire format as attendance-monitoring-api/api/ws_protocol.py.
+# Client -> server: 8-byte header + raw JPEG bytes (no base64, no JSON).
+# Server -> client: 8-byte header + result (msgpack if FLAG_MSGPACK, else JSON).
+# Header: version u8 | flags u8 | reserved u16 | frame_id u32 (little-endian)
+
+try:
+    import msgpack  # optional: compact binary results
+    _MSGPACK_AVAILABLE = True
+except ImportError:
+    _MSGPACK_AVAILABLE = False
+
+WS_PROTOCOL_VERSION = 1
+WS_FLAG_MSGPACK = 0x01
+WS_HEADER = struct.Struct("<BBHI")
+
+
+def decode_binary_frame(data: bytes):
+    """Parse a binary frame -> (frame_id, flags, BGR image or None)."""
+    if len(data) < WS_HEADER.size:
+        raise HTTPException(status_code=400, detail=f"Binary frame too short ({len(data)} bytes)")
+    version, flags, _reserved, frame_id = WS_HEADER.unpack_from(data)
+    if version != WS_PROTOCOL_VERSION:
+        raise HTTPException(status_code=400, detail=f"Unsupported protocol version {version}")
+    buf = np.frombuffer(data, dtype=np.uint8, offset=WS_HEADER.size)
+    img = cv2.imdecode(buf, cv2.IMREAD_COLOR) if buf.size else None
+    return frame_id, flags, img
+
+
+def encode_binary_result(result: dict, frame_id: int, requested_flags: int = 0) -> bytes:
+    """Header + msgpack/JSON payload; the reply flags say which encoding was used."""
+    if requested_flags & WS_FLAG_MSGPACK and _MSGPACK_AVAILABLE:
+        flags, payload = WS_FLAG_MSGPACK, msgpack.packb(result, use_bin_type=True)
+    else:
+        flags, payload = 0, json.dumps(result, separators=(",", ":")).encode("utf-8")
+    return WS_HEADER.pack(WS_PROTOCOL_VERSION, flags, 0, frame_id & 0xFFFFFFFF) + payload
+
+
 # ============ Helpers ============
 
 def base64_to_image(base64_str: str) -> np.ndarray:
@@ -178,6 +254,14 @@ def cosine_similarity(a, b):
     return float(np.dot(a, b) / (norm_a * norm_b))
 
 
+def normalize_rows(mat: np.ndarray) -> np.ndarray:
+    """L2-normalize each row of a 2-D float32 matrix (zero rows stay zero)."""
+    mat = np.asarray(mat, dtype=np.float32)
+    norms = np.linalg.norm(mat, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return mat / norms
+
+
 def detect_faces_fast(img_bgr: np.ndarray, scale: float = 0.5):
     """
     Fast multi-face detection using the best available backend.
@@ -227,7 +311,7 @@ def crop_and_embed(img_bgr: np.ndarray, boxes: list):
     """
     Crop detected face regions, resize to 160x160, extract 512D FaceNet embeddings.
     Uses embedder.embeddings() which skips MTCNN (the main bottleneck).
-    Returns list of (box_index, embedding_list) tuples.
+    Returns list of (box_index, embedding) tuples; embeddings are float32 arrays.
     """
     if not boxes:
         return []
@@ -259,68 +343,106 @@ def crop_and_embed(img_bgr: np.ndarray, boxes: list):
 
     arr = np.array(crops)
     embs = _model["embedder"].embeddings(arr)
-    return [(valid_indices[j], embs[j].tolist()) for j in range(len(crops))]
+    embs = np.asarray(embs, dtype=np.float32)
+    return [(valid_indices[j], embs[j]) for j in range(len(crops))]
 
 
-def _match_against_session_impl(emb_pairs: list, boxes: list, threshold: float = 0.70):
+def _match_against_session_impl(emb_pairs: list, boxes: list, threshold: float = 0.70, session: dict = None):
     """
-    Match detected face embeddings against session-cached student embeddings.
-    Uses numpy cosine similarity for fast in-memory matching.
-    Prevents same student being matched to multiple faces.
+    Match detected face embeddings against the session gallery matrix.
+
+    All faces are scored in one (faces x students) matrix multiply against the
+    pre-normalized gallery built by /load-session. Faces are then assigned
+    greedily, highest similarity first, so the same student is never matched
+    to more than one face in a frame.
+
+    *session* defaults to the current ``_session``. /load-session and
+    /clear-session replace that dict rather than mutating it, so gallery and
+    students are always read from one snapshot.
     """
-    results = []
-    matched_ids = set()
+    if session is None:
+        session = _session
+    gallery = session["gallery"]
+    students = session["students"]
 
     # Log session state once per frame
-    if len(emb_pairs) > 0 and len(_session.get("students", [])) == 0:
+    if len(emb_pairs) > 0 and len(students) == 0:
         print(f"⚠️  [match] No students loaded in session! Check /load-session was called.")
 
-    for (face_idx, emb) in emb_pairs:
-        emb_np = np.array(emb, dtype=np.float64)
-        best_sim = -1.0
-        best_student = None
+    if not emb_pairs:
+        return []
+
+    face_indices = [face_idx for (face_idx, _) in emb_pairs]
+    queries = normalize_rows(np.stack([emb for (_, emb) in emb_pairs]))
 
-        for st in _session["students"]:
-            if st["id"] in matched_ids:
-                continue
-            sim = cosine_similarity(emb_np, st["embedding"])
-            if sim > best_sim:
-                best_sim = sim
-                best_student = st
+    if len(students) > 0:
+        sims = queries @ gallery.T                      # (faces, students)
+    else:
+        sims = np.full((len(face_indices), 0), -1.0, dtype=np.float32)
+
+    # Greedy one-to-one assignment: repeatedly take the best remaining
+    # (face, student) pair above threshold, then retire its row and column.
+    assigned = {}
+    work = sims.copy()
+    for _ in range(min(work.shape)):
+        flat = int(np.argmax(work))
+        r, c = divmod(flat, work.shape[1])
+        if work[r, c] < threshold:
+            break
+        assigned[r] = (c, float(work[r, c]))
+        work[r, :] = -np.inf
+        work[:, c] = -np.inf
+
+    # For unmatched faces, report the best similarity among students that
+    # were not claimed by another face.
+    taken = np.zeros(sims.shape[1], dtype=bool)
+    for (c, _) in assigned.values():
+        taken[c] = True
 
+    results = []
+    for r, face_idx in enumerate(face_indices):
         box = boxes[face_idx]
 
-        if best_student and best_sim >= threshold:
-            matched_ids.add(best_student["id"])
-            print(f"  ✅ Face #{face_idx}: MATCHED {best_student['name']} (sim={best_sim:.4f})")
+        if r in assigned:
+            c, best_sim = assigned[r]
+            st = students[c]
+            print(f"  ✅ Face #{face_idx}: MATCHED {st['name']} (sim={best_sim:.4f})")
             results.append({
                 "index": face_idx,
                 "matched": True,
-                "studentId": best_student["id"],
-                "name": best_student["name"],
-                "studentNumber": best_student.get("student_number", ""),
+                "studentId": st["id"],
+                "name": st["name"],
+                "studentNumber": st.get("student_number", ""),
                 "confidence": round(best_sim, 4),
                 "box": box,
             })
+            continue
+
+        row = np.where(taken, -np.inf, sims[r])
+        if row.size and np.isfinite(row).any():
+            c = int(np.argmax(row))
+            best_sim = float(row[c])
+            best_name = students[c]["name"]
         else:
-            best_name = best_student["name"] if best_student else "N/A"
-            print(f"  ❌ Face #{face_idx}: NO MATCH (best={best_name}, sim={best_sim:.4f}, threshold={threshold})")
-            results.append({
-                "index": face_idx,
-                "matched": False,
-                "name": "Unknown",
-                "confidence": round(best_sim, 4) if best_sim > 0 else None,
-                "box": box,
-            })
+            best_sim = -1.0
+            best_name = "N/A"
+        print(f"  ❌ Face #{face_idx}: NO MATCH (best={best_name}, sim={best_sim:.4f}, threshold={threshold})")
+        results.append({
+            "index": face_idx,
+            "matched": False,
+            "name": "Unknown",
+            "confidence": round(best_sim, 4) if best_sim > 0 else None,
+            "box": box,
+        })
 
     return results
 
 
-def match_against_session(emb_pairs: list, boxes: list, threshold: float = None):
+def match_against_session(emb_pairs: list, boxes: list, threshold: float = None, session: dict = None):
     """Wrapper that uses RECOG_THRESHOLD env var as default."""
     if threshold is None:
         threshold = RECOG_THRESHOLD
-    return _match_against_session_impl(emb_pairs, boxes, threshold)
+    return _match_against_session_impl(emb_pairs, boxes, threshold, session)
 
 
 def process_frame(img_bgr: np.ndarray):
@@ -341,7 +463,9 @@ def process_frame(img_bgr: np.ndarray):
             "processing_time_ms": 0,
         }
 
-    if not _session["active"]:
+    # One snapshot for the whole frame; /load-session may swap _session meanwhile
+    session = _session
+    if not session["active"]:
         return {
             "detected": False,
             "faces": [],
@@ -368,7 +492,7 @@ def process_frame(img_bgr: np.ndarray):
             "processing_time_ms": round((time.time() - start) * 1000, 1),
         }
 
-    results = match_against_session(emb_pairs, boxes)
+    results = match_against_session(emb_pairs, boxes, session=session)
 
     processing_time = round((time.time() - start) * 1000, 1)
     matched_count = sum(1 for r in results if r["matched"])
@@ -400,6 +524,7 @@ async def load_session(data: dict):
     print(f"🔄 [load-session] Received {len(students_raw)} students from frontend")
 
     processed = []
+    vectors = []
     for i, s in enumerate(students_raw):
         emb = s.get("embedding")
         if not emb:
@@ -407,19 +532,28 @@ async def load_session(data: dict):
             continue
         if isinstance(emb, dict):
             emb = list(emb.values())
+        if len(emb) != EMBEDDING_DIM:
+            print(f"  ⚠️  Student {i} ({s.get('name', 'Unknown')}): SKIPPED - {len(emb)}D embedding, expected {EMBEDDING_DIM}D")
+            continue
         processed.append({
             "id": s["id"],
             "name": s.get("name", "Unknown"),
             "student_number": s.get("student_number", ""),
-            "embedding": np.array(emb, dtype=np.float64),
         })
+        vectors.append(emb)
         if i < 3:  # Log first 3 for debugging
             print(f"  ✅ Student {i} ({s.get('name')}): embedding loaded ({len(emb)} dimensions)")
 
+    if vectors:
+        gallery = normalize_rows(np.array(vectors, dtype=np.float32))
+    else:
+        gallery = np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+
     _session = {
         "active": True,
         "section_id": section_id,
         "students": processed,
+        "gallery": np.ascontiguousarray(gallery),
     }
 
     print(f"✅ [load-session] Session loaded: {len(processed)}/{len(students_raw)} students for section {section_id}")
@@ -433,7 +567,12 @@ async def load_session(data: dict):
 @app.post("/clear-session")
 async def clear_session():
     global _session
-    _session = {"active": False, "section_id": None, "students": []}
+    _session = {
+        "active": False,
+        "section_id": None,
+        "students": [],
+        "gallery": np.zeros((0, EMBEDDING_DIM), dtype=np.float32),
+    }
     print("Session cleared")
     return {"success": True}
 
@@ -453,7 +592,7 @@ async def recognize_frame(data: dict):
         raise HTTPException(status_code=400, detail="No image provided")
 
     img = base64_to_image(image_b64)
-    return process_frame(img)
+    return await run_inference(process_frame, img)
 
 
 @app.websocket("/ws/recognize")
@@ -462,7 +601,9 @@ async def ws_recognize(websocket: WebSocket):
     WebSocket endpoint for true real-time face recognition.
 
     Client sends: { "image": "<base64 JPEG>" }
+               or a binary frame: 8-byte header + raw JPEG (see "Binary WebSocket Protocol")
     Server responds: { "detected": bool, "faces": [...], "processing_time_ms": float }
+               (binary frames get a binary reply echoing the frame_id)
 
     Natural backpressure: client waits for response before sending next frame.
     """
@@ -472,8 +613,22 @@ async def ws_recognize(websocket: WebSocket):
     try:
         while True:
             try:
-                raw = await websocket.receive_text()
-                data = json.loads(raw)
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    raise WebSocketDisconnect(message.get("code", 1000))
+
+                raw = message.get("bytes")
+                if raw is not None:
+                    frame_id, flags, img = decode_binary_frame(raw)
+                    if img is None:
+                        result = {"detected": False, "faces": [], "num_faces": 0,
+                                  "error": "Invalid image format - could not decode"}
+                    else:
+                        result = await run_inference(process_frame, img)
+                    await websocket.send_bytes(encode_binary_result(result, frame_id, flags))
+                    continue
+
+                data = json.loads(message.get("text") or "{}")
 
                 image_b64 = data.get("image")
                 if not image_b64:
@@ -483,12 +638,14 @@ async def ws_recognize(websocket: WebSocket):
                     continue
 
                 img = base64_to_image(image_b64)
-                result = process_frame(img)
+                result = await run_inference(process_frame, img)
                 await websocket.send_json(result)
                 
+            except WebSocketDisconnect:
+                raise
             except HTTPException as e:
-                # base64_to_image validation error - send error response
-                print(f"Frame validation error: {e.detail}")
+                # base64_to_image validation error or 503 load-shedding - send error response
+                print(f"Frame rejected: {e.detail}")
                 await websocket.send_json({
                     "detected": False, "faces": [], "num_faces": 0, "error": str(e.detail)
                 })
@@ -507,6 +664,11 @@ async def ws_recognize(websocket: WebSocket):
 
 # ============ Legacy Endpoints (backward compatibility) ============
 
+def _session_status() -> dict:
+    session = _session
+    return {"session_active": session["active"], "session_students": len(session["students"])}
+
+
 @app.get("/")
 async def root():
     return {
@@ -514,8 +676,7 @@ async def root():
         "model": "keras-facenet",
         "detector": _model["detector"],
         "ready": _model["ready"],
-        "session_active": _session["active"],
-        "session_students": len(_session["students"]),
+        **_session_status(),
         "status": "running",
     }
 
@@ -529,9 +690,13 @@ async def health_check():
         "ready": _model["ready"],
         "model": "keras-facenet",
         "detector": _model["detector"],
-        "session_active": _session["active"],
-        "session_students": len(_session["students"]),
+        **_session_status(),
         "threshold": RECOG_THRESHOLD,
+        "inference": {
+            "workers": INFERENCE_WORKERS,
+            "max_queue": INFERENCE_MAX_QUEUE,
+            **_inference_state,
+        },
         "error": _model.get("error"),
     }
 
@@ -546,7 +711,7 @@ async def extract_embedding(data: dict):
             raise HTTPException(status_code=400, detail="No image provided")
 
         img = base64_to_image(image_b64)
-        faces = _model["embedder"].extract(img, threshold=0.95)
+        faces = await run_inference(_model["embedder"].extract, img, 0.95)
 
         if not faces or len(faces) == 0:
             return {"detected": False, "error": "No face detected in image"}
@@ -564,6 +729,8 @@ async def extract_embedding(data: dict):
             "box": box.tolist() if hasattr(box, 'tolist') else box,
             "num_faces": len(faces),
         }
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error extracting embedding: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -580,7 +747,7 @@ async def extract_multiple_embeddings(data: dict):
             raise HTTPException(status_code=400, detail="No image provided")
 
         img = base64_to_image(image_b64)
-        faces = _model["embedder"].extract(img, threshold=0.95)
+        faces = await run_inference(_model["embedder"].extract, img, 0.95)
 
         if not faces or len(faces) == 0:
             return {
@@ -614,6 +781,8 @@ async def extract_multiple_embeddings(data: dict):
             "num_faces": len(result_faces),
             "processing_time_ms": round((time.time() - start_time) * 1000, 1),
         }
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error extracting multiple embeddings: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -625,7 +794,7 @@ async def verify_face(request: VerifyRequest):
         raise HTTPException(status_code=503, detail="Model still loading, please retry shortly")
     try:
         img = base64_to_image(request.image)
-        faces = _model["embedder"].extract(img, threshold=0.95)
+        faces = await run_inference(_model["embedder"].extract, img, 0.95)
         if not faces or len(faces) == 0:
             return {"verified": False, "error": "No face detected"}
         captured_embedding = faces[0]["embedding"]
@@ -641,6 +810,8 @@ async def verify_face(request: VerifyRequest):
             "confidence": similarity * 100,
             "face_confidence": float(faces[0]["confidence"]),
         }
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error verifying face: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
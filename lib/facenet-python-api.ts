@@ -14,6 +14,8 @@ const LOCAL_FALLBACK_URL = process.env.NEXT_PUBLIC_LOCAL_API_URL || 'http://loca
 const FORCE_LOCAL_FALLBACK = process.env.NEXT_PUBLIC_ENABLE_LOCAL_API_FALLBACK === 'true'
 const FORCE_PROXY_HTTP = process.env.NEXT_PUBLIC_FORCE_FACENET_PROXY_HTTP === 'true'
 const FACENET_DISABLED = process.env.NEXT_PUBLIC_DISABLE_FACENET === 'true'
+// Send raw JPEG bytes over /ws/recognize instead of base64 JSON (server must support it)
+const WS_BINARY_FRAMES = process.env.NEXT_PUBLIC_WS_BINARY_FRAMES === 'true'
 
 function canUseLocalFallback(): boolean {
   if (FORCE_LOCAL_FALLBACK) return true
@@ -590,6 +592,28 @@ export async function recognizeFrameFromVideo(
 
 // ============ WebSocket Real-Time Recognizer ============
 
+/**
+ * Binary /ws/recognize frame header (see api/ws_protocol.py on the server):
+ * version u8 | flags u8 | reserved u16 | frame_id u32, little-endian.
+ */
+const WS_PROTOCOL_VERSION = 1
+const WS_HEADER_SIZE = 8
+
+function encodeBinaryFrame(jpeg: ArrayBuffer, frameId: number): ArrayBuffer {
+  const out = new Uint8Array(WS_HEADER_SIZE + jpeg.byteLength)
+  const view = new DataView(out.buffer)
+  view.setUint8(0, WS_PROTOCOL_VERSION)
+  view.setUint8(1, 0) // flags: JSON reply
+  view.setUint16(2, 0, true)
+  view.setUint32(4, frameId >>> 0, true)
+  out.set(new Uint8Array(jpeg), WS_HEADER_SIZE)
+  return out.buffer
+}
+
+function decodeBinaryResult(data: ArrayBuffer): RecognitionResult {
+  return JSON.parse(new TextDecoder().decode(new Uint8Array(data, WS_HEADER_SIZE)))
+}
+
 /**
  * WebSocket-based real-time face recognizer.
  *
@@ -614,6 +638,7 @@ export class RealtimeRecognizer {
   private stopped = false
   private videoScaleX = 1
   private videoScaleY = 1
+  private frameId = 0
 
   constructor() {
     this.canvas = document.createElement('canvas')
@@ -643,6 +668,7 @@ export class RealtimeRecognizer {
     
     try {
       this.ws = new WebSocket(wsUrl)
+      this.ws.binaryType = 'arraybuffer'
     } catch (error) {
       console.error('❌ Failed to create WebSocket:', error)
       console.error('   Make sure Python server is running: python facenet-server.py')
@@ -663,7 +689,8 @@ export class RealtimeRecognizer {
     this.ws.onmessage = (event) => {
       this.isProcessing = false
       try {
-        const result: RecognitionResult = JSON.parse(event.data)
+        const result: RecognitionResult =
+          event.data instanceof ArrayBuffer ? decodeBinaryResult(event.data) : JSON.parse(event.data)
         // Scale box coordinates back to video's native resolution
         if (result.faces) {
           for (const face of result.faces) {
@@ -718,17 +745,38 @@ export class RealtimeRecognizer {
     if (!this.isProcessing && this.ctx) {
       this.isProcessing = true
       this.ctx.drawImage(this.videoElement, 0, 0, SEND_WIDTH, SEND_HEIGHT)
-      const base64 = this.canvas.toDataURL('image/jpeg', 0.7)
-      try {
-        this.ws.send(JSON.stringify({ image: base64 }))
-      } catch {
-        this.isProcessing = false
+      if (WS_BINARY_FRAMES) {
+        this.sendBinaryFrame()
+      } else {
+        const base64 = this.canvas.toDataURL('image/jpeg', 0.7)
+        try {
+          this.ws.send(JSON.stringify({ image: base64 }))
+        } catch {
+          this.isProcessing = false
+        }
       }
     }
 
     this.animationId = requestAnimationFrame(this.sendLoop)
   }
 
+  /** Encode the canvas as JPEG bytes and send it as a binary frame (no base64). */
+  private sendBinaryFrame(): void {
+    this.canvas.toBlob(async (blob) => {
+      const ws = this.ws
+      if (!blob || !ws || ws.readyState !== WebSocket.OPEN) {
+        this.isProcessing = false
+        return
+      }
+      try {
+        this.frameId = (this.frameId + 1) >>> 0
+        ws.send(encodeBinaryFrame(await blob.arrayBuffer(), this.frameId))
+      } catch {
+        this.isProcessing = false
+      }
+    }, 'image/jpeg', 0.7)
+  }
+
   /** Stop recognition and close the WebSocket. */
   stop(): void {
     this.stopped = true